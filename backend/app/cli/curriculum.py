@@ -0,0 +1,227 @@
+"""
+Generate a whole curriculum of lessons in bulk.
+
+Reads a JSON Lines or CSV file of lessons (topic, audience and optionally
+subtopics, academic_level and id; see read_curriculum) and generates each
+one with the content, deep research and image services directly, without
+the HTTP API, at a bounded parallelism and upstream request rate.
+
+Finished lessons are appended to lessons.jsonl in the output directory as
+they complete; it doubles as the checkpoint, so running the same command
+again after a crash or Ctrl-C only generates the lessons still missing.
+Lessons that failed are written to failures.jsonl (and retried by the next
+run), and a throughput and cost summary to summary.json.
+
+Usage (from the backend directory):
+    python -m app.cli.curriculum curriculum.jsonl --output-dir out/biology
+    python -m app.cli.curriculum curriculum.csv --output-dir out/biology --concurrency 8 --llm-rpm 120 --research
+    python -m app.cli.curriculum curriculum.csv --output-dir out/biology --images 2 --image-provider gemini --image-rpm 20
+    python -m app.cli.curriculum curriculum.jsonl --output-dir /tmp/dry-run --mock
+"""
+from typing import Any, Dict, List, Set
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger("app.cli.curriculum")
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """
+    Keys of the lessons already in lessons.jsonl.
+
+    A last line cut short by a crash is dropped from the file, so appending
+    continues from the last complete lesson.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        good_until = 0
+        for line in f:
+            try:
+                done.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                break
+            good_until += len(line)
+        if good_until < f.seek(0, os.SEEK_END):
+            logger.warning("Dropping an incomplete last line from %s", path)
+            f.truncate(good_until)
+    return done
+
+
+class JsonlWriter:
+    """Appends one JSON object per line, flushed to disk before returning"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def token_usage(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """Calls and tokens recorded in the token ledger between two of its totals()"""
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for request_type, totals in after.items():
+        for name in usage:
+            usage[name] += totals.get(name, 0) - before.get(request_type, {}).get(name, 0)
+    return usage
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Pass the command-line options on as settings, before the settings are first loaded"""
+    os.environ["LOG_FORMAT"] = "text"
+    os.environ["LOG_LEVEL"] = args.log_level
+    os.environ["PREFETCH_ENABLED"] = "False"  # Speculative prefetches would only compete with the run
+    os.environ["UPSTREAM_LLM_CONCURRENCY"] = str(args.llm_concurrency)
+    os.environ["UPSTREAM_IMAGE_CONCURRENCY"] = str(args.image_concurrency)
+    os.environ["UPSTREAM_LLM_RPM"] = str(args.llm_rpm)
+    os.environ["UPSTREAM_IMAGE_RPM"] = str(args.image_rpm)
+
+
+async def run(args: argparse.Namespace) -> int:
+    from app.core.structured_logging import configure_logging
+    from app.core.token_accounting import get_token_ledger
+    from app.core.upstream_clients import close_upstream_clients
+    from app.services.curriculum_service import CurriculumService, LessonSpec, read_curriculum
+    from app.services.lesson_library import get_lesson_library
+    from config.settings import get_settings, settings_override
+
+    settings = get_settings()
+    configure_logging(settings)
+
+    try:
+        specs = read_curriculum(args.input)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.input}: {e}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    lessons_path = os.path.join(args.output_dir, "lessons.jsonl")
+    done = load_checkpoint(lessons_path)
+
+    pending: List[LessonSpec] = []
+    seen: Set[str] = set()
+    for spec in specs:
+        if spec.key not in done and spec.key not in seen:
+            pending.append(spec)
+            seen.add(spec.key)
+    print(f"{len(specs)} lessons in {args.input}: {len(specs) - len(pending)} already generated (or repeated), "
+          f"{len(pending)} to generate")
+
+    service = CurriculumService(settings)
+    lessons = JsonlWriter(lessons_path)
+    failures = JsonlWriter(os.path.join(args.output_dir, "failures.jsonl"))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    counts = {"generated": 0, "failed": 0, "images": 0}
+    ledger_before = get_token_ledger().totals()
+    started = time.perf_counter()
+
+    async def generate(spec: LessonSpec) -> None:
+        async with semaphore:
+            error = None
+            for attempt in range(1 + args.retries):
+                try:
+                    lesson = await service.generate_lesson(
+                        spec, research=args.research, images=args.images, image_provider=args.image_provider
+                    )
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    degraded = [f for f in lesson["fallbacks"] if not f.endswith(":mock_mode")]
+                    if not degraded or args.accept_fallbacks:
+                        break
+                    error = f"served from fallbacks: {', '.join(degraded)}"
+                logger.warning("Lesson %s failed (attempt %d of %d): %s", spec.key, attempt + 1, 1 + args.retries, error)
+            else:
+                counts["failed"] += 1
+                failures.write({"key": spec.key, "topic": spec.topic, "audience": spec.audience, "error": error})
+                print(f"FAILED  {spec.key}  {spec.topic} ({spec.audience}): {error}")
+                return
+
+            lessons.write(lesson)
+            counts["generated"] += 1
+            counts["images"] += sum(1 for image in lesson["images"] if image["image_url"])
+            finished = counts["generated"] + counts["failed"]
+            print(f"[{finished}/{len(pending)}] {spec.key}  {spec.topic} ({spec.audience})  {lesson['seconds']:.1f}s")
+
+    try:
+        # As a request asking for mock data, so the content is mocked too
+        with settings_override(**({"USE_MOCK_DATA": True} if args.mock else {})):
+            await asyncio.gather(*(generate(spec) for spec in pending))
+    finally:
+        lessons.close()
+        failures.close()
+        await get_lesson_library(settings).stop()
+        await close_upstream_clients()
+
+    elapsed = time.perf_counter() - started
+    tokens = token_usage(ledger_before, get_token_ledger().totals())
+    cost = (
+        tokens["prompt_tokens"] / 1_000_000 * args.price_input
+        + tokens["completion_tokens"] / 1_000_000 * args.price_output
+        + counts["images"] * args.price_image
+    )
+    summary = {
+        "input": args.input,
+        "lessons": len(specs),
+        "skipped": len(specs) - len(pending),
+        "generated": counts["generated"],
+        "failed": counts["failed"],
+        "seconds": round(elapsed, 1),
+        "lessons_per_minute": round(counts["generated"] / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "llm_calls": tokens["calls"],
+        "prompt_tokens": tokens["prompt_tokens"],
+        "completion_tokens": tokens["completion_tokens"],
+        "images": counts["images"],
+        "estimated_cost": round(cost, 4)
+    }
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nGenerated {summary['generated']}, failed {summary['failed']}, skipped {summary['skipped']} "
+          f"in {summary['seconds']}s ({summary['lessons_per_minute']} lessons/min)")
+    print(f"LLM: {tokens['calls']} calls, {tokens['prompt_tokens']} prompt + {tokens['completion_tokens']} completion tokens; "
+          f"images: {counts['images']}; estimated cost: ${summary['estimated_cost']:.4f}")
+    if counts["failed"]:
+        print(f"Failed lessons are listed in {os.path.join(args.output_dir, 'failures.jsonl')}; run again to retry them")
+    return 1 if counts["failed"] else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a curriculum of lessons in bulk, resumably")
+    parser.add_argument("input", help="JSON Lines or CSV file of lessons (topic, audience[, subtopics, academic_level, id])")
+    parser.add_argument("--output-dir", required=True, help="Directory for lessons.jsonl (the checkpoint), failures.jsonl and summary.json")
+    parser.add_argument("--concurrency", type=int, default=4, help="Lessons generated at once")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="Concurrent LLM calls")
+    parser.add_argument("--image-concurrency", type=int, default=4, help="Concurrent image generations")
+    parser.add_argument("--llm-rpm", type=float, default=0, help="LLM requests per minute (0: unlimited)")
+    parser.add_argument("--image-rpm", type=float, default=0, help="Image generations per minute (0: unlimited)")
+    parser.add_argument("--research", action="store_true", help="Also generate deep research per lesson")
+    parser.add_argument("--images", type=int, default=1, help="Images per lesson, for its first image prompts")
+    parser.add_argument("--image-provider", choices=("nvidia", "gemini"), default="nvidia", help="Image generation provider")
+    parser.add_argument("--retries", type=int, default=1, help="Retries of a failed lesson within the run")
+    parser.add_argument("--accept-fallbacks", action="store_true",
+                        help="Keep lessons partly served from fallbacks (e.g. after an upstream error) instead of failing them")
+    parser.add_argument("--mock", action="store_true", help="Use mock data instead of the upstream APIs (a dry run)")
+    parser.add_argument("--price-input", type=float, default=0.0, help="Price per million prompt tokens, for the cost estimate")
+    parser.add_argument("--price-output", type=float, default=0.0, help="Price per million completion tokens, for the cost estimate")
+    parser.add_argument("--price-image", type=float, default=0.0, help="Price per image, for the cost estimate")
+    parser.add_argument("--log-level", default="WARNING", help="Log level")
+    args = parser.parse_args()
+    configure_environment(args)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
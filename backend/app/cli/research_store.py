@@ -0,0 +1,42 @@
+"""
+Purge stored deep research, so that it is generated again on the next request.
+
+Stored research is otherwise reused until it is RESEARCH_STORE_TTL seconds
+old. Use this to drop a bad or outdated generation of a topic right away,
+or to clean up old records; it works on the configured research store
+(RESEARCH_STORE_PATH, or DATA_DIR/research.db) and its outlines.
+
+Usage (from the backend directory):
+    python -m app.cli.research_store --topic "Photosynthesis"
+    python -m app.cli.research_store --older-than 604800
+    python -m app.cli.research_store --expired
+    python -m app.cli.research_store --all
+"""
+from config.settings import get_settings
+from app.services.research_store import get_research_store
+import argparse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Purge stored deep research and outlines")
+    parser.add_argument("--topic", help="Only research and outlines for this topic")
+    parser.add_argument("--older-than", type=float, help="Only research and outlines older than this many seconds")
+    parser.add_argument("--expired", action="store_true", help="Only research and outlines older than RESEARCH_STORE_TTL")
+    parser.add_argument("--all", action="store_true", help="Everything (required when no other filter is given)")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    max_age = args.older_than
+    if args.expired:
+        if settings.RESEARCH_STORE_TTL <= 0:
+            parser.error("RESEARCH_STORE_TTL is 0: stored research never expires")
+        max_age = settings.RESEARCH_STORE_TTL
+    if args.topic is None and max_age is None and not args.all:
+        parser.error("give --topic, --older-than, --expired or --all")
+
+    purged = get_research_store(settings).purge(max_age=max_age, topic=args.topic)
+    print(f"Purged {purged} research records and outlines")
+
+
+if __name__ == "__main__":
+    main()
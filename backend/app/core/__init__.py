@@ -0,0 +1,16 @@
+# Import core modules shared by the API clients and services
+from . import deadlines
+from . import lifecycle
+from . import metrics
+from . import prompt_templates
+from . import request_overrides
+from . import shared_state
+from . import single_flight
+from . import structured_logging
+from . import token_accounting
+from . import tracing
+from . import upstream_activity
+from . import upstream_clients
+from . import upstream_replay
+from . import upstream_scheduler
+from . import warmup
@@ -0,0 +1,221 @@
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Dict, Optional, TypeVar
+import asyncio
+import contextvars
+import logging
+import time
+
+from app.core.metrics import CLIENT_DISCONNECTS, DEADLINES_EXCEEDED
+
+# Absolute time (time.monotonic()) by which the current request must be answered
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+# Header carrying the caller's remaining budget in seconds
+DEADLINE_HEADER = b"x-request-deadline"
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's time budget ran out before an upstream call finished"""
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, or None without a deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """Whether the current deadline has passed"""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def upstream_timeout(limit: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout for one upstream call: the remaining budget, capped at ``limit``.
+
+    Raises:
+        DeadlineExceeded: If the budget is already spent
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        DEADLINES_EXCEEDED.inc()
+        raise DeadlineExceeded("Request deadline exceeded")
+    if left is None:
+        return limit
+    return left if limit is None else min(left, limit)
+
+
+async def with_deadline(awaitable: Awaitable[T], limit: Optional[float] = None) -> T:
+    """
+    Await an upstream call within the remaining budget (and ``limit``, if given).
+
+    Raises:
+        DeadlineExceeded: If the request deadline is reached first
+        asyncio.TimeoutError: If ``limit`` is reached first
+    """
+    try:
+        timeout = upstream_timeout(limit)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        if expired():
+            DEADLINES_EXCEEDED.inc()
+            raise DeadlineExceeded("Request deadline exceeded") from None
+        raise
+
+
+async def iterate_with_deadline(stream: AsyncIterator[T], idle_timeout: Optional[float] = None) -> AsyncIterator[T]:
+    """
+    Iterate a stream, giving up when the deadline passes or no item arrives for ``idle_timeout`` seconds.
+
+    Raises:
+        DeadlineExceeded: If the request deadline is reached mid-stream
+        asyncio.TimeoutError: If the stream stalls for longer than idle_timeout
+    """
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            item = await with_deadline(iterator.__anext__(), idle_timeout)
+        except StopAsyncIteration:
+            return
+        yield item
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Limit the enclosed code to ``seconds`` from now, or to the enclosing deadline if that is sooner.
+
+    ``None`` removes the deadline, for work that outlives the request (e.g. prefetch).
+    """
+    if seconds is None:
+        deadline = None
+    else:
+        deadline = time.monotonic() + seconds
+        outer = _deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def parse_route_budgets(spec: str) -> Dict[str, float]:
+    """
+    Parse per-route budgets such as "/api/content/generate/stream=180,/api/images=60".
+
+    Args:
+        spec: Comma-separated path-prefix=seconds pairs
+
+    Returns:
+        Mapping of path prefix to budget in seconds
+    """
+    budgets = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        prefix, seconds = item.split("=", 1)
+        try:
+            budgets[prefix.strip().rstrip("/") or "/"] = float(seconds)
+        except ValueError:
+            logger.warning("Ignoring bad REQUEST_DEADLINES entry %r", item)
+    return budgets
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each request a time budget and cancelling it on disconnect.
+
+    The budget comes from an ``X-Request-Deadline`` header (seconds, capped
+    at ``max_budget``), else from the longest matching path prefix in
+    ``route_budgets``, else ``default_budget``. Upstream calls made while
+    serving the request are limited to the time that is left, and services
+    answer from caches or fallbacks once it is spent.
+
+    If the client disconnects before the response is complete, the request
+    (including a streaming body and the upstream calls it is waiting on) is
+    cancelled. Work that runs after the response, such as background tasks,
+    is not.
+    """
+
+    def __init__(self, app, default_budget: float, route_budgets: Optional[Dict[str, float]] = None,
+                 max_budget: Optional[float] = None):
+        self.app = app
+        self.default_budget = default_budget
+        self.route_budgets = sorted((route_budgets or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_budget = max_budget
+
+    def budget_for(self, path: str, header: Optional[str]) -> Optional[float]:
+        """Budget in seconds for a request (None or <= 0 for no deadline)"""
+        if header:
+            try:
+                budget = float(header)
+                if budget > 0:
+                    return min(budget, self.max_budget) if self.max_budget else budget
+            except ValueError:
+                pass
+        for prefix, budget in self.route_budgets:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return budget
+        return self.default_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        budget = self.budget_for(scope.get("path", ""), headers.get(DEADLINE_HEADER, b"").decode("latin-1").strip())
+
+        task = asyncio.current_task()
+        messages: asyncio.Queue = asyncio.Queue()
+        state = {"disconnected": False, "response_complete": False}
+
+        async def watch_disconnect():
+            # Owns the server's receive channel, so a disconnect is seen even while the app is not reading
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    state["disconnected"] = True
+                    if not state["response_complete"]:
+                        CLIENT_DISCONNECTS.inc()
+                        task.cancel()
+                    return
+
+        async def receive_wrapper():
+            return await messages.get()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["response_complete"] = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            with deadline_scope(budget if budget and budget > 0 else None):
+                await self.app(scope, receive_wrapper, send_wrapper)
+        except asyncio.CancelledError:
+            if not (state["disconnected"] and not state["response_complete"]):
+                raise
+            # The client is gone, so there is nobody to answer
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            logger.info("Client disconnected, request cancelled", extra={"path": scope.get("path")})
+        finally:
+            watcher.cancel()
@@ -0,0 +1,28 @@
+import sys
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.workers import UvicornWorker
+
+from app.core.lifecycle import DrainingServer
+from config.settings import get_settings
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    """
+    Gunicorn worker running the app on a DrainingServer.
+
+    On SIGTERM (sent by the gunicorn master on shutdown and to the old
+    workers on a HUP reload) the worker reports itself as draining, stops
+    accepting connections and lets in-flight SSE streams finish within
+    SHUTDOWN_GRACE_PERIOD.
+    """
+
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto", "timeout_graceful_shutdown": get_settings().SHUTDOWN_GRACE_PERIOD}
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config, drain_delay=get_settings().SHUTDOWN_DRAIN_DELAY)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -0,0 +1,40 @@
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Optional
+import hashlib
+import json
+
+
+def strong_etag(body: bytes) -> str:
+    """Strong entity tag of a response body: the same bytes always get the same tag"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an entity tag (weak comparison, as RFC 9110 asks for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cacheable_json_response(request: Request, content: Any, max_age: int) -> Response:
+    """
+    JSON response that HTTP caches, reverse proxies and CDNs can keep.
+
+    The body is serialized compactly and deterministically, so its strong
+    ETag only changes with the content; a request whose If-None-Match
+    matches it is answered 304 Not Modified without a body.
+
+    Args:
+        request: The GET request
+        content: Response content (anything FastAPI can encode)
+        max_age: Seconds shared caches may serve the response without revalidating
+    """
+    body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = strong_etag(body)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max(0, max_age)}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,93 @@
+from typing import Optional
+import asyncio
+import logging
+import signal
+import threading
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+class DrainState:
+    """Whether this worker is shutting down and should be taken out of rotation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.draining = False
+        self.started_at: Optional[float] = None
+
+    def begin(self) -> bool:
+        """Mark the worker as draining; False if it already was"""
+        with self._lock:
+            if self.draining:
+                return False
+            self.draining = True
+            self.started_at = time.monotonic()
+            return True
+
+
+_drain_state = DrainState()
+
+
+def get_drain_state() -> DrainState:
+    """Get the drain state of this worker process"""
+    return _drain_state
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    Uvicorn server that drains gracefully on SIGTERM.
+
+    The first SIGTERM (or SIGINT) marks the worker as draining, so the
+    health check starts answering 503 and load balancers stop routing to
+    it. After ``drain_delay`` seconds the server stops accepting
+    connections and waits, up to the configured ``timeout_graceful_shutdown``,
+    for in-flight requests (including SSE streams) to finish; keep-alive
+    connections are closed as their current response completes. Streams
+    still open at the end of the grace period are closed, which cancels
+    their upstream calls. A second signal exits at once.
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = 0.0):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if not _drain_state.begin():
+            # Second signal: stop waiting for in-flight requests
+            self.force_exit = True
+            return
+
+        logger.info("Draining worker", extra={
+            "signal": signal.Signals(sig).name,
+            "in_flight": len(self.server_state.tasks),
+            "drain_delay": self.drain_delay,
+            "grace_period": self.config.timeout_graceful_shutdown
+        })
+        if self.drain_delay > 0:
+            try:
+                asyncio.get_running_loop().call_later(self.drain_delay, self._stop_accepting)
+                return
+            except RuntimeError:
+                pass
+        self._stop_accepting()
+
+    def _stop_accepting(self) -> None:
+        self.should_exit = True
+
+
+def serve(app: str, settings, host: str = "0.0.0.0", port: int = 8000, reload: bool = False) -> None:
+    """
+    Run a single worker with graceful drain.
+
+    Used for local runs; multi-worker deployments run under gunicorn with
+    ``app.core.gunicorn_worker.DrainingUvicornWorker`` (see gunicorn.conf.py).
+    """
+    if reload:
+        # The reloader supervises a child process of its own and restarts it without draining
+        uvicorn.run(app, host=host, port=port, reload=True)
+        return
+    config = uvicorn.Config(app, host=host, port=port, timeout_graceful_shutdown=settings.SHUTDOWN_GRACE_PERIOD)
+    DrainingServer(config, drain_delay=settings.SHUTDOWN_DRAIN_DELAY).run()
@@ -0,0 +1,740 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import bisect
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets (seconds) for HTTP and upstream latencies, from fast cache hits to long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Buckets (seconds) for event-loop lag, where anything above a few ms is a blocked loop
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Buckets for background jobs, which run for up to tens of minutes
+JOB_DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for a named metric with a fixed set of label names"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def _snapshot(self) -> List[list]:
+        """Series as JSON-serializable lists starting with the label values, to merge across processes"""
+        raise NotImplementedError
+
+    def _merge(self, series: List[list]) -> None:
+        """Add the series of another process's snapshot"""
+        raise NotImplementedError
+
+    def _empty(self) -> "_Metric":
+        """A metric with the same name and labels but no series"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Add a non-negative amount to the series identified by the labels"""
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value of one series (0 if never incremented)"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def _snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def _merge(self, series: List[list]) -> None:
+        with self._lock:
+            for key, value in series:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def _empty(self) -> "Counter":
+        return Counter(self.name, self.documentation, self.labelnames)
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down.
+
+    ``multiprocess_mode`` is how the values of several worker processes are
+    merged: "sum" (e.g. requests in progress) or "max" (for values that are
+    the same in every worker).
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ("sum", "max"):
+            raise ValueError(f"Unknown multiprocess_mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def _snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def _merge(self, series: List[list]) -> None:
+        with self._lock:
+            for key, value in series:
+                key = tuple(key)
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = value
+                elif self.multiprocess_mode == "max":
+                    self._values[key] = max(current, value)
+                else:
+                    self._values[key] = current + value
+
+    def _empty(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, self.labelnames, self.multiprocess_mode)
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [count per bucket (last one is +Inf)], sum, count
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation in the series identified by the labels"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the wall-clock duration of the enclosed block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        """Number of observations in one series"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def _snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), [*series[0]], series[1], series[2]] for key, series in self._series.items()]
+
+    def _merge(self, series: List[list]) -> None:
+        with self._lock:
+            for key, counts, total, count in series:
+                if len(counts) != len(self.buckets) + 1:
+                    # Written by a process with other buckets (e.g. before a deploy)
+                    continue
+                key = tuple(key)
+                merged = self._series.get(key)
+                if merged is None:
+                    merged = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+
+    def _empty(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum") -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """Series of every metric by name, JSON-serializable (see MetricsFiles)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric._snapshot() for metric in metrics}
+
+    def render_merged(self, snapshots: Sequence[Dict[str, List[list]]]) -> str:
+        """Render all metrics with the series of several processes' snapshots merged"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        merged = []
+        for metric in metrics:
+            total = metric._empty()
+            for snapshot in snapshots:
+                series = snapshot.get(metric.name)
+                if series:
+                    total._merge(series)
+            merged.append(total)
+        return "\n".join(metric.render() for metric in merged) + "\n"
+
+    def is_gauge(self, name: str) -> bool:
+        with self._lock:
+            return isinstance(self._metrics.get(name), Gauge)
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry"""
+    return _registry
+
+
+# Metric names and label sets below are a stable interface for dashboards and
+# alerts: add new metrics or label values, but do not rename existing ones.
+
+HTTP_REQUEST_DURATION = _registry.histogram(
+    "eduai_http_request_duration_seconds",
+    "Time from receiving an HTTP request until its response (including streamed bodies) is complete",
+    ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_PROGRESS = _registry.gauge(
+    "eduai_http_requests_in_progress",
+    "HTTP requests currently being served",
+    ("method",)
+)
+UPSTREAM_REQUEST_DURATION = _registry.histogram(
+    "eduai_upstream_request_duration_seconds",
+    "Duration of calls to upstream model APIs; outcome is ok, error, timeout or cancelled",
+    ("provider", "model", "operation", "outcome")
+)
+UPSTREAM_TIME_TO_FIRST_TOKEN = _registry.histogram(
+    "eduai_upstream_time_to_first_token_seconds",
+    "Time from sending a streaming request to receiving the first content chunk",
+    ("provider", "model")
+)
+LLM_TOKENS = _registry.counter(
+    "eduai_llm_tokens_total",
+    "LLM tokens by direction (input or output); estimated when the API reports no usage",
+    ("model", "request_type", "direction")
+)
+LLM_TOKENS_SAVED = _registry.counter(
+    "eduai_llm_tokens_saved_total",
+    "Estimated LLM output tokens not generated: streams closed after the client left (reason=cancelled) "
+    "or served to identical concurrent requests from one shared stream (reason=single_flight)",
+    ("model", "request_type", "reason")
+)
+LLM_TRUNCATED = _registry.counter(
+    "eduai_llm_truncated_total",
+    "LLM completions cut off at their output budget (finish_reason \"length\"), including ones retried",
+    ("model", "request_type")
+)
+CACHE_REQUESTS = _registry.counter(
+    "eduai_cache_requests_total",
+    "Cache lookups by cache and result (hit, partial or miss)",
+    ("cache", "result")
+)
+IMAGE_BYTES_WRITTEN = _registry.counter(
+    "eduai_image_bytes_written_total",
+    "Bytes of image files written to the static directory; kind is generated or fallback",
+    ("provider", "kind")
+)
+IMAGES_WRITTEN = _registry.counter(
+    "eduai_images_written_total",
+    "Image files written to the static directory; kind is generated or fallback",
+    ("provider", "kind")
+)
+FALLBACK_RESPONSES = _registry.counter(
+    "eduai_fallback_responses_total",
+    "Responses served from mock data or a fallback instead of the upstream model",
+    ("component", "reason")
+)
+CLIENT_DISCONNECTS = _registry.counter(
+    "eduai_client_disconnects_total",
+    "Requests cancelled because the client disconnected before the response was complete",
+    ()
+)
+DEADLINES_EXCEEDED = _registry.counter(
+    "eduai_deadlines_exceeded_total",
+    "Upstream calls abandoned because the request's time budget ran out",
+    ()
+)
+EVENT_LOOP_LAG = _registry.histogram(
+    "eduai_event_loop_lag_seconds",
+    "Delay of the event loop in waking up a periodic timer",
+    (),
+    buckets=LOOP_LAG_BUCKETS
+)
+UPSTREAM_QUEUE_WAIT = _registry.histogram(
+    "eduai_upstream_queue_wait_seconds",
+    "Time upstream calls waited for a slot of the upstream scheduler, by resource and priority class",
+    ("resource", "priority")
+)
+UPSTREAM_QUEUE_DEPTH = _registry.gauge(
+    "eduai_upstream_queue_depth",
+    "Upstream calls waiting for a slot of the upstream scheduler, by resource and priority class",
+    ("resource", "priority")
+)
+UPSTREAM_PREEMPTIONS = _registry.counter(
+    "eduai_upstream_preemptions_total",
+    "Running upstream calls cancelled to make room for interactive requests",
+    ("resource", "priority")
+)
+JOBS_FINISHED = _registry.counter(
+    "eduai_jobs_total",
+    "Background jobs run to completion, by kind and final status (succeeded, failed or cancelled)",
+    ("kind", "status")
+)
+JOB_DURATION = _registry.histogram(
+    "eduai_job_duration_seconds",
+    "Run time of background jobs, from being picked up by a worker until their final status",
+    ("kind", "status"),
+    buckets=JOB_DURATION_BUCKETS
+)
+LESSON_LIBRARY_WRITES = _registry.counter(
+    "eduai_lesson_library_writes_total",
+    "Lessons handed to the lesson library, by result (added, duplicate, dropped when the queue was full, or failed)",
+    ("result",)
+)
+PROMPT_TEMPLATE_TOKENS = _registry.gauge(
+    "eduai_prompt_template_tokens",
+    "Estimated input tokens of each prompt template outside its placeholders (static), and before its first placeholder (prefix)",
+    ("template", "part"),
+    multiprocess_mode="max"
+)
+
+
+# Fallbacks recorded in the current context, while collect_fallbacks() is active
+_fallbacks: contextvars.ContextVar = contextvars.ContextVar("collected_fallbacks", default=None)
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Count one lookup in a cache ("hit", "similar", "partial" or "miss")"""
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+
+
+def record_fallback(component: str, reason: str) -> None:
+    """Count one response served from mock data or a fallback"""
+    FALLBACK_RESPONSES.inc(component=component, reason=reason)
+    collected = _fallbacks.get()
+    if collected is not None:
+        collected.append((component, reason))
+
+
+@contextmanager
+def collect_fallbacks() -> Iterator[List[Tuple[str, str]]]:
+    """
+    Collect the (component, reason) of fallbacks recorded by the enclosed code and the tasks it starts.
+
+    Collectors nest: on exit, an enclosing collector receives what was collected.
+
+    Example:
+        with collect_fallbacks() as fallbacks:
+            lesson = await service.generate_educational_content(topic, audience)
+        if fallbacks:
+            ...  # (part of) the lesson is mock data
+    """
+    collected: List[Tuple[str, str]] = []
+    parent = _fallbacks.get()
+    token = _fallbacks.set(collected)
+    try:
+        yield collected
+    finally:
+        _fallbacks.reset(token)
+        if parent is not None:
+            parent.extend(collected)
+
+
+def record_image_written(provider: str, kind: str, size: int) -> None:
+    """Count one image file written to disk"""
+    IMAGES_WRITTEN.inc(provider=provider, kind=kind)
+    IMAGE_BYTES_WRITTEN.inc(size, provider=provider, kind=kind)
+
+
+class UpstreamTimer:
+    """
+    Times one upstream call, including time to first token for streams.
+
+    Example:
+        with UpstreamTimer("llm", model, "chat_stream") as timer:
+            async for chunk in stream:
+                timer.first_token()
+                ...
+    """
+
+    def __init__(self, provider: str, model: str, operation: str):
+        self.provider = provider
+        self.model = model
+        self.operation = operation
+        self._started = 0.0
+        self._first_token_seen = False
+
+    def __enter__(self) -> "UpstreamTimer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            outcome = "cancelled"
+        elif issubclass(exc_type, asyncio.TimeoutError):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        UPSTREAM_REQUEST_DURATION.observe(
+            time.perf_counter() - self._started,
+            provider=self.provider, model=self.model, operation=self.operation, outcome=outcome
+        )
+
+    def first_token(self) -> None:
+        """Mark the arrival of a content chunk; only the first call is recorded"""
+        if not self._first_token_seen:
+            self._first_token_seen = True
+            UPSTREAM_TIME_TO_FIRST_TOKEN.observe(
+                time.perf_counter() - self._started, provider=self.provider, model=self.model
+            )
+
+
+class EventLoopLagMonitor:
+    """
+    Measures event-loop lag by scheduling a periodic timer and recording how
+    late it fires. Sustained lag means something is blocking the loop (sync
+    I/O, CPU-heavy parsing) and delays every in-flight request.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+class MetricsFiles:
+    """
+    Metrics of all the worker processes of a host, for a /metrics any of them may answer.
+
+    Each worker writes a snapshot of its registry to its own file in
+    ``directory`` every ``interval`` seconds, when it answers /metrics and
+    when it stops. Rendering merges the snapshots of all workers, so every
+    scrape sees the counters of the whole host, whichever worker it reaches.
+    The files of workers that have exited are kept without their gauges (see
+    mark_process_dead), so counters do not go down when a worker is
+    replaced; a worker that crashes loses what it counted since its last write.
+    """
+
+    def __init__(self, directory: str, registry: Optional[MetricsRegistry] = None, interval: float = 5.0):
+        self.directory = directory
+        self.registry = registry or get_registry()
+        self.interval = interval
+        self._path: Optional[str] = None
+        self._pid: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def path(self) -> str:
+        """This process's file; a new one after a fork"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"worker-{self._pid}-{time.time_ns()}.json")
+        return self._path
+
+    def write(self) -> None:
+        """Write this process's snapshot"""
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(self.path, self.registry.snapshot())
+
+    def render(self) -> str:
+        """Render the metrics of all workers, with this one's up to date"""
+        self.write()
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed or being replaced by its worker
+                continue
+        return self.registry.render_merged(snapshots)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.write)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.warning("Could not write metrics file: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+def _write_json(path: str, data: Any) -> None:
+    """Replace a file atomically, so that readers never see it half-written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def mark_process_dead(directory: str, pid: int, registry: Optional[MetricsRegistry] = None) -> None:
+    """
+    Keep the counters and histograms of an exited worker, but drop its gauges.
+
+    Called by the gunicorn master when a worker exits (see gunicorn.conf.py).
+    """
+    registry = registry or get_registry()
+    prefix = f"worker-{pid}-"
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not (name.startswith(prefix) and name.endswith(".json")):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        snapshot = {metric: series for metric, series in snapshot.items() if not registry.is_gauge(metric)}
+        _write_json(os.path.join(directory, "exited-" + name[len("worker-"):]), snapshot)
+        os.remove(path)
+
+
+def clear_metrics_directory(directory: str) -> None:
+    """Remove the metrics files of an earlier run (called when the gunicorn master starts)"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, name))
+
+
+_metrics_files: Optional[MetricsFiles] = None
+
+
+def get_metrics_files(settings) -> Optional[MetricsFiles]:
+    """Get the metrics files of the worker processes; None unless METRICS_MULTIPROCESS_DIR is set"""
+    global _metrics_files
+    if not settings.METRICS_MULTIPROCESS_DIR:
+        return None
+    if _metrics_files is None:
+        _metrics_files = MetricsFiles(settings.METRICS_MULTIPROCESS_DIR, interval=settings.METRICS_FLUSH_INTERVAL)
+    return _metrics_files
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and in-progress counts per route.
+
+    Routes are labelled by their path template (e.g. /api/lessons/{id}) so
+    label cardinality stays bounded; requests that match no route are
+    labelled "unmatched". Streamed responses are timed until the body is
+    complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # The route is only known once routing ran, so requests in progress are counted per method
+        HTTP_REQUESTS_IN_PROGRESS.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec(method=method)
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=method, route=_route_label(scope), status=str(status["code"])
+            )
+
+
+def _route_label(scope) -> str:
+    """Path template of the route that handled a request"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # Mounted apps (static files) carry no route; label them by mount point
+    root_path = scope.get("root_path") or ""
+    app_root = scope.get("app_root_path") or ""
+    if root_path and root_path != app_root:
+        return root_path[len(app_root):] or root_path
+    return "unmatched"
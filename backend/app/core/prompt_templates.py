@@ -0,0 +1,139 @@
+from app.core.metrics import PROMPT_TEMPLATE_TOKENS
+from app.core.token_accounting import estimate_tokens
+from dataclasses import dataclass
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Tuple
+import hashlib
+import inspect
+import re
+import threading
+
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+
+
+def normalize_prompt_text(text: str) -> str:
+    """
+    Prompt text without the whitespace that only costs input tokens.
+
+    Removes the indentation common to the lines (the first line's own
+    indentation aside, as for docstrings), trailing spaces, leading and
+    trailing blank lines, and collapses runs of blank lines into one.
+    Indentation relative to the other lines, e.g. of nested list items, is kept.
+    """
+    text = _TRAILING_SPACE_RE.sub("", inspect.cleandoc(text))
+    return _BLANK_LINES_RE.sub("\n\n", text)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    A normalized prompt template, compiled once.
+
+    The text is a str.format() template whose placeholders are filled per
+    request. Templates put their instructions first and the placeholders
+    last, so that the start of the prompt is the same for every request
+    and upstream prefix (KV) caches can reuse it.
+    """
+    name: str
+    text: str
+    version: str  # Hash of the text: changes whenever the prompt does
+    fields: Tuple[str, ...]
+    static_tokens: int  # Input tokens of the text outside the placeholders
+    prefix_tokens: int  # Input tokens before the first placeholder, the same for every request
+
+    def render(self, **values: object) -> str:
+        """The prompt for these placeholder values (blank lines left by empty values are collapsed)"""
+        return _BLANK_LINES_RE.sub("\n\n", self.text.format(**values)).strip()
+
+
+def _version(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _record_tokens(template: PromptTemplate) -> None:
+    PROMPT_TEMPLATE_TOKENS.set(template.static_tokens, template=template.name, part="static")
+    PROMPT_TEMPLATE_TOKENS.set(template.prefix_tokens, template=template.name, part="prefix")
+
+
+def compile_template(name: str, text: str) -> PromptTemplate:
+    """Normalize a template text and measure it"""
+    text = normalize_prompt_text(text)
+    literals, fields = [], []
+    for literal, field, _, _ in Formatter().parse(text):
+        literals.append(literal)
+        if field is not None:
+            fields.append(field)
+    # Literal parts with escaped braces unescaped, as they are sent
+    static_text = "".join(literals)
+    prefix = literals[0] if fields else static_text
+    return PromptTemplate(
+        name=name,
+        text=text,
+        version=_version(text),
+        fields=tuple(dict.fromkeys(fields)),
+        static_tokens=estimate_tokens(static_text),
+        prefix_tokens=estimate_tokens(prefix)
+    )
+
+
+_templates: Dict[str, PromptTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def register_template(name: str, text: str) -> PromptTemplate:
+    """
+    Compile a template and add it to the registry.
+
+    Services register their templates at import time, so each is compiled
+    once per process.
+
+    Raises:
+        ValueError: If another template is already registered under the name
+    """
+    template = compile_template(name, text)
+    with _templates_lock:
+        registered = _templates.get(name)
+        if registered is not None and registered.text != template.text:
+            raise ValueError(f"Another prompt template is already registered as {name!r}")
+        _templates[name] = template
+    _record_tokens(template)
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    """
+    A registered template.
+
+    Raises:
+        KeyError: If no template is registered under the name
+    """
+    return _templates[name]
+
+
+def registered_templates() -> List[PromptTemplate]:
+    """All registered templates, by name"""
+    with _templates_lock:
+        return sorted(_templates.values(), key=lambda template: template.name)
+
+
+def templates_version(*templates: PromptTemplate) -> str:
+    """Combined version of the templates a result is generated with, for its cache key"""
+    raw = ",".join(f"{template.name}={template.version}" for template in templates)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+@lru_cache(maxsize=8)
+def system_template(text: str) -> PromptTemplate:
+    """
+    The system message (LLM_SYSTEM_MESSAGE) as a template: normalized and measured once.
+
+    It has no placeholders, so braces in it are sent as they are.
+    """
+    text = normalize_prompt_text(text)
+    tokens = estimate_tokens(text)
+    template = PromptTemplate(name="system", text=text, version=_version(text), fields=(),
+                              static_tokens=tokens, prefix_tokens=tokens)
+    _record_tokens(template)
+    return template
@@ -0,0 +1,66 @@
+from typing import Dict
+import json
+import logging
+
+from config.settings import settings_override, validate_override
+
+# Request headers that override a setting for that request only
+OVERRIDE_HEADERS = {
+    b"x-eduai-mock": "USE_MOCK_DATA",
+    b"x-eduai-model": "LLM_MODEL_ID",
+    b"x-eduai-temperature": "LLM_TEMPERATURE",
+    b"x-eduai-max-tokens": "LLM_MAX_TOKENS",
+    b"x-eduai-image-model": "IMAGE_MODEL_ID",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsOverrideMiddleware:
+    """
+    ASGI middleware applying per-request setting overrides from headers.
+
+    ``X-EduAI-Mock: true`` serves the request from mock data,
+    ``X-EduAI-Model`` / ``X-EduAI-Temperature`` / ``X-EduAI-Max-Tokens``
+    change the LLM call and ``X-EduAI-Image-Model`` the NVIDIA image model,
+    for this request only (see config.settings.settings_override). Requests
+    without these headers pass straight through. An invalid value is
+    answered with 400.
+
+    Only enable it (REQUEST_OVERRIDES_ENABLED) where clients are trusted,
+    e.g. for development, evaluation and benchmarks: it lets them choose
+    the model they are served by.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        raw: Dict[str, str] = {}
+        for name, value in scope.get("headers") or []:
+            setting = OVERRIDE_HEADERS.get(name)
+            if setting is not None:
+                raw[setting] = value.decode("latin-1").strip()
+        if not raw:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            overrides = {name: validate_override(name, value) for name, value in raw.items()}
+        except ValueError as e:
+            body = json.dumps({"detail": str(e)}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        logger.debug("Request settings overridden", extra={"overrides": overrides})
+        with settings_override(**overrides):
+            await self.app(scope, receive, send)
@@ -0,0 +1,228 @@
+from typing import Any, Dict, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# SHARED_STATE_BACKEND values
+SHARED_STATE_BACKENDS = ("memory", "sqlite")
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """
+    Key-value store for state that must be shared by all worker processes.
+
+    Caches and rate limiters that would otherwise be per-process (and so
+    multiplied by the number of workers) keep their state here. Values must
+    be JSON-serializable. ``ttl`` is in seconds; expired keys read as absent.
+
+    The built-in backends are ``MemoryStore`` (one process only, the
+    default for development) and ``SQLiteStore`` (a file shared by the
+    workers of one host). A networked store such as Redis can be plugged in
+    with ``configure_shared_store()`` by implementing the same four methods.
+    """
+
+    # Whether other worker processes see the same state
+    shared = True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically add ``amount`` to a counter and return the new value.
+
+        ``ttl`` only applies when the counter is created, so a counter keyed
+        by time window expires with its window.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStore(SharedStore):
+    """In-process store; state is not shared between workers"""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._writes = 0
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._after_write()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = (0, time.time() + ttl if ttl else None)
+            value = int(entry[0]) + amount
+            self._data[key] = (value, entry[1])
+            self._after_write()
+            return value
+
+    def _after_write(self) -> None:
+        """Drop expired keys now and then, so keys that are never read again do not pile up"""
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            now = time.time()
+            for key in [k for k, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+                del self._data[key]
+
+
+class SQLiteStore(SharedStore):
+    """
+    Store in a SQLite file, shared by the worker processes of one host.
+
+    Each process opens its own connection on first use (also after a fork,
+    so an app preloaded by the master never shares its connection with the
+    workers). WAL mode lets readers proceed while one worker writes.
+    """
+
+    def __init__(self, db_path: str, busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection for this process, opened (and the schema created) on first use"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               isolation_level=None)
+        conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            );
+        """)
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+            self._after_write()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent workers cannot lose updates
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (key, now)
+                ).fetchone()
+                if row is None:
+                    value = amount
+                    conn.execute(
+                        "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), now + ttl if ttl else None)
+                    )
+                else:
+                    value = int(json.loads(row[0])) + amount
+                    conn.execute("UPDATE shared_state SET value = ? WHERE key = ?", (json.dumps(value), key))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._after_write()
+        return value
+
+    def _after_write(self) -> None:
+        """Drop expired keys now and then, so the file does not grow without bound"""
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self._conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def configure_shared_store(store: Optional[SharedStore]) -> None:
+    """Replace the process-wide shared store (None goes back to the configured backend)"""
+    global _store
+    with _store_lock:
+        if _store is not None and _store is not store:
+            _store.close()
+        _store = store
+
+
+def get_shared_store(settings) -> SharedStore:
+    """Get the process-wide shared store for SHARED_STATE_BACKEND"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = settings.SHARED_STATE_BACKEND
+            if backend == "memory":
+                _store = MemoryStore()
+            elif backend == "sqlite":
+                path = settings.SHARED_STATE_PATH or os.path.join(settings.DATA_DIR, "shared_state.db")
+                _store = SQLiteStore(path)
+            else:
+                raise ValueError(f"Unknown SHARED_STATE_BACKEND: {backend}")
+            logger.info("Using shared state backend", extra={"backend": backend})
+        return _store
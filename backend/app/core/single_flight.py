@@ -0,0 +1,137 @@
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+from app.core.metrics import LLM_TOKENS_SAVED
+from app.core.token_accounting import tokens_for_length
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One upstream text stream shared by its subscribers"""
+
+    def __init__(self, key: str, source: AsyncIterator[str], on_done: Callable[["_Flight"], None]):
+        self.key = key
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        # The producer runs in its own task (with the context of the first subscriber), so one
+        # subscriber leaving does not cancel the stream for the others
+        self._task = asyncio.create_task(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(source, "aclose"):
+                await source.aclose()
+            self.done = True
+            self._notify()
+            self._on_done(self)
+
+    def _notify(self) -> None:
+        # Wake everyone waiting for the current event, then start a new one for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self) -> None:
+        """Wait for the next chunk or the end of the stream"""
+        await self._changed.wait()
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+
+class StreamFlights:
+    """
+    Single-flight for upstream text streams.
+
+    Concurrent subscribers with the same key share one upstream stream:
+    the first starts it, later ones receive the chunks generated so far and
+    then follow along live. The upstream stream is cancelled (and its HTTP
+    response closed) as soon as the last subscriber leaves, e.g. because
+    every client disconnected; a finished or failed stream is dropped, so
+    the next request starts a new one.
+
+    Errors in the shared stream (including a spent request deadline, which
+    follows the first subscriber's budget) are raised in every subscriber.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    @property
+    def active(self) -> int:
+        """Number of shared streams in progress"""
+        return len(self._flights)
+
+    def _remove(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def subscribe(self, key: str, start: Callable[[], AsyncIterator[str]],
+                        model: str = "", request_type: str = "default") -> AsyncGenerator[str, None]:
+        """
+        Follow the stream for ``key``, starting it with ``start()`` if none is in progress.
+
+        Args:
+            key: Identity of the request, e.g. a hash of the model parameters and prompt
+            start: Creates the upstream stream
+            model: Model label for the tokens-saved metric
+            request_type: Request type label for the tokens-saved metric
+
+        Yields:
+            Chunks of the shared stream, from its beginning
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(key, start(), self._remove)
+            self._flights[key] = flight
+        flight.subscribers += 1
+        if shared:
+            logger.debug("Joined shared stream", extra={"subscribers": flight.subscribers, "request_type": request_type})
+
+        index = 0
+        delivered_chars = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    delivered_chars += len(chunk)
+                    yield chunk
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more: stop generating
+                self._remove(flight)
+                flight.cancel()
+            if shared and delivered_chars:
+                # Tokens this subscriber received without an upstream call of its own
+                LLM_TOKENS_SAVED.inc(tokens_for_length(delivered_chars), model=model,
+                                     request_type=request_type, reason="single_flight")
+
+
+_flights = StreamFlights()
+
+
+def get_stream_flights() -> StreamFlights:
+    """Get the process-wide single-flight registry for upstream streams"""
+    return _flights
@@ -0,0 +1,175 @@
+from typing import Any, Dict, Optional
+import contextvars
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from app.core.tracing import current_span
+
+# ID of the HTTP request being served, attached to every log record it produces
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else on a record came from ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Record attributes used by this module rather than emitted as fields
+_INTERNAL_FIELDS = {"sampled", "request_id", "trace_id"}
+
+# Pass as ``extra=`` to mark a high-volume event that is subject to LOG_SAMPLE_RATE
+SAMPLED = {"sampled": True}
+
+
+def get_request_id() -> Optional[str]:
+    """ID of the request currently being served, if any"""
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]):
+    """Set the request ID for the current context; returns a token for reset_request_id()"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request ID and trace ID to each record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        span = current_span()
+        record.trace_id = span.trace_id if span is not None else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records.
+
+    Records logged with ``extra=SAMPLED`` (per-chunk, per-part and similar
+    events) are kept with probability ``sample_rate``; all other records
+    are kept.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including ``extra=`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key not in _INTERNAL_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format for local development, with the request ID when there is one"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{text} [request_id={request_id}]" if request_id else text
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """
+    Parse per-module levels such as "app.gemini_api=WARNING,app.services.content_service=DEBUG".
+
+    Args:
+        spec: Comma-separated logger=LEVEL pairs
+
+    Returns:
+        Mapping of logger name to level name
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(settings) -> None:
+    """
+    Configure the root logger from LOG_LEVEL, LOG_LEVELS, LOG_FORMAT and
+    LOG_SAMPLE_RATE. Safe to call more than once.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    for name, level in parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware assigning each request an ID.
+
+    An incoming ``X-Request-ID`` header is reused (so IDs can be followed
+    across services), otherwise a new one is generated. The ID is attached
+    to every log record written while serving the request and returned in
+    the ``X-Request-ID`` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1").strip()[:128] or uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]}
+            await send(message)
+
+        token = set_request_id(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            reset_request_id(token)
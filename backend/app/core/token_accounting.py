@@ -0,0 +1,136 @@
+from typing import Dict, List, Any, Optional
+from collections import deque
+from dataclasses import dataclass, asdict
+import math
+import threading
+
+# Rough characters-per-token ratio for English text with Llama-style tokenizers
+CHARS_PER_TOKEN = 4.0
+
+# Completion lengths kept per budget key, and the share of them an observed budget must fit
+BUDGET_HISTORY_SIZE = 128
+BUDGET_PERCENTILE = 0.95
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Estimated token count (at least 1 for non-empty text)
+    """
+    if not text:
+        return 0
+    return tokens_for_length(len(text))
+
+
+def tokens_for_length(char_count: int) -> int:
+    """Estimate the number of tokens in a text of the given length"""
+    if char_count <= 0:
+        return 0
+    return max(1, math.ceil(char_count / CHARS_PER_TOKEN))
+
+
+@dataclass(frozen=True)
+class PromptSpec:
+    """A prompt ready to send, with its estimated input size and output budget"""
+    request_type: str
+    prompt: str
+    input_tokens: int
+    max_tokens: int
+    budget_key: Optional[str] = None  # What the output budget is sized for, e.g. "content:elementary"
+
+
+@dataclass
+class TokenUsage:
+    """Token accounting for a single LLM call"""
+    request_type: str
+    model: str
+    max_tokens: int
+    prompt_tokens: int
+    completion_tokens: int
+    estimated: bool  # True if the counts are estimates rather than reported by the API
+    streamed: bool
+    timestamp: float
+    cancelled: bool = False  # True if the consumer stopped a stream before it finished
+    truncated: bool = False  # True if the completion stopped at max_tokens (finish_reason "length")
+    budget_key: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class TokenLedger:
+    """
+    Process-wide record of token usage.
+
+    Keeps running totals per request type and the most recent calls, so
+    budgets can be tuned against what the model actually produces.
+    """
+
+    def __init__(self, history_size: int = 256):
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=history_size)
+        self._totals: Dict[str, Dict[str, int]] = {}
+        # Completion lengths of recent finished calls, per budget key
+        self._completions: Dict[str, deque] = {}
+
+    def record(self, usage: TokenUsage) -> None:
+        """Add one call to the ledger"""
+        with self._lock:
+            self._history.append(usage)
+            totals = self._totals.setdefault(usage.request_type, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "reserved_tokens": 0, "truncated": 0
+            })
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["reserved_tokens"] += usage.max_tokens
+            totals["truncated"] += usage.truncated
+            if usage.budget_key and not usage.cancelled:
+                # A truncated completion needed more than it got; its budget is a lower bound
+                completions = self._completions.setdefault(usage.budget_key, deque(maxlen=BUDGET_HISTORY_SIZE))
+                completions.append(max(usage.completion_tokens, usage.max_tokens) if usage.truncated else usage.completion_tokens)
+
+    def observed_budget(self, budget_key: str, min_samples: int) -> Optional[int]:
+        """
+        Output budget that fits the recent completions of a budget key.
+
+        Returns:
+            The BUDGET_PERCENTILE completion length, or None with fewer than min_samples completions
+        """
+        with self._lock:
+            completions = sorted(self._completions.get(budget_key, ()))
+        if not completions or len(completions) < min_samples:
+            return None
+        return completions[min(len(completions) - 1, math.ceil(len(completions) * BUDGET_PERCENTILE) - 1)]
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """Running totals per request type"""
+        with self._lock:
+            return {k: dict(v) for k, v in self._totals.items()}
+
+    def expected_completion_tokens(self, request_type: str) -> Optional[int]:
+        """Average completion of recent finished calls of a request type, or None without history"""
+        with self._lock:
+            completions = [u.completion_tokens for u in self._history if u.request_type == request_type and not u.cancelled]
+        if not completions:
+            return None
+        return round(sum(completions) / len(completions))
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """The most recent calls, newest last"""
+        with self._lock:
+            return [asdict(usage) for usage in list(self._history)[-limit:]]
+
+
+_ledger = TokenLedger()
+
+
+def get_token_ledger() -> TokenLedger:
+    """Get the process-wide token ledger"""
+    return _ledger
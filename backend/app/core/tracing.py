@@ -0,0 +1,303 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+# Span of the code currently running; propagated across awaits, tasks and to_thread by contextvars
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# W3C trace context header: version-traceid-parentid-flags
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """One timed operation within a trace"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float  # Unix time in seconds
+    end_time: Optional[float] = None
+    status: str = "ok"  # "ok", "error" or "cancelled"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    _started: float = field(default=0.0, repr=False)  # perf_counter at start, for the duration
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Duration in seconds, once the span has ended"""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        """Record a point in time within the span, e.g. the first streamed token"""
+        self.events.append({
+            "name": name,
+            "offset": time.perf_counter() - self._started,
+            "attributes": attributes
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("_started")
+        data["duration"] = self.duration
+        return data
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is disabled"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """Receives every finished span; subclass to send spans elsewhere"""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps finished spans in memory, for tests and debugging"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if len(self._spans) > self.max_spans:
+                del self._spans[:len(self._spans) - self.max_spans]
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def trace(self, trace_id: str) -> List[Span]:
+        """All finished spans of one trace, in start order"""
+        return sorted((s for s in self.spans if s.trace_id == trace_id), key=lambda s: s.start_time)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class JSONFileExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to the configured exporter.
+
+    Spans nest through a context variable, so a span opened in a router is
+    the parent of spans opened in services and API clients it awaits, in
+    tasks it creates and in asyncio.to_thread calls. Tracing is off until an
+    exporter is configured, and then costs one small object per span.
+    """
+
+    def __init__(self):
+        self._exporter: Optional[SpanExporter] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._exporter is not None
+
+    @property
+    def exporter(self) -> Optional[SpanExporter]:
+        return self._exporter
+
+    def configure(self, exporter: Optional[SpanExporter]) -> None:
+        """Replace the exporter (None disables tracing)"""
+        previous, self._exporter = self._exporter, exporter
+        if previous is not None and previous is not exporter:
+            previous.shutdown()
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes: Any):
+        """
+        Time the enclosed block as a child of the current span.
+
+        Args:
+            name: Operation name, e.g. "llm.generate"
+            trace_id: Continue an external trace (only used without a current span)
+            parent_id: Remote parent span id that goes with trace_id
+            **attributes: Initial span attributes
+
+        Yields:
+            The span, to add attributes and events to
+        """
+        exporter = self._exporter
+        if exporter is None:
+            yield _NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(
+            name=name,
+            trace_id=trace_id or secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent_id,
+            start_time=time.time(),
+            attributes=dict(attributes),
+            _started=time.perf_counter()
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "cancelled" if _is_cancellation(e) else "error"
+            if span.status == "error":
+                span.attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # An async generator closed from another context; its span still ends here
+                pass
+            span.end_time = span.start_time + (time.perf_counter() - span._started)
+            try:
+                exporter.export(span)
+            except Exception as export_error:
+                logger.warning("Error exporting span %s: %s", span.name, export_error)
+
+
+def _is_cancellation(error: BaseException) -> bool:
+    return isinstance(error, (asyncio.CancelledError, GeneratorExit))
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Get the process-wide tracer"""
+    return _tracer
+
+
+def span(name: str, **attributes: Any):
+    """Shortcut for get_tracer().span(name, **attributes)"""
+    return _tracer.span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """The span of the code currently running, if tracing is enabled"""
+    return _current_span.get()
+
+
+def configure_tracing(settings) -> None:
+    """Set up the exporter selected by TRACING_EXPORTER"""
+    if not settings.TRACING_ENABLED:
+        _tracer.configure(None)
+    elif settings.TRACING_EXPORTER == "memory":
+        _tracer.configure(InMemoryExporter())
+    elif settings.TRACING_EXPORTER == "jsonl":
+        _tracer.configure(JSONFileExporter(settings.TRACING_FILE or os.path.join(settings.DATA_DIR, "traces.jsonl")))
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {settings.TRACING_EXPORTER}")
+
+
+def parse_traceparent(header: Optional[str]) -> tuple:
+    """
+    Parse a W3C traceparent header.
+
+    Returns:
+        (trace_id, parent_span_id), or (None, None) if absent or malformed
+    """
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of each HTTP request.
+
+    An incoming W3C ``traceparent`` header continues the caller's trace, and
+    the response carries a ``traceparent`` header pointing at the request
+    span so clients can look up the trace of a slow request. The span is
+    named after the route template once routing has run.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        method = scope.get("method", "GET")
+
+        with _tracer.span(f"{method} {scope.get('path', '')}", trace_id=trace_id, parent_id=parent_id,
+                          **{"http.method": method, "http.target": scope.get("path", "")}) as request_span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                    request_span.add_event("response_headers")
+                    response_headers = list(message.get("headers", []))
+                    traceparent = f"00-{request_span.trace_id}-{request_span.span_id}-01"
+                    response_headers.append((b"traceparent", traceparent.encode("latin-1")))
+                    message = {**message, "headers": response_headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    request_span.name = f"{method} {route}"
+                    request_span.set_attribute("http.route", route)
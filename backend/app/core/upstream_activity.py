@@ -0,0 +1,79 @@
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
+import threading
+import time
+
+# Set while running speculative/background work, so its upstream calls are not counted as foreground load
+_background = contextvars.ContextVar("upstream_background", default=False)
+
+
+class UpstreamActivity:
+    """
+    Tracks foreground (user-facing) upstream calls in this process.
+
+    Background work such as speculative prefetch uses this to run only when
+    no interactive request is waiting on the LLM or image APIs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._foreground_inflight = 0
+        self._last_foreground_end = 0.0
+
+    @property
+    def foreground_inflight(self) -> int:
+        """Number of foreground upstream calls currently running"""
+        return self._foreground_inflight
+
+    @asynccontextmanager
+    async def track(self):
+        """Wrap an upstream call; counted as foreground unless inside background_work()"""
+        if _background.get():
+            yield
+            return
+        with self._lock:
+            self._foreground_inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground_inflight -= 1
+                self._last_foreground_end = time.monotonic()
+
+    def is_idle(self, quiet_seconds: float = 0.0) -> bool:
+        """
+        Check whether there is spare upstream capacity.
+
+        Args:
+            quiet_seconds: How long the last foreground call must have been finished
+
+        Returns:
+            True if no foreground call is running and none ended within quiet_seconds
+        """
+        with self._lock:
+            if self._foreground_inflight > 0:
+                return False
+            return time.monotonic() - self._last_foreground_end >= quiet_seconds
+
+
+@contextmanager
+def background_work():
+    """Mark upstream calls made in this context as background work"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def is_background() -> bool:
+    """Whether the current context is running background work"""
+    return _background.get()
+
+
+_activity = UpstreamActivity()
+
+
+def get_upstream_activity() -> UpstreamActivity:
+    """Get the process-wide upstream activity tracker"""
+    return _activity
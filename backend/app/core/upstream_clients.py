@@ -0,0 +1,83 @@
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import logging
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Pooled clients per event loop: their connections belong to the loop that opened them
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _pool() -> Dict[Tuple, Any]:
+    loop = asyncio.get_running_loop()
+    pool = _clients.get(loop)
+    if pool is None:
+        pool = _clients[loop] = {}
+    return pool
+
+
+def get_openai_client(base_url: str, api_key: Optional[str]):
+    """
+    Shared AsyncOpenAI client for an endpoint and key.
+
+    API clients are created per request; sharing the SDK client keeps its
+    HTTP connections (and TLS sessions) alive between requests instead of
+    opening new ones each time.
+    """
+    pool = _pool()
+    key = ("openai", base_url, api_key)
+    client = pool.get(key)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = pool[key] = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    return client
+
+
+def get_genai_client(api_key: Optional[str], base_url: Optional[str] = None):
+    """Shared google.genai client for a key (and base URL override)"""
+    pool = _pool()
+    key = ("genai", api_key, base_url)
+    client = pool.get(key)
+    if client is None:
+        from google import genai
+        from google.genai import types
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        client = pool[key] = genai.Client(api_key=api_key, http_options=http_options)
+    return client
+
+
+def get_http_session():
+    """Shared aiohttp session for plain HTTP APIs (e.g. NVIDIA image generation)"""
+    pool = _pool()
+    key = ("aiohttp",)
+    session = pool.get(key)
+    if session is None or session.closed:
+        import aiohttp
+        session = pool[key] = aiohttp.ClientSession()
+    return session
+
+
+def get_webhook_session(allowed_hosts: Tuple[str, ...] = ()):
+    """Shared aiohttp session for job webhooks: connects to public addresses only, or to the allowed hosts"""
+    pool = _pool()
+    key = ("aiohttp", "webhooks", allowed_hosts)
+    session = pool.get(key)
+    if session is None or session.closed:
+        import aiohttp
+        from app.core.webhook_targets import public_address_resolver
+        connector = aiohttp.TCPConnector(resolver=public_address_resolver(allowed_hosts))
+        session = pool[key] = aiohttp.ClientSession(connector=connector)
+    return session
+
+
+async def close_upstream_clients() -> None:
+    """Close the pooled clients of the running event loop, e.g. at application shutdown"""
+    pool = _clients.pop(asyncio.get_running_loop(), {})
+    for key, client in pool.items():
+        try:
+            # The genai client has no close(); its connections go with the event loop
+            if key[0] in ("openai", "aiohttp"):
+                await client.close()
+        except Exception as e:
+            logger.warning("Error closing %s client: %s", key[0], e)
@@ -0,0 +1,280 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# UPSTREAM_MODE values; "live" talks to the real APIs without recording
+UPSTREAM_MODES = ("live", "record", "replay")
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMiss(Exception):
+    """No recorded interaction matches a request made in replay mode"""
+
+
+class ReplayedUpstreamError(Exception):
+    """An upstream error that was recorded, raised again on replay"""
+
+
+@dataclass
+class Interaction:
+    """One recorded upstream call"""
+    provider: str  # "llm" or "gemini"
+    operation: str  # e.g. "chat", "chat_stream", "generate_content"
+    key: str  # Hash of the request, see request_key()
+    request: Dict[str, Any]
+    response: Any = None  # Generated text for chat, response JSON for Gemini
+    usage: Optional[Dict[str, int]] = None  # Token counts reported by the API, if any
+    chunks: List[List[Any]] = field(default_factory=list)  # [offset seconds, text] for streams
+    latency: float = 0.0  # Seconds until the response (or the end of the stream)
+    error: Optional[str] = None  # Upstream error, raised again on replay
+    recorded_at: float = 0.0
+    finish_reason: Optional[str] = None  # Why the completion ended, e.g. "stop" or "length"
+
+
+def request_key(provider: str, operation: str, request: Dict[str, Any]) -> str:
+    """Stable hash of a request, used to find its recording"""
+    canonical = json.dumps(
+        {"provider": provider, "operation": operation, "request": request},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class UpstreamRecorder:
+    """
+    Records upstream traffic to a cassette directory, or replays it.
+
+    In record mode the API clients call the real upstream as usual and every
+    call (request, response, latency, stream chunk timing and errors) is
+    appended to ``<directory>/<provider>.jsonl``. In replay mode the clients
+    never touch the network: each request is answered from its recording,
+    with the recorded latency and chunk timing multiplied by ``time_scale``
+    (1.0 reproduces the original timing, 0 replays instantly).
+
+    With ``match="exact"`` a request without a recording raises ReplayMiss.
+    With ``match="sequence"`` it is answered with the recordings of the same
+    operation in order, so runs with different prompts (e.g. benchmarks) can
+    still replay realistic traffic.
+    """
+
+    def __init__(self, mode: str, directory: str, time_scale: float = 1.0, match: str = "exact"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"UpstreamRecorder mode must be 'record' or 'replay', not {mode!r}")
+        if match not in ("exact", "sequence"):
+            raise ValueError(f"Unknown UPSTREAM_REPLAY_MATCH: {match}")
+        self.mode = mode
+        self.directory = directory
+        self.time_scale = max(0.0, time_scale)
+        self.match = match
+        self._lock = threading.Lock()
+        self._by_key: Optional[Dict[str, List[Interaction]]] = None
+        self._by_operation: Dict[tuple, List[Interaction]] = {}
+        self._cursors: Dict[Any, int] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        """Read all cassettes once, on first lookup"""
+        by_key: Dict[str, List[Interaction]] = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl"))):
+            with open(path, encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        interaction = Interaction(**json.loads(line))
+                    except (ValueError, TypeError) as e:
+                        logger.warning("Skipping bad cassette entry %s:%d: %s", path, line_number, e)
+                        continue
+                    by_key.setdefault(interaction.key, []).append(interaction)
+                    self._by_operation.setdefault((interaction.provider, interaction.operation), []).append(interaction)
+        self._by_key = by_key
+        logger.info("Loaded upstream recordings", extra={
+            "directory": self.directory,
+            "interactions": sum(len(v) for v in by_key.values())
+        })
+
+    def _next(self, cursor: Any, recordings: List[Interaction]) -> Interaction:
+        """Cycle through recordings deterministically"""
+        index = self._cursors.get(cursor, 0)
+        self._cursors[cursor] = index + 1
+        return recordings[index % len(recordings)]
+
+    def lookup(self, provider: str, operation: str, request: Dict[str, Any]) -> Interaction:
+        """
+        Find the recording that answers a request.
+
+        Raises:
+            ReplayMiss: If nothing matches
+        """
+        key = request_key(provider, operation, request)
+        with self._lock:
+            if self._by_key is None:
+                self._load()
+            if key in self._by_key:
+                return self._next(key, self._by_key[key])
+            recordings = self._by_operation.get((provider, operation))
+            if self.match == "sequence" and recordings:
+                return self._next((provider, operation), recordings)
+        raise ReplayMiss(f"No recording of {provider} {operation} request {key[:12]} in {self.directory}")
+
+    def record(self, interaction: Interaction) -> None:
+        """Append an interaction to its provider's cassette"""
+        interaction.recorded_at = interaction.recorded_at or time.time()
+        line = json.dumps(asdict(interaction), default=str)
+        path = os.path.join(self.directory, f"{interaction.provider}.jsonl")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            if self._by_key is not None:
+                self._by_key.setdefault(interaction.key, []).append(interaction)
+                self._by_operation.setdefault((interaction.provider, interaction.operation), []).append(interaction)
+
+    def record_call(self, provider: str, operation: str, request: Dict[str, Any], started: float,
+                    response: Any = None, usage: Optional[Dict[str, int]] = None, error: Optional[str] = None,
+                    finish_reason: Optional[str] = None) -> None:
+        """
+        Record a non-streaming call.
+
+        Args:
+            started: time.perf_counter() taken just before the call
+        """
+        self.record(Interaction(
+            provider=provider,
+            operation=operation,
+            key=request_key(provider, operation, request),
+            request=request,
+            response=response,
+            usage=usage,
+            latency=time.perf_counter() - started,
+            error=error,
+            finish_reason=finish_reason
+        ))
+
+    async def record_stream(self, provider: str, operation: str, request: Dict[str, Any],
+                            stream: AsyncIterator[str],
+                            outcome: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
+        """
+        Pass a text stream through, recording each chunk's offset.
+
+        Streams the consumer abandons are not recorded, as they would replay
+        as truncated responses; streams the upstream breaks off are recorded
+        with their error.
+
+        Args:
+            outcome: Dict the stream puts its "finish_reason" in, recorded with the chunks
+        """
+        started = time.perf_counter()
+        chunks: List[List[Any]] = []
+        try:
+            async for text in stream:
+                chunks.append([round(time.perf_counter() - started, 6), text])
+                yield text
+        except Exception as e:
+            self._record_stream(provider, operation, request, started, chunks, error=str(e))
+            raise
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+        self._record_stream(provider, operation, request, started, chunks,
+                            finish_reason=(outcome or {}).get("finish_reason"))
+
+    def _record_stream(self, provider, operation, request, started, chunks, error=None, finish_reason=None) -> None:
+        self.record(Interaction(
+            provider=provider,
+            operation=operation,
+            key=request_key(provider, operation, request),
+            request=request,
+            response="".join(text for _, text in chunks),
+            chunks=chunks,
+            latency=time.perf_counter() - started,
+            error=error,
+            finish_reason=finish_reason
+        ))
+
+    async def _sleep(self, seconds: float) -> None:
+        if seconds > 0 and self.time_scale > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    async def replay_call(self, provider: str, operation: str, request: Dict[str, Any]) -> Interaction:
+        """
+        Answer a non-streaming call from its recording, after the recorded latency.
+
+        Raises:
+            ReplayMiss: If nothing matches
+            ReplayedUpstreamError: If the recorded call failed
+        """
+        interaction = self.lookup(provider, operation, request)
+        await self._sleep(interaction.latency)
+        if interaction.error:
+            raise ReplayedUpstreamError(interaction.error)
+        return interaction
+
+    async def replay_stream(self, provider: str, operation: str, request: Dict[str, Any],
+                            outcome: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
+        """
+        Replay a recorded stream chunk by chunk, at the recorded offsets.
+
+        Args:
+            outcome: Dict that gets the recorded "finish_reason" once the chunks are replayed
+
+        Raises:
+            ReplayMiss: If nothing matches
+            ReplayedUpstreamError: After the recorded chunks, if the stream failed
+        """
+        interaction = self.lookup(provider, operation, request)
+        started = time.perf_counter()
+        for offset, text in interaction.chunks:
+            # Offsets are relative to the start, so sleep overshoot does not accumulate
+            delay = offset * self.time_scale - (time.perf_counter() - started)
+            if delay > 0 and self.time_scale > 0:
+                await asyncio.sleep(delay)
+            yield text
+        if interaction.error:
+            raise ReplayedUpstreamError(interaction.error)
+        if outcome is not None:
+            outcome["finish_reason"] = interaction.finish_reason
+        tail = interaction.latency * self.time_scale - (time.perf_counter() - started)
+        if tail > 0 and self.time_scale > 0:
+            await asyncio.sleep(tail)
+
+
+_recorders: Dict[tuple, UpstreamRecorder] = {}
+_recorders_lock = threading.Lock()
+
+
+def get_upstream_recorder(settings) -> Optional[UpstreamRecorder]:
+    """
+    Get the process-wide recorder for UPSTREAM_MODE.
+
+    Returns:
+        None in live mode, otherwise the recorder for the configured cassette directory
+    """
+    mode = settings.UPSTREAM_MODE
+    if mode not in UPSTREAM_MODES:
+        raise ValueError(f"Unknown UPSTREAM_MODE: {mode}")
+    if mode == "live":
+        return None
+    directory = settings.UPSTREAM_CASSETTE_DIR or os.path.join(settings.DATA_DIR, "cassettes")
+    key = (mode, directory, settings.UPSTREAM_REPLAY_TIME_SCALE, settings.UPSTREAM_REPLAY_MATCH)
+    with _recorders_lock:
+        recorder = _recorders.get(key)
+        if recorder is None:
+            recorder = UpstreamRecorder(mode, directory, settings.UPSTREAM_REPLAY_TIME_SCALE, settings.UPSTREAM_REPLAY_MATCH)
+            _recorders[key] = recorder
+        return recorder
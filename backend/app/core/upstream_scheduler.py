@@ -0,0 +1,354 @@
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Iterator, Optional, Set
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+
+from app.core.deadlines import DeadlineExceeded, expired, upstream_timeout
+from app.core.metrics import DEADLINES_EXCEEDED, UPSTREAM_PREEMPTIONS, UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_WAIT
+from app.core.upstream_activity import is_background
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ("interactive", "background", "speculative")
+
+# Priority class of the upstream calls made in this context; None means the default for the context
+_priority = contextvars.ContextVar("upstream_priority", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamPreempted(Exception):
+    """A speculative upstream call was cancelled to make room for interactive requests"""
+
+
+@contextmanager
+def priority_class(name: str) -> Iterator[None]:
+    """
+    Run the enclosed code's upstream calls in a priority class.
+
+    Example:
+        with priority_class("background"):
+            task = asyncio.create_task(generate_curriculum(...))
+    """
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority class of the current context: set by priority_class(), speculative in background_work(), else interactive"""
+    name = _priority.get()
+    if name is not None:
+        return name
+    return "speculative" if is_background() else "interactive"
+
+
+def parse_priority_weights(spec: str) -> Dict[str, float]:
+    """
+    Parse class weights such as "interactive=8,background=2,speculative=1".
+
+    Classes not listed get weight 1.
+    """
+    weights = {name: 1.0 for name in PRIORITY_CLASSES}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, weight = (part.strip() for part in item.split("=", 1))
+        try:
+            if name not in weights or float(weight) <= 0:
+                raise ValueError
+            weights[name] = float(weight)
+        except ValueError:
+            logger.warning("Ignoring bad UPSTREAM_PRIORITY_WEIGHTS entry %r", item)
+    return weights
+
+
+class RateLimiter:
+    """
+    Token bucket of one token, refilled every ``60 / per_minute`` seconds.
+
+    Calls are spaced evenly so that at most ``per_minute`` start in any
+    minute. The limiter does not queue calls itself: ResourceScheduler takes
+    a token when it grants a slot, so the priority classes, not the order of
+    arrival, decide which waiting call gets the next start.
+    """
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+
+    def delay(self) -> float:
+        """Seconds until the next token (0 when a call may start now)"""
+        return max(0.0, self._next - time.monotonic())
+
+    def take(self) -> None:
+        """Take the token for a call starting now"""
+        self._next = max(time.monotonic(), self._next) + self.interval
+
+
+class _Slot:
+    """One granted (or awaited) unit of upstream concurrency"""
+
+    __slots__ = ("priority", "enqueued_at", "future", "task", "preempted")
+
+    def __init__(self, priority: str, future: Optional[asyncio.Future] = None):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.future = future
+        self.task = asyncio.current_task()
+        self.preempted = False
+
+
+class ResourceScheduler:
+    """
+    Priority scheduler for the concurrent calls to one upstream API.
+
+    At most ``capacity`` calls run at once (0 means no limit). When calls
+    have to wait, free slots go to the priority classes in proportion to
+    their weights (stride scheduling), so interactive requests are served
+    first without shutting background work out entirely. Additionally:
+
+    - ``reserve`` slots are only ever used by interactive calls, so a burst
+      of batch work cannot take all of them;
+    - while ``preempt_depth`` or more interactive calls wait, background and
+      speculative calls get no new slots, and running speculative calls are
+      cancelled (they raise UpstreamPreempted) to free theirs;
+    - a call that has waited ``starvation_seconds`` is served next regardless
+      of its class, so lower classes are deferred but never starved.
+
+    With ``per_minute`` set, calls are also spaced to at most that many a
+    minute (see RateLimiter); a call waits for a slot until a start is due,
+    and the next start goes to the waiting call the classes' weights pick.
+    """
+
+    def __init__(self, name: str, capacity: int, weights: Dict[str, float], reserve: int = 0,
+                 starvation_seconds: float = 30.0, preempt_depth: int = 4, per_minute: float = 0):
+        self.name = name
+        self.capacity = max(0, capacity)
+        self.rate_limiter = RateLimiter(per_minute) if per_minute > 0 else None
+        self.weights = weights
+        self.reserve = min(max(0, reserve), max(0, self.capacity - 1))
+        self.starvation_seconds = starvation_seconds
+        self.preempt_depth = max(1, preempt_depth)
+        self._waiting: Dict[str, Deque[_Slot]] = {name: deque() for name in PRIORITY_CLASSES}
+        self._running: Dict[str, Set[_Slot]] = {name: set() for name in PRIORITY_CLASSES}
+        self._pass = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        # Pending dispatch for when the rate limit allows the next start
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def in_use(self) -> int:
+        return sum(len(slots) for slots in self._running.values())
+
+    def waiting(self, priority: str) -> int:
+        return len(self._waiting[priority])
+
+    def running(self, priority: str) -> int:
+        return len(self._running[priority])
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        """
+        Hold a slot for one upstream call, waiting for it if needed.
+
+        Raises:
+            DeadlineExceeded: If the request deadline passes while waiting
+            UpstreamPreempted: If a speculative call is cancelled for interactive requests
+        """
+        slot = await self._acquire(priority or current_priority())
+        try:
+            yield
+        except asyncio.CancelledError:
+            # A preemption, rather than a cancellation of the caller, surfaces as UpstreamPreempted
+            if slot.preempted and slot.task is not None and slot.task.uncancel() == 0:
+                raise UpstreamPreempted(f"{self.name} call preempted by interactive requests") from None
+            raise
+        finally:
+            self._release(slot)
+
+    async def _acquire(self, priority: str) -> _Slot:
+        started = time.monotonic()
+        if not any(self._waiting.values()) and self._rate_delay() == 0 and self._can_run(priority):
+            slot = _Slot(priority)
+            self._running[priority].add(slot)
+            self._take_rate()
+            UPSTREAM_QUEUE_WAIT.observe(0.0, resource=self.name, priority=priority)
+            return slot
+
+        timeout = upstream_timeout()
+        slot = _Slot(priority, asyncio.get_running_loop().create_future())
+        queue = self._waiting[priority]
+        if not queue:
+            # A class that was idle rejoins at the current virtual time rather than with banked credit
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+        queue.append(slot)
+        UPSTREAM_QUEUE_DEPTH.set(len(queue), resource=self.name, priority=priority)
+        self._dispatch()
+        if priority == "interactive":
+            self._preempt()
+
+        try:
+            if timeout is None:
+                await slot.future
+            else:
+                await asyncio.wait_for(asyncio.shield(slot.future), timeout)
+        except BaseException as e:
+            if slot.future.done() and not slot.future.cancelled():
+                # Granted just as the wait ended: hand the slot on
+                self._release(slot)
+            else:
+                slot.future.cancel()
+                queue.remove(slot)
+                UPSTREAM_QUEUE_DEPTH.set(len(queue), resource=self.name, priority=priority)
+            if isinstance(e, asyncio.TimeoutError) and expired():
+                DEADLINES_EXCEEDED.inc()
+                raise DeadlineExceeded("Request deadline exceeded while waiting for an upstream slot") from None
+            raise
+        slot.task = asyncio.current_task()
+        UPSTREAM_QUEUE_WAIT.observe(time.monotonic() - started, resource=self.name, priority=priority)
+        return slot
+
+    def _release(self, slot: _Slot) -> None:
+        running = self._running[slot.priority]
+        if slot in running:
+            running.discard(slot)
+            self._dispatch()
+
+    def _can_run(self, priority: str) -> bool:
+        """Whether a call of this class may take a free slot now"""
+        if not self.capacity:
+            return True
+        in_use = self.in_use
+        if in_use >= self.capacity:
+            return False
+        if priority == "interactive":
+            return True
+        if len(self._waiting["interactive"]) >= self.preempt_depth:
+            return False
+        lower = in_use - len(self._running["interactive"])
+        return lower < self.capacity - self.reserve
+
+    def _rate_delay(self) -> float:
+        return self.rate_limiter.delay() if self.rate_limiter is not None else 0.0
+
+    def _take_rate(self) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.take()
+
+    def _wake(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting calls"""
+        while True:
+            candidates = [name for name in PRIORITY_CLASSES if self._waiting[name]]
+            if not candidates:
+                return
+            delay = self._rate_delay()
+            if delay > 0:
+                # Dispatch again once the next start is due, to whichever call is then first in line
+                if self._wakeup is None:
+                    self._wakeup = asyncio.get_running_loop().call_later(delay, self._wake)
+                return
+            now = time.monotonic()
+            starved = [
+                name for name in candidates
+                if now - self._waiting[name][0].enqueued_at >= self.starvation_seconds
+                and self._can_run_starved(name)
+            ]
+            if starved:
+                priority = min(starved, key=lambda name: self._waiting[name][0].enqueued_at)
+            else:
+                eligible = [name for name in candidates if self._can_run(name)]
+                if not eligible:
+                    return
+                priority = min(eligible, key=lambda name: (self._pass[name], PRIORITY_CLASSES.index(name)))
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1.0 / self.weights[priority]
+
+            queue = self._waiting[priority]
+            slot = queue.popleft()
+            UPSTREAM_QUEUE_DEPTH.set(len(queue), resource=self.name, priority=priority)
+            self._running[priority].add(slot)
+            self._take_rate()
+            slot.future.set_result(None)
+
+    def _can_run_starved(self, priority: str) -> bool:
+        """A starved call ignores interactive waiters, but still leaves the interactive reserve alone"""
+        if not self.capacity or priority == "interactive":
+            return self._can_run(priority)
+        in_use = self.in_use
+        return in_use < self.capacity and in_use - len(self._running["interactive"]) < self.capacity - self.reserve
+
+    def _preempt(self) -> None:
+        """Cancel running speculative calls while interactive calls wait for a slot"""
+        waiting = len(self._waiting["interactive"])
+        if waiting < self.preempt_depth or not self.capacity or self.in_use < self.capacity:
+            # Calls that only wait for the rate limit would not start any sooner
+            return
+        victims = [slot for slot in self._running["speculative"] if not slot.preempted and slot.task is not None]
+        for slot in victims[:waiting]:
+            slot.preempted = True
+            slot.task.cancel()
+            UPSTREAM_PREEMPTIONS.inc(resource=self.name, priority=slot.priority)
+            logger.info("Preempted a speculative upstream call", extra={"resource": self.name})
+
+
+class UpstreamScheduler:
+    """
+    Priority scheduling of the calls from this process to each upstream API.
+
+    Every LLM and image API call holds a slot of its resource ("llm",
+    "nvidia_image", "gemini_image") while it runs; see ResourceScheduler.
+    A call's class is interactive (user-facing requests, the default),
+    background (jobs) or speculative (prefetch); see priority_class().
+    Limits are per worker process, so size them as the upstream quota
+    divided by the number of workers.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.weights = parse_priority_weights(settings.UPSTREAM_PRIORITY_WEIGHTS)
+        self._resources: Dict[str, ResourceScheduler] = {}
+
+    def resource(self, name: str) -> ResourceScheduler:
+        scheduler = self._resources.get(name)
+        if scheduler is None:
+            settings = self.settings
+            llm = name == "llm"
+            scheduler = self._resources[name] = ResourceScheduler(
+                name,
+                settings.UPSTREAM_LLM_CONCURRENCY if llm else settings.UPSTREAM_IMAGE_CONCURRENCY,
+                self.weights,
+                reserve=settings.UPSTREAM_INTERACTIVE_RESERVE,
+                starvation_seconds=settings.UPSTREAM_STARVATION_SECONDS,
+                preempt_depth=settings.UPSTREAM_PREEMPT_DEPTH,
+                per_minute=settings.UPSTREAM_LLM_RPM if llm else settings.UPSTREAM_IMAGE_RPM
+            )
+        return scheduler
+
+    def slot(self, name: str, priority: Optional[str] = None):
+        """Hold a slot of a resource for one upstream call (async context manager)"""
+        return self.resource(name).slot(priority)
+
+
+# Schedulers per event loop: their futures belong to the loop that created them
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, UpstreamScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_upstream_scheduler(settings) -> UpstreamScheduler:
+    """Get the upstream scheduler of the running event loop"""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = UpstreamScheduler(settings)
+    return scheduler
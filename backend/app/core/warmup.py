@@ -0,0 +1,197 @@
+from typing import Dict, Iterable, Optional
+import asyncio
+import importlib
+import logging
+import time
+
+from app.core.upstream_clients import get_http_session, get_openai_client
+
+# SDKs the API clients import on first use; warming them up moves the import cost off the first request
+HEAVY_MODULES = ("openai", "google.genai", "aiohttp", "PIL.Image", "PIL.ImageDraw")
+
+logger = logging.getLogger(__name__)
+
+
+def import_modules(modules: Iterable[str]) -> Dict[str, float]:
+    """
+    Import modules, returning the seconds each took (0 if it was already loaded).
+
+    Modules that are not installed are logged and skipped.
+    """
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Warm-up could not import %s: %s", name, e)
+            continue
+        timings[name] = round(time.perf_counter() - started, 3)
+    return timings
+
+
+class Readiness:
+    """Whether this worker has finished warming up, and how each warm-up step went"""
+
+    def __init__(self):
+        self.ready = False
+        self.steps: Dict[str, str] = {}
+        self.seconds: Optional[float] = None
+
+    def reset(self) -> None:
+        self.ready = False
+        self.steps = {}
+        self.seconds = None
+
+
+_readiness = Readiness()
+
+
+def get_readiness() -> Readiness:
+    """Get the readiness state of this worker process"""
+    return _readiness
+
+
+class WarmUp:
+    """
+    Warm-up phase run in the background after the application starts.
+
+    The server binds its port and answers the ``/`` health check at once;
+    ``/ready`` answers 503 until the warm-up has run (or WARMUP_TIMEOUT has
+    passed), so load balancers only route traffic to warm workers. Steps:
+
+    - imports: load the SDKs the API clients import lazily
+    - connections: open pooled connections to the LLM and NVIDIA image
+      endpoints (TLS handshake included), optionally with a one-token
+      completion (WARMUP_COMPLETION)
+    - caches: open the research store, citation index, shared store and job store
+    - parsers: run the JSON extractor and reference parser once
+
+    A failed step is logged and recorded; it does not keep the worker
+    from becoming ready.
+    """
+
+    def __init__(self, settings, readiness: Optional[Readiness] = None):
+        self.settings = settings
+        self.readiness = readiness or get_readiness()
+
+    async def run(self) -> Readiness:
+        settings = self.settings
+        if settings.WARMUP_DELAY > 0:
+            await asyncio.sleep(settings.WARMUP_DELAY)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._run_steps(), settings.WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up did not finish within %ss, reporting ready anyway", settings.WARMUP_TIMEOUT)
+            self.readiness.steps["timeout"] = "exceeded"
+        self.readiness.seconds = round(time.perf_counter() - started, 3)
+        self.readiness.ready = True
+        logger.info("Warm-up done", extra={"seconds": self.readiness.seconds, "steps": self.readiness.steps})
+        return self.readiness
+
+    async def _run_steps(self) -> None:
+        settings = self.settings
+        await self._step("imports", settings.WARMUP_IMPORTS, self._imports)
+        live = settings.UPSTREAM_MODE == "live" and not settings.USE_MOCK_DATA
+        await self._step("connections", settings.WARMUP_CONNECTIONS and live, self._connections)
+        await self._step("caches", settings.WARMUP_CACHES, lambda: asyncio.to_thread(self._caches))
+        await self._step("parsers", settings.WARMUP_CACHES, lambda: asyncio.to_thread(self._parsers))
+
+    async def _step(self, name: str, enabled: bool, run) -> None:
+        if not enabled:
+            self.readiness.steps[name] = "skipped"
+            return
+        started = time.perf_counter()
+        try:
+            await run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            self.readiness.steps[name] = f"failed: {e}"[:200]
+            return
+        self.readiness.steps[name] = f"ok ({time.perf_counter() - started:.3f}s)"
+
+    async def _imports(self) -> None:
+        await asyncio.to_thread(import_modules, HEAVY_MODULES)
+
+    async def _connections(self) -> None:
+        settings = self.settings
+        calls = []
+        if settings.LLM_API_KEY:
+            calls.append(self._llm_connection())
+        if settings.NVIDIA_API_KEY:
+            calls.append(self._nvidia_connection())
+        for result in await asyncio.gather(*calls, return_exceptions=True):
+            if isinstance(result, Exception):
+                raise result
+
+    async def _llm_connection(self) -> None:
+        """Open a pooled connection to the LLM endpoint (any HTTP answer leaves it open)"""
+        settings = self.settings
+        client = get_openai_client(settings.LLM_API_BASE_URL, settings.LLM_API_KEY)
+        if settings.WARMUP_COMPLETION:
+            await client.chat.completions.create(
+                model=settings.LLM_MODEL_ID,
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1
+            )
+            return
+        try:
+            await client.models.list()
+        except Exception as e:
+            # The connection is open even if the endpoint has no model list
+            from openai import APIStatusError
+            if not isinstance(e, APIStatusError):
+                raise
+
+    async def _nvidia_connection(self) -> None:
+        """Open a pooled connection to the NVIDIA image endpoint"""
+        settings = self.settings
+        session = get_http_session()
+        headers = {"Authorization": f"Bearer {settings.NVIDIA_API_KEY}"}
+        async with session.get(f"{settings.NVIDIA_API_BASE_URL}/models", headers=headers) as response:
+            # Read the body so the connection goes back to the pool
+            await response.read()
+
+    def _caches(self) -> None:
+        """Open the on-disk stores, so the first request does not pay for connecting and seeding"""
+        from app.core.shared_state import get_shared_store
+        from app.services.deep_research_service import research_topic_index
+        from app.services.job_store import get_job_store
+        from app.services.lesson_store import get_lesson_store
+        from app.services.reference_service import get_citation_index
+        from app.services.research_store import get_research_store
+        settings = self.settings
+        if settings.RESEARCH_STORE_ENABLED:
+            store = get_research_store(settings)
+            store.open()
+            if settings.RESEARCH_STORE_TTL > 0:
+                purged = store.purge(max_age=settings.RESEARCH_STORE_TTL)
+                if purged:
+                    logger.info("Purged %d expired research records and outlines", purged)
+            if settings.SIMILAR_TOPICS_ENABLED:
+                research_topic_index(settings)
+        if settings.REFERENCE_ENRICHMENT_ENABLED:
+            get_citation_index(settings).open()
+        get_shared_store(settings).get("warmup")
+        if settings.LESSON_LIBRARY_ENABLED:
+            get_lesson_store(settings).open()
+        if settings.JOBS_ENABLED:
+            get_job_store(settings).version("warmup")
+
+    def _parsers(self) -> None:
+        """Run the reply parsers once on small samples"""
+        from app.services.json_extractor import extract_json
+        from app.services.reference_service import extract_inline_dois, normalize_title, parse_reference
+        extract_json('Here you go:\n```json\n[{"title": "Intro", "content": "text"},]\n```')
+        parse_reference('1. Smith, J. (2020). "A study of warm caches". Journal of Tests. https://doi.org/10.1000/xyz')
+        normalize_title("A Study of Warm Caches")
+        extract_inline_dois("See doi:10.1000/xyz for details.")
+
+
+def start_warm_up(settings) -> asyncio.Task:
+    """Start the warm-up in the background; /ready reports ready when it is done"""
+    get_readiness().reset()
+    return asyncio.create_task(WarmUp(settings).run())
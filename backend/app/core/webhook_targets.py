@@ -0,0 +1,95 @@
+from typing import Any, Dict, List, Sequence, Tuple
+from urllib.parse import urlparse
+import asyncio
+import ipaddress
+import socket
+
+
+class WebhookTargetRejected(ValueError):
+    """A webhook URL that jobs may not send requests to"""
+
+
+def parse_allowed_hosts(spec: str) -> Tuple[str, ...]:
+    """
+    Parse JOB_WEBHOOK_ALLOWED_HOSTS, e.g. "hooks.example.com,*.example.org".
+
+    Returns:
+        Lower-case host names; "*.example.org" allows the subdomains of example.org
+    """
+    return tuple(host.strip().lower().rstrip(".") for host in (spec or "").split(",") if host.strip())
+
+
+def host_allowed(host: str, allowed_hosts: Sequence[str]) -> bool:
+    """Whether a host is on the allow-list"""
+    host = host.lower().rstrip(".")
+    for allowed in allowed_hosts:
+        if allowed.startswith("*."):
+            if host.endswith(allowed[1:]):
+                return True
+        elif host == allowed:
+            return True
+    return False
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is globally routable: not loopback, private, link-local, reserved or multicast"""
+    try:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_webhook_url(url: str, allowed_hosts: Sequence[str] = ()) -> None:
+    """
+    Check that a webhook URL only reaches hosts jobs may call.
+
+    With an allow-list, the host must be on it (and may then be internal).
+    Without one, every address the host resolves to must be public, so
+    that webhooks cannot be pointed at the server's own network, e.g. at
+    localhost or the cloud metadata service (169.254.169.254).
+
+    Raises:
+        WebhookTargetRejected: If the URL is not http(s), its host is not
+            allowed or it resolves to a non-public address
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise WebhookTargetRejected("webhook_url must be an http(s) URL")
+    host = parsed.hostname
+    if allowed_hosts:
+        if not host_allowed(host, allowed_hosts):
+            raise WebhookTargetRejected(f"webhook_url host {host} is not in JOB_WEBHOOK_ALLOWED_HOSTS")
+        return
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise WebhookTargetRejected(f"webhook_url host {host} cannot be resolved: {e}")
+    if not infos or not all(is_public_address(info[4][0]) for info in infos):
+        raise WebhookTargetRejected(f"webhook_url host {host} is not a public address")
+
+
+def public_address_resolver(allowed_hosts: Sequence[str] = ()):
+    """
+    aiohttp resolver that only connects to public addresses, except for allowed hosts.
+
+    Checking a URL before the request is not enough on its own: DNS may
+    answer differently by the time the connection is made. Hosts that are
+    IP addresses are not passed to resolvers; check_webhook_url() covers those.
+    """
+    from aiohttp.resolver import DefaultResolver
+
+    class PublicAddressResolver(DefaultResolver):
+        async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict[str, Any]]:
+            hosts = await super().resolve(host, port, family)
+            if host_allowed(host, allowed_hosts):
+                return hosts
+            public = [info for info in hosts if is_public_address(info["host"])]
+            if not public:
+                raise OSError(f"{host} does not resolve to a public address")
+            return public
+
+    return PublicAddressResolver()
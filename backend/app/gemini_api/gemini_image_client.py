@@ -1,6 +1,14 @@
 from config.settings import Settings
-from google import genai
-from google.genai import types
+from app.core.upstream_activity import get_upstream_activity
+from app.core.upstream_scheduler import get_upstream_scheduler
+from app.core.metrics import UpstreamTimer, record_fallback, record_image_written
+from app.core.tracing import span
+from app.core.structured_logging import SAMPLED
+from app.core.upstream_replay import get_upstream_recorder
+from app.core.deadlines import DeadlineExceeded, with_deadline
+from app.core.upstream_clients import get_genai_client
+from functools import lru_cache
+import asyncio
 import logging
 import os
 import uuid
@@ -8,12 +16,13 @@ import time
 import base64
 import re
 import io
-from typing import Dict, Any, Tuple
-from PIL import Image, ImageDraw, ImageFont
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 from io import BytesIO
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# google.genai and PIL are slow to import, so they are loaded on first use (see app.core.warmup)
+if TYPE_CHECKING:
+    from google.genai import types
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,13 +34,10 @@ class GeminiImageClient:
         self.api_key = os.environ.get("GEMINI_API_KEY", settings.GEMINI_API_KEY)
         self.model = "gemini-2.0-flash-exp-image-generation"
         self.output_dir = os.path.join(settings.STATIC_DIR, "generated_images")
+        self.recorder = get_upstream_recorder(settings)
         
-        # Ensure output directory exists
-        os.makedirs(self.output_dir, exist_ok=True)
-        
-        logger.info(f"GeminiImageClient initialized with API key: {self.api_key[:4]}...{self.api_key[-4:]}")
-        logger.info(f"Using model: {self.model}")
-        logger.info(f"Output directory: {self.output_dir}")
+        # Clients are created per request; the directory is set up once per process
+        _prepare_output_dir(self.output_dir, self.model, bool(self.api_key))
     
     async def generate_image(self, prompt: str, filename_prefix: str = None) -> Dict[str, Any]:
         """
@@ -44,11 +50,18 @@ class GeminiImageClient:
         Returns:
             Dictionary containing success status, file path, and any error message
         """
+        with span("gemini_image.generate", model=self.model) as image_span:
+            result = await self._generate_image(prompt, filename_prefix)
+            image_span.set_attribute("success", result.get("success"))
+            return result
+    
+    async def _generate_image(self, prompt: str, filename_prefix: str = None) -> Dict[str, Any]:
+        """Generate and save one image, falling back to a placeholder image on errors"""
         try:
-            logger.info(f"Generating image with prompt: {prompt[:50]}...")
+            logger.debug("Generating image", extra={"prompt": prompt[:50]})
             
-            # Check if API key is present
-            if not self.api_key:
+            # Check if API key is present (replay mode never reaches the network)
+            if not self.api_key and not (self.recorder is not None and self.recorder.replaying):
                 error_msg = "GEMINI_API_KEY is not set or is empty"
                 logger.error(error_msg)
                 return {
@@ -58,10 +71,6 @@ class GeminiImageClient:
                     "error": error_msg
                 }
             
-            # Initialize client - using the method from simple_gemini_test.py
-            logger.info("Initializing Gemini client...")
-            client = genai.Client(api_key=self.api_key)
-            
             # Generate a unique filename
             unique_id = str(uuid.uuid4())[:8]
             prefix = filename_prefix if filename_prefix else prompt[:10]
@@ -69,170 +78,205 @@ class GeminiImageClient:
             filename = f"___{''.join(c if c.isalnum() or c == '_' else '_' for c in sanitized_prefix)}_{unique_id}.png"
             file_path = os.path.join(self.output_dir, filename)
             
-            logger.info(f"Will save to file path: {file_path}")
-            
             # Generate image using Gemini - using the method from simple_gemini_test.py
-            logger.info(f"Calling Gemini model {self.model}...")
-            
             try:
                 # Try with a timeout
-                response = client.models.generate_content(
-                    model=self.model,
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        response_modalities=['Text', 'Image']
-                    )
-                )
+                async with get_upstream_scheduler(self.settings).slot("gemini_image"), get_upstream_activity().track():
+                    with span("gemini_image.upstream", model=self.model), \
+                            UpstreamTimer("gemini_image", self.model, "image"):
+                        response = await self._generate_content(prompt)
             except Exception as gen_err:
-                logger.error(f"Error calling Gemini API: {str(gen_err)}")
+                logger.warning("Error calling Gemini API: %s", gen_err)
+                if isinstance(gen_err, DeadlineExceeded):
+                    record_fallback("gemini_image", "deadline")
                 # Return fallback image
-                return self._create_fallback_image(file_path, f"API Error: {str(gen_err)}", prompt)
-            
-            logger.info(f"Response received, type: {type(response)}")
+                return await asyncio.to_thread(self._create_fallback_image, file_path, f"API Error: {str(gen_err)}", prompt)
             
             # Process response to extract and save image
             if not hasattr(response, 'candidates') or len(response.candidates) == 0:
                 error_msg = "No candidates found in the response"
                 logger.error(error_msg)
-                return self._create_fallback_image(file_path, error_msg, prompt)
+                return await asyncio.to_thread(self._create_fallback_image, file_path, error_msg, prompt)
                 
             if not hasattr(response.candidates[0], 'content') or not hasattr(response.candidates[0].content, 'parts'):
                 error_msg = "No content or parts found in the response"
                 logger.error(error_msg)
-                return self._create_fallback_image(file_path, error_msg, prompt)
+                return await asyncio.to_thread(self._create_fallback_image, file_path, error_msg, prompt)
             
-            # Process each part of the response, based on simple_gemini_test.py approach
-            image_saved = False
-            rel_path = None
+            # Decode, validate and write the image file without blocking the event loop
+            image_url = await asyncio.to_thread(self._save_image, response.candidates[0].content.parts, file_path)
+            
+            # If we successfully saved the image, return success
+            if image_url is not None:
+                record_image_written("gemini", "generated", os.path.getsize(file_path))
+                
+                return {
+                    "success": True,
+                    "file_path": file_path,
+                    "image_url": image_url,
+                    "error": None
+                }
             
-            for part in response.candidates[0].content.parts:
-                logger.info(f"Processing part: {type(part)}")
+            # If we reach here, no image was saved - create a fallback image
+            return await asyncio.to_thread(self._create_fallback_image, file_path, "No valid image data found in response", prompt)
                 
+        except Exception as e:
+            error_msg = f"Error generating image with Gemini API: {str(e)}"
+            logger.exception(error_msg)
+            
+            # Create fallback image
+            return await asyncio.to_thread(self._create_fallback_image, file_path, error_msg, prompt)
+    
+    def _save_image(self, parts: List[Any], file_path: str) -> Optional[str]:
+        """
+        Decode, validate and write the image in the parts of a response.
+        
+        Blocking (PIL and file I/O), so it is run in a thread.
+        
+        Returns:
+            URL of the saved image, or None if no part held valid image data
+        """
+        # Process each part of the response, based on simple_gemini_test.py approach
+        image_saved = False
+        image_url = None
+        
+        from PIL import Image
+        with span("gemini_image.save") as save_span:
+            for part in parts:
+                logger.debug("Processing response part %s", type(part).__name__, extra=SAMPLED)
+            
                 # Check for text that might contain base64 encoded image
                 if hasattr(part, 'text') and part.text is not None:
-                    logger.info(f"Found text response: {part.text[:100]}...")
-                    
+                    logger.debug("Found text response: %.100s", part.text, extra=SAMPLED)
+                
                     # Check for base64 encoded image in text
                     # Sometimes Gemini returns base64 data in text
                     base64_match = re.search(r'data:image\/[^;]+;base64,([^"]+)', part.text)
                     if base64_match:
                         try:
-                            logger.info("Found base64 image data in text, decoding...")
+                            logger.debug("Found base64 image data in text, decoding")
                             base64_data = base64_match.group(1)
                             image_data = base64.b64decode(base64_data)
-                            
+                        
                             # Try to validate image data before saving
                             try:
                                 img = Image.open(io.BytesIO(image_data))
                                 img.verify()  # Verify it's a valid image
-                                logger.info(f"Base64 image validated: {img.format}, {img.size}")
-                                
+                                logger.debug("Base64 image validated: %s, %s", img.format, img.size)
+                            
                                 # Save the validated image
                                 with open(file_path, "wb") as f:
                                     f.write(image_data)
-                                    
+                                
                                 image_saved = True
                                 rel_path = os.path.relpath(file_path, self.settings.STATIC_DIR)
                                 image_url = f"/static/{rel_path}"
-                                logger.info(f"Base64 image from text saved to {file_path}")
+                                logger.debug("Base64 image from text saved to %s", file_path)
                             except Exception as validate_err:
-                                logger.error(f"Base64 image validation failed: {validate_err}")
+                                logger.warning("Base64 image validation failed: %s", validate_err)
                         except Exception as text_b64_err:
-                            logger.error(f"Error decoding base64 from text: {str(text_b64_err)}")
-                
+                            logger.warning("Error decoding base64 from text: %s", text_b64_err)
+            
                 # Check for inline image data
                 if hasattr(part, 'inline_data') and part.inline_data is not None:
                     mime_type = getattr(part.inline_data, 'mime_type', 'image/png')
-                    logger.info(f"Found inline data with mime type: {mime_type}")
-                    
+                    logger.debug("Found inline data with mime type %s", mime_type, extra=SAMPLED)
+                
                     if hasattr(part.inline_data, 'data'):
                         # Don't write directly to a file - validate the data first
                         try:
-                            logger.info("Validating image data before saving...")
                             img_bytes = part.inline_data.data
-                            
+                        
                             # Try to open and validate image directly from bytes
                             try:
                                 img = Image.open(io.BytesIO(img_bytes))
                                 img.verify()  # Verify it's a valid image
-                                
+                            
                                 # If we get here, the image is valid - save it
                                 with open(file_path, "wb") as f:
                                     f.write(img_bytes)
-                                logger.info(f"Valid image saved to {file_path}")
-                                
+                                logger.debug("Valid image saved to %s", file_path)
+                            
                                 image_saved = True
                                 rel_path = os.path.relpath(file_path, self.settings.STATIC_DIR)
                                 image_url = f"/static/{rel_path}"
                             except Exception as direct_err:
-                                logger.error(f"Direct image validation failed: {direct_err}")
-                                
+                                logger.debug("Direct image validation failed, trying base64: %s", direct_err)
+                            
                                 # Try base64 decoding as fallback
                                 try:
-                                    logger.info("Trying base64 decoding...")
                                     decoded_data = base64.b64decode(img_bytes)
-                                    
+                                
                                     # Try to validate the decoded data
                                     try:
                                         img = Image.open(io.BytesIO(decoded_data))
                                         img.verify()  # Verify it's a valid image
-                                        
+                                    
                                         # Valid image, save it
                                         with open(file_path, "wb") as f:
                                             f.write(decoded_data)
-                                        logger.info(f"Base64 decoded image saved to {file_path}")
-                                        
+                                        logger.debug("Base64 decoded image saved to %s", file_path)
+                                    
                                         image_saved = True
                                         rel_path = os.path.relpath(file_path, self.settings.STATIC_DIR)
                                         image_url = f"/static/{rel_path}"
                                     except Exception as b64_validate_err:
-                                        logger.error(f"Base64 decoded image validation failed: {b64_validate_err}")
-                                        
+                                        logger.debug("Base64 decoded image validation failed, converting: %s", b64_validate_err)
+                                    
                                         # One last attempt: Try saving the decoded data as a PNG
                                         try:
-                                            logger.info("Attempting to convert data to PNG...")
                                             img = Image.open(io.BytesIO(decoded_data))
                                             img.save(file_path, format="PNG")
-                                            logger.info(f"Converted image saved to {file_path}")
-                                            
+                                            logger.debug("Converted image saved to %s", file_path)
+                                        
                                             image_saved = True
                                             rel_path = os.path.relpath(file_path, self.settings.STATIC_DIR)
                                             image_url = f"/static/{rel_path}"
                                         except Exception as convert_err:
-                                            logger.error(f"Image conversion failed: {convert_err}")
+                                            logger.warning("Image conversion failed: %s", convert_err)
                                 except Exception as b64_err:
-                                    logger.error(f"Base64 decoding failed: {b64_err}")
+                                    logger.warning("Base64 decoding failed: %s", b64_err)
                         except Exception as validate_err:
-                            logger.error(f"Image validation process failed: {validate_err}")
-            
-            # If we successfully saved the image, return success
-            if image_saved:
-                # Add a small delay to ensure file is written
-                time.sleep(0.5)
-                
-                return {
-                    "success": True,
-                    "file_path": file_path,
-                    "image_url": image_url,
-                    "error": None
-                }
-            
-            # If we reach here, no image was saved - create a fallback image
-            return self._create_fallback_image(file_path, "No valid image data found in response", prompt)
-                
+                            logger.warning("Image validation process failed: %s", validate_err)
+            save_span.set_attribute("saved", image_saved)
+        return image_url if image_saved else None
+    
+    async def _generate_content(self, prompt: str) -> "types.GenerateContentResponse":
+        """Call generate_content, recording the call in record mode or answering it from a recording in replay mode"""
+        request = {"model": self.model, "contents": prompt, "response_modalities": ['Text', 'Image']}
+        if self.recorder is not None and self.recorder.replaying:
+            interaction = await with_deadline(self.recorder.replay_call("gemini", "generate_content", request), self.settings.IMAGE_TIMEOUT)
+            return _response_from_recording(interaction.response)
+        
+        # Shared client, so requests reuse its open connections
+        from google.genai import types
+        client = get_genai_client(self.api_key, self.settings.GEMINI_API_BASE_URL)
+        
+        started = time.perf_counter()
+        try:
+            # Async call, so the request budget can interrupt it and the event loop is not blocked
+            response = await with_deadline(client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_modalities=['Text', 'Image']
+                )
+            ), self.settings.IMAGE_TIMEOUT)
         except Exception as e:
-            error_msg = f"Error generating image with Gemini API: {str(e)}"
-            logger.error(error_msg)
-            import traceback
-            logger.error(traceback.format_exc())
-            
-            # Create fallback image
-            return self._create_fallback_image(file_path, error_msg, prompt)
+            if self.recorder is not None:
+                self.recorder.record_call("gemini", "generate_content", request, started, error=str(e))
+            raise
+        if self.recorder is not None:
+            self.recorder.record_call("gemini", "generate_content", request, started,
+                                      response=response.model_dump(mode="json", exclude_none=True))
+        return response
     
     def _create_fallback_image(self, file_path: str, error_msg: str, prompt: str) -> Dict[str, Any]:
         """Create a fallback image with error message and prompt text"""
-        logger.warning(f"Creating fallback image: {error_msg}")
+        logger.warning("Creating fallback image: %s", error_msg)
         try:
+            from PIL import Image, ImageDraw
+            
             # Create a simple fallback image with text
             img = Image.new('RGB', (800, 600), color=(255, 255, 255))
             draw = ImageDraw.Draw(img)
@@ -251,13 +295,16 @@ class GeminiImageClient:
             draw.rectangle([(10, 10), (790, 590)], outline=(200, 200, 200))
             
             # Save the image
-            img.save(file_path, "PNG")
+            with span("gemini_image.save_fallback", reason=error_msg[:200]):
+                img.save(file_path, "PNG")
+            record_image_written("gemini", "fallback", os.path.getsize(file_path))
+            record_fallback("gemini_image", "fallback_image")
             
             # Get the relative path for URL generation
             rel_path = os.path.relpath(file_path, self.settings.STATIC_DIR)
             image_url = f"/static/{rel_path}"
             
-            logger.info(f"Fallback image saved, URL: {image_url}")
+            logger.debug("Fallback image saved, URL: %s", image_url)
             
             return {
                 "success": True,
@@ -266,7 +313,7 @@ class GeminiImageClient:
                 "error": None
             }
         except Exception as fallback_error:
-            logger.error(f"Error creating fallback image: {str(fallback_error)}")
+            logger.exception("Error creating fallback image: %s", fallback_error)
             
             # As a last resort, return an error
             return {
@@ -297,3 +344,25 @@ class GeminiImageClient:
                 lines.append(' '.join(current_line))
             
         return '\n'.join(lines)
+
+
+@lru_cache(maxsize=None)
+def _prepare_output_dir(output_dir: str, model: str, api_key_present: bool) -> None:
+    """Create the image output directory and log the client configuration, once per process"""
+    os.makedirs(output_dir, exist_ok=True)
+    logger.debug("Gemini image client configured", extra={
+        "model": model,
+        "output_dir": output_dir,
+        "api_key_present": api_key_present
+    })
+
+
+def _response_from_recording(data: Dict[str, Any]) -> "types.GenerateContentResponse":
+    """Rebuild a recorded response; inline image data is stored base64-encoded"""
+    from google.genai import types
+    response = types.GenerateContentResponse.model_validate(data)
+    for candidate in response.candidates or []:
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if part.inline_data is not None and part.inline_data.data:
+                part.inline_data.data = base64.b64decode(part.inline_data.data)
+    return response
@@ -73,6 +73,7 @@ class DeepResearchResponse(BaseModel):
     related_topics: List[RelatedTopic] = Field(..., description="Suggested related topics for further research")
     key_concepts: List[str] = Field(..., description="List of key concepts covered")
     visualization_prompts: List[str] = Field(..., description="Prompts for generating visualizations")
+    url: Optional[str] = Field(None, description="Cacheable GET URL of this research (None if it was served from a fallback)")
     
     class Config:
         schema_extra = {
@@ -105,3 +106,32 @@ class DeepResearchResponse(BaseModel):
                 ]
             }
         }
+
+class OutlineSection(BaseModel):
+    """Model for one section of a research outline"""
+    title: str = Field(..., description="Section title")
+    summary: str = Field("", description="One-sentence summary of the section")
+
+class ResearchOutlineResponse(BaseModel):
+    """Response model for a research outline"""
+    topic: str = Field(..., description="Research topic")
+    academic_level: str = Field(..., description="Academic level of the outline")
+    sections: List[OutlineSection] = Field(..., description="Planned content sections")
+    introduction: Optional[str] = Field(None, description="Introduction in markdown format (if generated)")
+    cached: bool = Field(..., description="Whether the outline was served from the research cache")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "topic": "quantum cryptography",
+                "academic_level": "undergraduate",
+                "sections": [
+                    {
+                        "title": "Quantum Key Distribution",
+                        "summary": "How protocols such as BB84 use quantum states to share secret keys."
+                    }
+                ],
+                "introduction": None,
+                "cached": True
+            }
+        }
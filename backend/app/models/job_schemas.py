@@ -0,0 +1,86 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+
+class JobRequest(BaseModel):
+    """Request model for submitting a background job"""
+    kind: str = Field(..., description="Job kind: deep_research, images or curriculum")
+    params: Dict[str, Any] = Field(..., description="Parameters of the job kind (see the kind's schema)")
+    webhook_url: Optional[str] = Field(None, description="URL notified with a POST of the job once it has finished (optional)")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "kind": "deep_research",
+                "params": {
+                    "topic": "quantum computing",
+                    "academic_level": "undergraduate",
+                    "include_references": True
+                },
+                "webhook_url": "https://example.com/hooks/eduai"
+            }
+        }
+
+class ImageBatchJobParams(BaseModel):
+    """Parameters of an images job"""
+    prompts: List[str] = Field(..., min_length=1, max_length=50, description="Image prompts, one image each")
+    provider: str = Field("nvidia", pattern="^(nvidia|gemini)$", description="Image API: nvidia or gemini")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "prompts": ["Diagram of the water cycle", "Cross-section of a plant cell"],
+                "provider": "nvidia"
+            }
+        }
+
+class CurriculumJobParams(BaseModel):
+    """Parameters of a curriculum job"""
+    topics: List[str] = Field(..., min_length=1, max_length=100, description="Topics of the curriculum, one lesson each")
+    audience: str = Field(..., description="Target audience level of all lessons")
+    generate_images: bool = Field(False, description="Also generate an image for the first image prompt of each lesson")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "topics": ["Photosynthesis", "Cellular respiration", "The carbon cycle"],
+                "audience": "high school",
+                "generate_images": False
+            }
+        }
+
+class JobProgress(BaseModel):
+    """Model for the progress of a job"""
+    completed: int = Field(..., description="Items completed")
+    total: int = Field(..., description="Items in the job")
+    message: Optional[str] = Field(None, description="What the job is doing")
+
+class JobResponse(BaseModel):
+    """Response model for a background job"""
+    id: str = Field(..., description="Job ID")
+    kind: str = Field(..., description="Job kind")
+    status: str = Field(..., description="queued, running, succeeded, failed or cancelled")
+    progress: JobProgress = Field(..., description="Progress of the job")
+    result: Optional[Any] = Field(None, description="Result once the job has succeeded")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+    attempts: int = Field(..., description="Times the job has been started")
+    webhook_status: Optional[str] = Field(None, description="Delivery status of the webhook: pending, delivered or failed")
+    created_at: float = Field(..., description="Submission time (Unix seconds)")
+    started_at: Optional[float] = Field(None, description="Start time of the last attempt (Unix seconds)")
+    finished_at: Optional[float] = Field(None, description="Completion time (Unix seconds)")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "3f6c1c1e8d2a4b7f9e0a5d4c3b2a1f0e",
+                "kind": "curriculum",
+                "status": "running",
+                "progress": {"completed": 1, "total": 3, "message": "Generated Photosynthesis"},
+                "result": None,
+                "error": None,
+                "attempts": 1,
+                "webhook_status": None,
+                "created_at": 1735689600.0,
+                "started_at": 1735689600.2,
+                "finished_at": None
+            }
+        }
@@ -0,0 +1,58 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+
+class LessonSummary(BaseModel):
+    """Model for a lesson found in the lesson library"""
+    id: str = Field(..., description="Lesson ID, for GET /api/lessons/{id}")
+    kind: str = Field(..., description="content (educational content) or research (deep research)")
+    topic: str = Field(..., description="Topic the lesson was generated for")
+    audience: str = Field(..., description="Audience or academic level it was written for")
+    model: Optional[str] = Field(None, description="Model that generated it")
+    created_at: float = Field(..., description="Generation time (Unix seconds)")
+    snippet: str = Field(..., description="Matching text, with the matched words in **bold**")
+    score: float = Field(..., description="Relevance (higher is better)")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "9b1f0c4e2d7a4c3e8f6a5b4c3d2e1f0a",
+                "kind": "content",
+                "topic": "Photosynthesis",
+                "audience": "high school",
+                "model": "nvidia/llama-3.3-nemotron-super-49b-v1",
+                "created_at": 1735689600.0,
+                "snippet": "…plants use **photosynthesis** to turn light energy into chemical energy…",
+                "score": 4.2187
+            }
+        }
+
+class LessonSearchResponse(BaseModel):
+    """Response model for a lesson library search"""
+    query: str = Field(..., description="The search")
+    results: List[LessonSummary] = Field(..., description="Matching lessons, best first")
+
+class LessonResponse(BaseModel):
+    """Response model for a lesson of the library"""
+    id: str = Field(..., description="Lesson ID")
+    kind: str = Field(..., description="content (educational content) or research (deep research)")
+    topic: str = Field(..., description="Topic the lesson was generated for")
+    audience: str = Field(..., description="Audience or academic level it was written for")
+    model: Optional[str] = Field(None, description="Model that generated it")
+    created_at: float = Field(..., description="Generation time (Unix seconds)")
+    content: Dict[str, Any] = Field(..., description="The lesson as generated: a ContentResponse or DeepResearchResponse")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "9b1f0c4e2d7a4c3e8f6a5b4c3d2e1f0a",
+                "kind": "content",
+                "topic": "Photosynthesis",
+                "audience": "high school",
+                "model": "nvidia/llama-3.3-nemotron-super-49b-v1",
+                "created_at": 1735689600.0,
+                "content": {
+                    "explanation": "# Photosynthesis\n\nPhotosynthesis is the process...",
+                    "image_prompts": ["Diagram of a leaf cross-section showing chloroplasts"]
+                }
+            }
+        }
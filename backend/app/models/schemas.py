@@ -29,6 +29,7 @@ class ContentResponse(BaseModel):
     """Response model for educational content"""
     explanation: str = Field(..., description="Educational text explanation in markdown format")
     image_prompts: List[str] = Field(..., description="List of image prompts for visual representations")
+    url: Optional[str] = Field(None, description="Cacheable GET URL of this lesson (None if it was served from a fallback)")
     
     class Config:
         schema_extra = {
@@ -37,10 +38,42 @@ class ContentResponse(BaseModel):
                 "image_prompts": [
                     "Educational diagram showing the process of photosynthesis for high school students",
                     "Visual representation of key concepts in photosynthesis appropriate for high school level"
-                ]
+                ],
+                "url": "/api/content/5d41402abc4b2a76b9719d911017c592"
             }
         }
 
+class MultiAudienceContentRequest(BaseModel):
+    """Request model for one lesson written for several audiences"""
+    topic: str = Field(..., description="Educational topic to generate content for")
+    audiences: List[str] = Field(
+        default_factory=lambda: ["elementary", "middle-school", "high-school", "college", "graduate"],
+        min_length=1, max_length=8,
+        description="Target audience levels (default: all five levels)"
+    )
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "topic": "photosynthesis",
+                "audiences": ["elementary", "high-school", "college"]
+            }
+        }
+
+class AudienceVariant(BaseModel):
+    """The lesson for one audience"""
+    audience: str = Field(..., description="Target audience level")
+    explanation: str = Field(..., description="Educational text explanation in markdown format")
+    image_prompts: List[str] = Field(..., description="List of image prompts for visual representations")
+    cached: bool = Field(..., description="Whether the lesson was served from the cache")
+    url: Optional[str] = Field(None, description="Cacheable GET URL of this lesson (None if it was served from a fallback)")
+
+class MultiAudienceContentResponse(BaseModel):
+    """Response model for one lesson written for several audiences"""
+    topic: str = Field(..., description="Educational topic")
+    outline: Optional[str] = Field(None, description="Outline and fact base the lessons were written from (None if all were cached)")
+    variants: List[AudienceVariant] = Field(..., description="The lesson of each audience, in the order requested")
+
 class ContentStreamChunk(BaseModel):
     """Model for a chunk of the streaming content response"""
     chunk: str = Field(..., description="A chunk of the generated text")
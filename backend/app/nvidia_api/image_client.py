@@ -1,5 +1,10 @@
 from config.settings import Settings
-import aiohttp
+from app.core.upstream_activity import get_upstream_activity
+from app.core.upstream_scheduler import get_upstream_scheduler
+from app.core.metrics import UpstreamTimer
+from app.core.tracing import span
+from app.core.deadlines import with_deadline
+from app.core.upstream_clients import get_http_session
 import json
 from typing import Dict, Any
 
@@ -10,7 +15,11 @@ class NvidiaImageClient:
         self.settings = settings
         self.base_url = settings.NVIDIA_API_BASE_URL
         self.api_key = settings.NVIDIA_API_KEY
-        self.model_id = settings.IMAGE_MODEL_ID
+    
+    @property
+    def model_id(self) -> str:
+        """Image model for the current request (IMAGE_MODEL_ID, unless overridden for the request)"""
+        return self.settings.current("IMAGE_MODEL_ID")
     
     async def generate_image(self, prompt: str) -> str:
         """
@@ -23,7 +32,7 @@ class NvidiaImageClient:
             URL to the generated image
         """
         # If using mock data, don't call the API
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             raise Exception("API should not be called in mock mode")
         
         # Prepare API request payload
@@ -40,23 +49,31 @@ class NvidiaImageClient:
             "Authorization": f"Bearer {self.api_key}"
         }
         
-        # Call NVIDIA's text-to-image API
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/image",
-                headers=headers,
-                json=payload
-            ) as response:
-                # Check for successful response
-                if response.status != 200:
-                    error_data = await response.text()
-                    raise Exception(f"NVIDIA image API error ({response.status}): {error_data}")
-                
-                # Parse response
-                data = await response.json()
-                
-                # Extract image URL from the response
-                # Note: Adjust based on actual API response structure
-                image_url = data.get("image_url", "")
-                
-                return image_url
+        # Call NVIDIA's text-to-image API within the request budget
+        async with get_upstream_scheduler(self.settings).slot("nvidia_image"), get_upstream_activity().track():
+            with span("nvidia_image.generate", model=self.model_id, size=self.settings.IMAGE_SIZE), \
+                    UpstreamTimer("nvidia_image", self.model_id, "image"):
+                return await with_deadline(self._post(payload, headers), self.settings.IMAGE_TIMEOUT)
+    
+    async def _post(self, payload: Dict[str, Any], headers: Dict[str, str]) -> str:
+        """Send one image request and return the image URL"""
+        # Pooled session, so requests reuse open connections
+        session = get_http_session()
+        async with session.post(
+            f"{self.base_url}/image",
+            headers=headers,
+            json=payload
+        ) as response:
+            # Check for successful response
+            if response.status != 200:
+                error_data = await response.text()
+                raise Exception(f"NVIDIA image API error ({response.status}): {error_data}")
+        
+            # Parse response
+            data = await response.json()
+        
+            # Extract image URL from the response
+            # Note: Adjust based on actual API response structure
+            image_url = data.get("image_url", "")
+        
+            return image_url
@@ -1,9 +1,34 @@
-import aiohttp
 import json
-from typing import Dict, Any, List, AsyncGenerator
+from typing import Dict, Any, List, AsyncGenerator, Optional, Union
 from config.settings import Settings
-from openai import OpenAI, AsyncOpenAI
+from app.core.upstream_activity import get_upstream_activity
+from app.core.upstream_scheduler import UpstreamPreempted, get_upstream_scheduler
+from app.core.metrics import LLM_TOKENS, LLM_TOKENS_SAVED, LLM_TRUNCATED, UpstreamTimer
+from app.core.tracing import current_span, span
+from app.core.prompt_templates import system_template
+from app.core.token_accounting import PromptSpec, TokenUsage, estimate_tokens, get_token_ledger, tokens_for_length
+from app.core.upstream_replay import get_upstream_recorder, request_key
+from app.core.single_flight import get_stream_flights
+from app.core.deadlines import DeadlineExceeded, iterate_with_deadline, with_deadline
+from app.core.upstream_clients import get_openai_client
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ResponseTruncated(Exception):
+    """
+    A completion stopped at its output token budget (finish_reason "length").
+    
+    The text is usable but incomplete, so callers should not cache or store it.
+    """
+    
+    def __init__(self, request_type: str, max_tokens: int, text: str = ""):
+        super().__init__(f"{request_type} completion was cut off at {max_tokens} output tokens")
+        self.request_type = request_type
+        self.max_tokens = max_tokens
+        self.text = text  # The truncated text (empty for streams, whose text was already yielded)
 
 class LLMClient:
     """Client for LLM API endpoints (using OpenAI SDK)"""
@@ -12,116 +37,332 @@ class LLMClient:
         self.settings = settings
         self.api_type = settings.LLM_API_TYPE
         
-        # Print debugging information
-        print(f"DEBUG LLM Client - API Base URL: {settings.LLM_API_BASE_URL}")
-        print(f"DEBUG LLM Client - API Key Present: {settings.LLM_API_KEY is not None}")
-        print(f"DEBUG LLM Client - NVIDIA API Key Present: {settings.NVIDIA_API_KEY is not None}")
-        print(f"DEBUG LLM Client - Model ID: {settings.LLM_MODEL_ID}")
-        
         # Use NVIDIA_API_KEY if LLM_API_KEY is not set
         api_key = settings.LLM_API_KEY
         if not api_key and settings.NVIDIA_API_KEY:
             api_key = settings.NVIDIA_API_KEY
-            print("DEBUG LLM Client: Using NVIDIA_API_KEY instead of LLM_API_KEY")
         
+        # Replay mode never reaches the network, so it needs no key
+        self.recorder = get_upstream_recorder(settings)
+        if not api_key and self.recorder is not None and self.recorder.replaying:
+            api_key = "replay"
+        
+        # Clients are created per request, so configuration details are only logged at DEBUG
+        logger.debug("LLM client created", extra={
+            "base_url": settings.LLM_API_BASE_URL,
+            "model": settings.LLM_MODEL_ID,
+            "api_key_present": api_key is not None
+        })
         if not api_key:
-            print("WARNING: No API key provided for LLM client")
+            logger.warning("No API key provided for LLM client")
         
-        self.client = OpenAI(
-            base_url=settings.LLM_API_BASE_URL,
-            api_key=api_key
-        )
-        self.async_client = AsyncOpenAI(
-            base_url=settings.LLM_API_BASE_URL,
-            api_key=api_key
-        )
-        self.model_id = settings.LLM_MODEL_ID
+        # The OpenAI SDK is slow to import, so it is only loaded (and the clients created) on first use
+        self._api_key = api_key
+        self._client = None
+        self.last_usage: Optional[TokenUsage] = None
+    
+    @property
+    def model_id(self) -> str:
+        """Model for the current request (LLM_MODEL_ID, unless overridden for the request)"""
+        return self.settings.current("LLM_MODEL_ID")
     
-    async def generate_text(self, prompt: str) -> str:
+    @property
+    def client(self):
+        """Synchronous OpenAI SDK client"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.settings.LLM_API_BASE_URL, api_key=self._api_key)
+        return self._client
+    
+    @property
+    def async_client(self):
+        """Asynchronous OpenAI SDK client, shared by all LLM clients so connections are reused"""
+        return get_openai_client(self.settings.LLM_API_BASE_URL, self._api_key)
+    
+    async def generate_text(self, prompt: Union[str, PromptSpec], max_tokens: Optional[int] = None, request_type: str = "default") -> str:
         """
         Generate text using LLM API.
         
         Args:
-            prompt: Text prompt for the LLM
+            prompt: Text prompt for the LLM, or a PromptSpec carrying its own budget and request type
+            max_tokens: Output token budget (defaults to LLM_MAX_TOKENS)
+            request_type: Request type recorded in the token accounting
             
         Returns:
             Generated text response
+            
+        Raises:
+            ResponseTruncated: If the completion hit its budget, also after one retry with a larger budget
         """
         # If using mock data, don't call the API
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             raise Exception("API should not be called in mock mode")
         
+        budget_key = None
+        if isinstance(prompt, PromptSpec):
+            prompt, max_tokens, request_type, budget_key = (
+                prompt.prompt, max_tokens or prompt.max_tokens, prompt.request_type, prompt.budget_key
+            )
+        
+        max_tokens = max_tokens or self.settings.current("LLM_MAX_TOKENS")
         try:
-            return await self._generate_text_openai(prompt)
+            with span("llm.generate", model=self.model_id, request_type=request_type, max_tokens=max_tokens):
+                async with get_upstream_scheduler(self.settings).slot("llm"), get_upstream_activity().track():
+                    text, finish_reason = await self._generate_text_openai(prompt, max_tokens, request_type, budget_key)
+                    retry_tokens = self._retry_budget(prompt, max_tokens) if finish_reason == "length" else None
+                    if retry_tokens is not None:
+                        logger.warning("Completion cut off at its output budget, retrying with a larger one", extra={
+                            "request_type": request_type, "max_tokens": max_tokens, "retry_max_tokens": retry_tokens
+                        })
+                        max_tokens = retry_tokens
+                        text, finish_reason = await self._generate_text_openai(prompt, max_tokens, request_type, budget_key)
+            if finish_reason == "length":
+                raise ResponseTruncated(request_type, max_tokens, text or "")
+            return text
+        except (UpstreamPreempted, ResponseTruncated):
+            raise
         except Exception as e:
-            print(f"Error generating text with OpenAI API: {str(e)}")
+            logger.error("Error generating text with OpenAI API: %s", e, extra={"model": self.model_id, "request_type": request_type})
             raise
         
-    async def _generate_text_openai(self, prompt: str) -> str:
-        """Generate text using OpenAI API"""
-        try:
-            # Prepare messages
-            messages = [
-                {"role": "system", "content": self.settings.LLM_SYSTEM_MESSAGE},
+    def _chat_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Chat completion parameters, also used as the record/replay key"""
+        return {
+            "model": self.model_id,
+            "messages": [
+                {"role": "system", "content": system_template(self.settings.LLM_SYSTEM_MESSAGE).text},
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            "temperature": self.settings.current("LLM_TEMPERATURE"),
+            "top_p": self.settings.LLM_TOP_P,
+            "max_tokens": max_tokens,
+            "frequency_penalty": self.settings.LLM_FREQUENCY_PENALTY,
+            "presence_penalty": self.settings.LLM_PRESENCE_PENALTY
+        }
+    
+    def _retry_budget(self, prompt: str, max_tokens: int) -> Optional[int]:
+        """Doubled output budget for retrying a truncated completion, or None if it cannot grow"""
+        if not self.settings.LLM_RETRY_TRUNCATED:
+            return None
+        limit = min(self.settings.current("LLM_MAX_TOKENS"), self.settings.LLM_CONTEXT_WINDOW - self._estimate_prompt_tokens(prompt))
+        retry_tokens = min(max_tokens * 2, limit)
+        return retry_tokens if retry_tokens > max_tokens else None
+    
+    async def _generate_text_openai(self, prompt: str, max_tokens: int, request_type: str,
+                                    budget_key: Optional[str] = None) -> tuple:
+        """
+        Generate text using OpenAI API.
+        
+        Returns:
+            (generated text, finish reason reported by the API, or None)
+        """
+        try:
+            request = self._chat_request(prompt, max_tokens)
             
-            # Call OpenAI API
-            completion = await self.async_client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                temperature=self.settings.LLM_TEMPERATURE,
-                top_p=self.settings.LLM_TOP_P,
-                max_tokens=self.settings.LLM_MAX_TOKENS,
-                frequency_penalty=self.settings.LLM_FREQUENCY_PENALTY,
-                presence_penalty=self.settings.LLM_PRESENCE_PENALTY,
-                stream=False  # Set to False for regular responses
-            )
+            with UpstreamTimer("llm", self.model_id, "chat"):
+                if self.recorder is not None and self.recorder.replaying:
+                    interaction = await with_deadline(self.recorder.replay_call("llm", "chat", request), self.settings.LLM_TIMEOUT)
+                    generated_text, usage, finish_reason = interaction.response, interaction.usage, interaction.finish_reason
+                else:
+                    generated_text, usage, finish_reason = await with_deadline(self._call_chat(request), self.settings.LLM_TIMEOUT)
+            
+            truncated = finish_reason == "length"
+            if usage is not None:
+                self._record_usage(request_type, max_tokens, usage["prompt_tokens"], usage["completion_tokens"], estimated=False, streamed=False,
+                                   truncated=truncated, budget_key=budget_key)
+            else:
+                self._record_usage(request_type, max_tokens, self._estimate_prompt_tokens(prompt), estimate_tokens(generated_text or ""), estimated=True, streamed=False,
+                                   truncated=truncated, budget_key=budget_key)
             
-            # Extract generated text
-            generated_text = completion.choices[0].message.content
-            return generated_text
+            return generated_text, finish_reason
             
+        except DeadlineExceeded:
+            # Callers tell a spent budget apart from upstream errors
+            raise
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
     
-    async def generate_text_stream(self, prompt: str) -> AsyncGenerator[str, None]:
+    async def _call_chat(self, request: Dict[str, Any]) -> tuple:
+        """
+        Call the chat completions API, recording the call in record mode.
+        
+        Returns:
+            (generated text, {"prompt_tokens", "completion_tokens"} or None if the API reported no usage,
+             finish reason, e.g. "stop" or "length")
+        """
+        started = time.perf_counter()
+        try:
+            completion = await self.async_client.chat.completions.create(**request, stream=False)
+        except Exception as e:
+            if self.recorder is not None:
+                self.recorder.record_call("llm", "chat", request, started, error=str(e))
+            raise
+        
+        generated_text = completion.choices[0].message.content
+        finish_reason = completion.choices[0].finish_reason
+        usage = getattr(completion, "usage", None)
+        if usage is not None and usage.prompt_tokens is not None:
+            usage = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens or 0}
+        else:
+            usage = None
+        if self.recorder is not None:
+            self.recorder.record_call("llm", "chat", request, started, response=generated_text, usage=usage,
+                                      finish_reason=finish_reason)
+        return generated_text, usage, finish_reason
+    
+    async def _stream_chat(self, request: Dict[str, Any], outcome: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        Call the chat completions API with streaming, yielding the text of each chunk.
+        
+        Args:
+            outcome: Dict that gets the "finish_reason" of the last chunk
+        """
+        stream = await self.async_client.chat.completions.create(**request, stream=True)
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason is not None:
+                    outcome["finish_reason"] = chunk.choices[0].finish_reason
+                if chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Close the HTTP response right away when the consumer stops early, so the upstream stops generating
+            await stream.response.aclose()
+    
+    async def generate_text_stream(self, prompt: Union[str, PromptSpec], max_tokens: Optional[int] = None, request_type: str = "default") -> AsyncGenerator[str, None]:
         """
         Generate text using LLM API with streaming responses.
         
         Args:
-            prompt: Text prompt for the LLM
+            prompt: Text prompt for the LLM, or a PromptSpec carrying its own budget and request type
+            max_tokens: Output token budget (defaults to LLM_MAX_TOKENS)
+            request_type: Request type recorded in the token accounting
             
         Yields:
             Chunks of generated text
+            
+        Raises:
+            ResponseTruncated: After the last chunk, if the completion hit its budget
         """
         # If using mock data, don't call the API
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             raise Exception("API should not be called in mock mode")
         
-        # Prepare messages
-        messages = [
-            {"role": "system", "content": self.settings.LLM_SYSTEM_MESSAGE},
-            {"role": "user", "content": prompt}
-        ]
-        
-        try:
-            # Call OpenAI API with streaming
-            stream = await self.async_client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                temperature=self.settings.LLM_TEMPERATURE,
-                top_p=self.settings.LLM_TOP_P,
-                max_tokens=self.settings.LLM_MAX_TOKENS,
-                frequency_penalty=self.settings.LLM_FREQUENCY_PENALTY,
-                presence_penalty=self.settings.LLM_PRESENCE_PENALTY,
-                stream=True
+        budget_key = None
+        if isinstance(prompt, PromptSpec):
+            prompt, max_tokens, request_type, budget_key = (
+                prompt.prompt, max_tokens or prompt.max_tokens, prompt.request_type, prompt.budget_key
             )
+        
+        max_tokens = max_tokens or self.settings.current("LLM_MAX_TOKENS")
+        request = self._chat_request(prompt, max_tokens)
+        outcome: Dict[str, Any] = {}
+        generated_chars = 0
+        cancelled = False
+        truncated = False
+        
+        with span("llm.generate_stream", model=self.model_id, request_type=request_type, max_tokens=max_tokens) as llm_span:
+            async with get_upstream_scheduler(self.settings).slot("llm"), get_upstream_activity().track():
+                try:
+                    with UpstreamTimer("llm", self.model_id, "chat_stream") as timer:
+                        if self.recorder is not None and self.recorder.replaying:
+                            pieces = self.recorder.replay_stream("llm", "chat_stream", request, outcome)
+                        elif self.recorder is not None:
+                            pieces = self.recorder.record_stream("llm", "chat_stream", request, self._stream_chat(request, outcome), outcome)
+                        else:
+                            pieces = self._stream_chat(request, outcome)
+                        
+                        # Yield chunks of text as they arrive, within the request budget
+                        try:
+                            async for piece in iterate_with_deadline(pieces, self.settings.LLM_STREAM_IDLE_TIMEOUT):
+                                if not generated_chars:
+                                    llm_span.add_event("first_token")
+                                timer.first_token()
+                                generated_chars += len(piece)
+                                yield piece
+                        finally:
+                            await pieces.aclose()
+                    truncated = outcome.get("finish_reason") == "length"
+                            
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    raise Exception(f"OpenAI API streaming error: {str(e)}")
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The consumer went away (e.g. the client disconnected) and the upstream stream was closed
+                    cancelled = True
+                    raise
+                finally:
+                    # Streaming responses carry no usage block, so the completion is estimated from its length
+                    completion_tokens = tokens_for_length(generated_chars)
+                    self._record_usage(request_type, max_tokens, self._estimate_prompt_tokens(prompt),
+                                       completion_tokens, estimated=True, streamed=True, cancelled=cancelled,
+                                       truncated=truncated, budget_key=budget_key)
+                    if cancelled:
+                        self._record_tokens_saved(request_type, max_tokens, completion_tokens)
+        # Raised after the slot is released; shared streams raise it in every subscriber
+        if truncated:
+            raise ResponseTruncated(request_type, max_tokens)
+    
+    def shared_text_stream(self, prompt: PromptSpec) -> AsyncGenerator[str, None]:
+        """
+        Stream a completion, sharing one upstream stream among identical concurrent requests.
+        
+        Subscribers that join late first receive the chunks already generated.
+        The upstream stream is closed once the last subscriber has gone. Falls
+        back to generate_text_stream() when LLM_STREAM_SINGLE_FLIGHT is off.
+        
+        Args:
+            prompt: Prompt with its output budget and request type
             
-            # Yield chunks of text as they arrive
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            raise Exception(f"OpenAI API streaming error: {str(e)}")
+        Yields:
+            Chunks of generated text
+        """
+        if not self.settings.LLM_STREAM_SINGLE_FLIGHT:
+            return self.generate_text_stream(prompt)
+        max_tokens = prompt.max_tokens or self.settings.current("LLM_MAX_TOKENS")
+        key = request_key("llm", "chat_stream", self._chat_request(prompt.prompt, max_tokens))
+        return get_stream_flights().subscribe(
+            key, lambda: self.generate_text_stream(prompt), model=self.model_id, request_type=prompt.request_type
+        )
+    
+    def _estimate_prompt_tokens(self, prompt: str) -> int:
+        """Estimate the input tokens of a call, including the system message"""
+        return system_template(self.settings.LLM_SYSTEM_MESSAGE).static_tokens + estimate_tokens(prompt)
+    
+    def _record_tokens_saved(self, request_type: str, max_tokens: int, completion_tokens: int) -> None:
+        """Count the output tokens a cancelled stream did not generate, estimated from completed calls of its type"""
+        expected = get_token_ledger().expected_completion_tokens(request_type) or max_tokens
+        saved = max(0, min(expected, max_tokens) - completion_tokens)
+        if saved:
+            LLM_TOKENS_SAVED.inc(saved, model=self.model_id, request_type=request_type, reason="cancelled")
+    
+    def _record_usage(self, request_type: str, max_tokens: int, prompt_tokens: int, completion_tokens: int,
+                      estimated: bool, streamed: bool, cancelled: bool = False, truncated: bool = False,
+                      budget_key: Optional[str] = None) -> None:
+        """Store the token accounting of the last call and add it to the process-wide ledger"""
+        self.last_usage = TokenUsage(
+            request_type=request_type,
+            model=self.model_id,
+            max_tokens=max_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            estimated=estimated,
+            streamed=streamed,
+            timestamp=time.time(),
+            cancelled=cancelled,
+            truncated=truncated,
+            budget_key=budget_key
+        )
+        get_token_ledger().record(self.last_usage)
+        llm_span = current_span()
+        if llm_span is not None:
+            llm_span.set_attribute("prompt_tokens", prompt_tokens)
+            llm_span.set_attribute("completion_tokens", completion_tokens)
+            llm_span.set_attribute("tokens_estimated", estimated)
+            llm_span.set_attribute("truncated", truncated)
+        LLM_TOKENS.inc(prompt_tokens, model=self.model_id, request_type=request_type, direction="input")
+        LLM_TOKENS.inc(completion_tokens, model=self.model_id, request_type=request_type, direction="output")
+        if truncated:
+            LLM_TRUNCATED.inc(model=self.model_id, request_type=request_type)
@@ -2,3 +2,5 @@
 from . import content
 from . import images
 from . import deep_research
+from . import jobs
+from . import lessons
@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
 from fastapi.responses import StreamingResponse
-from app.models.schemas import ContentRequest, ContentResponse, ErrorResponse
+from app.models.schemas import ContentRequest, ContentResponse, ErrorResponse, MultiAudienceContentRequest, MultiAudienceContentResponse
 from app.services.content_service import ContentService
+from app.core.http_cache import cacheable_json_response
+from app.core.metrics import collect_fallbacks
 from config.settings import get_settings
+from contextlib import aclosing
 from typing import Dict, Any
 import json
-import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/generate", response_model=ContentResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def generate_content(request: ContentRequest, settings=Depends(get_settings)):
+async def generate_content(request: ContentRequest, response: Response, settings=Depends(get_settings)):
     """
     Generate educational content based on a topic and audience level.
     
@@ -20,21 +25,29 @@ async def generate_content(request: ContentRequest, settings=Depends(get_setting
     Returns:
     - **explanation**: Educational text explanation in markdown format
     - **image_prompts**: List of image prompts for visual representations
+    - **url**: The lesson's cacheable GET URL (also in the Content-Location header)
     """
     try:
         # Initialize content service
         content_service = ContentService(settings)
         
         # Generate content
-        result = await content_service.generate_educational_content(
-            topic=request.topic,
-            audience=request.audience
-        )
+        with collect_fallbacks() as fallbacks:
+            result = await content_service.generate_educational_content(
+                topic=request.topic,
+                audience=request.audience
+            )
+        
+        # Lessons served from a fallback are not kept, so they get no URL
+        key = None if fallbacks else content_service.lesson_url_key(request.topic, request.audience)
+        if key:
+            result = {**result, "url": f"/api/content/{key}"}
+            response.headers["Content-Location"] = result["url"]
         
         return result
     except Exception as e:
-        # Log the error (in a real app, you'd use proper logging)
-        print(f"Error generating content: {str(e)}")
+        # Log the error
+        logger.exception("Error generating content: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
@@ -51,32 +64,39 @@ async def generate_content_stream(request: ContentRequest, settings=Depends(get_
     - **audience**: Target audience level (elementary, middle school, high school, college, graduate)
     
     Returns:
-    - A streaming response with chunks of the generated content
+    - A streaming response with chunks of the generated content; the last event has
+      `finished` set, the `image_prompts` and the lesson's `url` (unless it was served from a fallback)
     """
     try:
-        # Log the incoming request for debugging
-        print(f"Received streaming request for topic: {request.topic}, audience: {request.audience}")
+        logger.info("Streaming content", extra={"topic": request.topic, "audience": request.audience})
         
         # Initialize content service
         content_service = ContentService(settings)
         
         async def event_generator():
-            """Generate server-sent events"""
+            """
+            Generate server-sent events.
+            
+            When the client disconnects the request is cancelled and this generator
+            closed; closing the content stream with it stops the upstream generation.
+            """
             try:
-                print("Starting content generation stream")
-                async for chunk in content_service.generate_educational_content_stream(
-                    topic=request.topic,
-                    audience=request.audience
-                ):
-                    # Format as server-sent event
-                    event_data = json.dumps(chunk)
-                    yield f"data: {event_data}\n\n"
-                    
-                    # Small delay to prevent flooding
-                    await asyncio.sleep(0.01)
-                print("Stream completed successfully")
+                with collect_fallbacks() as fallbacks:
+                    async with aclosing(content_service.generate_educational_content_stream(
+                        topic=request.topic,
+                        audience=request.audience
+                    )) as chunks:
+                        async for chunk in chunks:
+                            if chunk.get("finished"):
+                                # Lessons served from a fallback are not kept, so they get no URL
+                                key = None if fallbacks else content_service.lesson_url_key(request.topic, request.audience)
+                                if key:
+                                    chunk = {**chunk, "url": f"/api/content/{key}"}
+                            # Format as server-sent event
+                            event_data = json.dumps(chunk)
+                            yield f"data: {event_data}\n\n"
             except Exception as e:
-                print(f"Streaming error: {str(e)}")
+                logger.exception("Streaming error: %s", e)
                 error_data = {"error": f"Streaming failed: {str(e)}"}
                 yield f"data: {json.dumps(error_data)}\n\n"
         
@@ -96,10 +116,102 @@ async def generate_content_stream(request: ContentRequest, settings=Depends(get_
         
     except Exception as e:
         # Log the error
-        print(f"Error setting up content stream: {str(e)}")
+        logger.exception("Error setting up content stream: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
             status_code=500,
             detail=f"Failed to set up content stream. Please try again."
         )
+
+@router.post("/generate/audiences", response_model=MultiAudienceContentResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def generate_content_for_audiences(request: MultiAudienceContentRequest, settings=Depends(get_settings)):
+    """
+    Generate the lesson on one topic for several audience levels at once.
+    
+    A shared outline and fact base is generated once and each audience's lesson
+    is written from it concurrently, which takes fewer tokens and less time than
+    a /generate request per audience. Lessons are cached per audience.
+    
+    - **topic**: Educational topic to generate content for (e.g., "photosynthesis")
+    - **audiences**: Target audience levels (default: elementary, middle-school, high-school, college, graduate)
+    
+    Returns:
+    - **outline**: The shared outline (null when every lesson came from the cache)
+    - **variants**: Per audience, the explanation, image prompts and URL, as from /generate
+    """
+    try:
+        content_service = ContentService(settings)
+        result = await content_service.generate_audience_variants(
+            topic=request.topic,
+            audiences=request.audiences
+        )
+        for variant in result["variants"]:
+            key = variant.pop("url_key")
+            variant["url"] = f"/api/content/{key}" if key else None
+        return result
+    except Exception as e:
+        logger.exception("Error generating content for audiences: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to generate educational content. Please try again."
+        )
+
+@router.post("/generate/audiences/stream")
+async def generate_content_for_audiences_stream(request: MultiAudienceContentRequest, settings=Depends(get_settings)):
+    """
+    Stream the lesson on one topic for several audience levels at once.
+    
+    - **topic**: Educational topic to generate content for (e.g., "photosynthesis")
+    - **audiences**: Target audience levels (default: all five levels)
+    
+    Returns:
+    - A streaming response: an `outline` event, then the chunks of all lessons
+      interleaved, each tagged with its `audience`; a lesson's last event has
+      `finished` set and its `image_prompts`
+    """
+    logger.info("Streaming content for audiences", extra={"topic": request.topic, "audiences": request.audiences})
+    content_service = ContentService(settings)
+    
+    async def event_generator():
+        """Generate server-sent events; closing it stops the lessons still being generated"""
+        try:
+            async with aclosing(content_service.generate_audience_variants_stream(
+                topic=request.topic,
+                audiences=request.audiences
+            )) as events:
+                async for event in events:
+                    yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.exception("Streaming error: %s", e)
+            error_data = {"error": f"Streaming failed: {str(e)}"}
+            yield f"data: {json.dumps(error_data)}\n\n"
+    
+    # Set headers required for SSE
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"  # Prevents proxy buffering for Nginx
+    }
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=headers
+    )
+
+@router.get("/{key}", response_model=ContentResponse, responses={304: {"description": "Not modified"}, 404: {"model": ErrorResponse}})
+async def get_content(request: Request, key: str = Path(..., pattern="^[0-9a-f]{32}$"), settings=Depends(get_settings)):
+    """
+    Get a generated lesson by the URL returned when it was generated.
+    
+    The key is derived from the normalized topic, audience level and model,
+    so the same request always has the same URL. Responses carry a strong
+    ETag and a Cache-Control max-age, so HTTP caches and CDNs can serve
+    repeats; send If-None-Match to get 304 Not Modified while unchanged.
+    """
+    content = await ContentService(settings).get_lesson(key)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Lesson not found. Generate it with POST /api/content/generate.")
+    lesson = ContentResponse(**content, url=f"/api/content/{key}")
+    return cacheable_json_response(request, lesson.model_dump(), settings.CACHEABLE_GET_MAX_AGE)
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.models.deep_research_schemas import DeepResearchRequest, DeepResearchResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Request, Response
+from fastapi.responses import StreamingResponse
+from app.models.deep_research_schemas import DeepResearchRequest, DeepResearchResponse, ResearchOutlineResponse
 from app.models.schemas import ErrorResponse
 from app.services.deep_research_service import DeepResearchService
+from app.services.prefetch_service import PrefetchService
+from app.core.http_cache import cacheable_json_response
+from app.core.metrics import collect_fallbacks
 from config.settings import get_settings
+from contextlib import aclosing
 from typing import Dict, Any
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/research", response_model=DeepResearchResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def deep_research(request: DeepResearchRequest, settings=Depends(get_settings)):
+async def deep_research(request: DeepResearchRequest, req: Request, response: Response, background_tasks: BackgroundTasks, settings=Depends(get_settings)):
     """
     Perform deep research on an educational topic.
     
@@ -24,23 +33,45 @@ async def deep_research(request: DeepResearchRequest, settings=Depends(get_setti
     - Related topics
     - Key concepts
     - Visualization prompts
+    - Its cacheable GET URL (also in the Content-Location header)
+    
+    After the response is sent, outlines for the top related topics are
+    prefetched into the research cache when there is idle capacity.
     """
     try:
         # Initialize research service
         research_service = DeepResearchService(settings)
         
         # Generate research content
-        result = await research_service.generate_research(
-            topic=request.topic,
-            subtopics=request.subtopics,
-            academic_level=request.academic_level,
-            include_references=request.include_references
+        with collect_fallbacks() as fallbacks:
+            result = await research_service.generate_research(
+                topic=request.topic,
+                subtopics=request.subtopics,
+                academic_level=request.academic_level,
+                include_references=request.include_references
+            )
+        
+        # Research served from a fallback is not stored, so it gets no URL
+        key = None if fallbacks else research_service.research_url_key(
+            request.topic, request.subtopics, request.academic_level, request.include_references
+        )
+        if key:
+            result = {**result, "url": f"/api/deep-research/research/{key}"}
+            response.headers["Content-Location"] = result["url"]
+        
+        # Speculatively prefetch related-topic outlines once the response has been delivered
+        user_id = req.headers.get("X-User-Id") or (req.client.host if req.client else "unknown")
+        background_tasks.add_task(
+            PrefetchService(settings).schedule,
+            result.get("related_topics", []),
+            request.academic_level,
+            user_id
         )
         
         return result
     except Exception as e:
-        # Log the error (in a real app, you'd use proper logging)
-        print(f"Error generating deep research: {str(e)}")
+        # Log the error
+        logger.exception("Error generating deep research: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
@@ -48,6 +79,45 @@ async def deep_research(request: DeepResearchRequest, settings=Depends(get_setti
             detail=f"Failed to generate research content. Please try again."
         )
 
+@router.get("/research/{key}", response_model=DeepResearchResponse, responses={304: {"description": "Not modified"}, 404: {"model": ErrorResponse}})
+async def get_research(request: Request, key: str = Path(..., pattern="^[0-9a-f]{80}$"), settings=Depends(get_settings)):
+    """
+    Get stored research by the URL returned when it was generated.
+    
+    The key is derived from the normalized topic, academic level, references
+    choice and subtopics. Responses carry a strong ETag and a Cache-Control
+    max-age for HTTP caches and CDNs; send If-None-Match to get 304 Not
+    Modified while unchanged.
+    """
+    research = await DeepResearchService(settings).get_stored_research(key)
+    if research is None:
+        raise HTTPException(status_code=404, detail="Research not found. Generate it with POST /api/deep-research/research.")
+    research = DeepResearchResponse(**research, url=f"/api/deep-research/research/{key}")
+    return cacheable_json_response(request, research.model_dump(), settings.CACHEABLE_GET_MAX_AGE)
+
+@router.get("/outline", response_model=ResearchOutlineResponse, responses={500: {"model": ErrorResponse}})
+async def get_outline(topic: str, academic_level: str = "undergraduate", include_introduction: bool = False, settings=Depends(get_settings)):
+    """
+    Get an outline for a research topic.
+    
+    - **topic**: Research topic
+    - **academic_level**: Academic level (e.g., high school, undergraduate, graduate)
+    - **include_introduction**: Whether to include an introduction
+    
+    Outlines of related topics are prefetched after each research response, so
+    following a related topic is usually served straight from the research cache.
+    """
+    try:
+        research_service = DeepResearchService(settings)
+        outline = await research_service.get_outline(topic, academic_level, include_introduction)
+        return {"topic": topic, "academic_level": academic_level, **outline}
+    except Exception as e:
+        logger.exception("Error generating research outline: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate research outline. Please try again."
+        )
+
 @router.get("/trending-topics", responses={500: {"model": ErrorResponse}})
 async def get_trending_topics(academic_level: str = "college", limit: int = 10, settings=Depends(get_settings)):
     """
@@ -71,10 +141,52 @@ async def get_trending_topics(academic_level: str = "college", limit: int = 10,
         return {"topics": topics}
     except Exception as e:
         # Log the error
-        print(f"Error fetching trending topics: {str(e)}")
+        logger.exception("Error fetching trending topics: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch trending topics. Please try again."
         )
+
+@router.get("/trending-topics/stream")
+async def stream_trending_topics(academic_level: str = "college", limit: int = 10, settings=Depends(get_settings)):
+    """
+    Stream trending educational topics as server-sent events.
+    
+    - **academic_level**: Academic level filter (e.g., high school, undergraduate, graduate)
+    - **limit**: Maximum number of topics to return
+    
+    Each topic is sent as soon as the model has finished generating it, followed by
+    a final event with `finished` set to true.
+    """
+    # Initialize research service
+    research_service = DeepResearchService(settings)
+    
+    async def event_generator():
+        """Generate server-sent events; closing it on client disconnect stops the upstream generation"""
+        try:
+            async with aclosing(research_service.stream_trending_topics(
+                academic_level=academic_level,
+                limit=limit
+            )) as topics:
+                async for topic in topics:
+                    yield f"data: {json.dumps({'topic': topic, 'finished': False})}\n\n"
+            yield f"data: {json.dumps({'finished': True})}\n\n"
+        except Exception as e:
+            logger.exception("Trending topics streaming error: %s", e)
+            error_data = {"error": "Failed to fetch trending topics. Please try again."}
+            yield f"data: {json.dumps(error_data)}\n\n"
+    
+    # Set headers required for SSE
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"  # Prevents proxy buffering for Nginx
+    }
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=headers
+    )
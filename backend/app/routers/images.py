@@ -5,8 +5,6 @@ from config.settings import get_settings
 from typing import Dict, Any
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -21,33 +19,20 @@ async def generate_image(request: ImageGenerationRequest, req: Request, settings
     Returns:
     - **image_url**: URL to the generated image
     """
-    # Log the full request for debugging
-    logger.info(f"Received image generation request: {request.prompt[:50]}...")
-    if hasattr(request, 'timestamp'):
-        logger.info(f"Request timestamp: {request.timestamp}")
-    
-    # Get client IP for logging
     client_host = req.client.host if req.client else "unknown"
-    logger.info(f"Request from client: {client_host}")
+    logger.debug("Image generation request", extra={"prompt": request.prompt[:50], "client": client_host})
     
     try:
         # Initialize image service
         image_service = ImageService(settings)
         
         # Generate image
-        logger.info(f"Calling image service generate_image with prompt: {request.prompt[:50]}...")
         image_url = await image_service.generate_image(prompt=request.prompt)
         
-        # Log the result
-        logger.info(f"Image generation result - success: True")
-        logger.info(f"Generated image URL: {image_url}")
-        
         return {"image_url": image_url}
     except Exception as e:
         # Log the error
-        logger.error(f"Error generating image: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception("Error generating image: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
@@ -67,14 +52,8 @@ async def generate_gemini_image(request: ImageGenerationRequest, req: Request, s
     - **image_url**: URL to the generated image
     - **error**: Error message if generation failed
     """
-    # Log the full request for debugging
-    logger.info(f"Received image generation request: {request.prompt[:50]}...")
-    if hasattr(request, 'timestamp'):
-        logger.info(f"Request timestamp: {request.timestamp}")
-    
-    # Get client IP for logging
     client_host = req.client.host if req.client else "unknown"
-    logger.info(f"Request from client: {client_host}")
+    logger.debug("Gemini image generation request", extra={"prompt": request.prompt[:50], "client": client_host})
     
     try:
         # Initialize image service
@@ -83,23 +62,13 @@ async def generate_gemini_image(request: ImageGenerationRequest, req: Request, s
         # Sanitize the filename prefix to avoid any path issues
         filename_prefix = request.prompt[:10].replace(" ", "_")
         sanitized_prefix = ''.join(c if c.isalnum() or c == '_' else '_' for c in filename_prefix)
-        logger.info(f"Using sanitized filename prefix: {sanitized_prefix}")
         
         # Generate image using Gemini
-        logger.info(f"Calling image service generate_gemini_image with prompt: {request.prompt[:50]}...")
         result = await image_service.generate_gemini_image(
             prompt=request.prompt, 
             filename_prefix=sanitized_prefix
         )
         
-        # Log the result
-        logger.info(f"Image generation result - success: {result['success']}")
-        if result['success']:
-            logger.info(f"Generated image path: {result['file_path']}")
-            logger.info(f"Image URL: {result['image_url']}")
-        else:
-            logger.error(f"Image generation failed: {result['error']}")
-        
         if result["success"]:
             return {
                 "success": True,
@@ -107,8 +76,7 @@ async def generate_gemini_image(request: ImageGenerationRequest, req: Request, s
                 "error": None
             }
         else:
-            # Log additional error details
-            logger.error(f"Details of failed image generation: {result}")
+            logger.error("Image generation failed: %s", result["error"])
             
             # Return the error from the Gemini API
             raise HTTPException(
@@ -117,9 +85,7 @@ async def generate_gemini_image(request: ImageGenerationRequest, req: Request, s
             )
     except Exception as e:
         # Log the error
-        logger.error(f"Error generating image with Gemini: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception("Error generating image with Gemini: %s", e)
         
         # Return a user-friendly error
         raise HTTPException(
@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app.models.job_schemas import JobRequest, JobResponse
+from app.models.schemas import ErrorResponse
+from app.services.job_service import get_job_queue, public_job
+from app.services.job_store import IdempotencyConflict, QueueFull
+from config.settings import get_settings
+from contextlib import aclosing
+from typing import Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _queue(settings):
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled")
+    return get_job_queue(settings)
+
+@router.post("", response_model=JobResponse, status_code=202, responses={400: {"model": ErrorResponse}, 409: {"model": ErrorResponse}, 429: {"model": ErrorResponse}})
+async def submit_job(request: JobRequest, response: Response, idempotency_key: Optional[str] = Header(None, max_length=255), settings=Depends(get_settings)):
+    """
+    Submit a long-running job; it runs in the background and the response is returned at once.
+
+    - **kind**: `deep_research` (params as for /api/deep-research/research), `images`
+      (`prompts`, `provider`) or `curriculum` (`topics`, `audience`, `generate_images`)
+    - **params**: Parameters of the job kind
+    - **webhook_url**: URL the finished job is POSTed to (optional); it must resolve to a
+      public address, or its host be in JOB_WEBHOOK_ALLOWED_HOSTS
+
+    Send an `Idempotency-Key` header to make retries safe: the same key and
+    job return the job created first (200) instead of queuing another.
+
+    Returns the queued job (202); follow it with GET /api/jobs/{id} or the
+    server-sent events of GET /api/jobs/{id}/events.
+    """
+    queue = _queue(settings)
+    try:
+        job, created = await queue.submit(
+            kind=request.kind,
+            params=request.params,
+            webhook_url=request.webhook_url,
+            idempotency_key=idempotency_key
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Too many queued jobs. Please try again later.", headers={"Retry-After": "30"})
+
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    if not created:
+        response.status_code = 200
+    return public_job(job)
+
+@router.get("/{job_id}", response_model=JobResponse, responses={404: {"model": ErrorResponse}})
+async def get_job(job_id: str, settings=Depends(get_settings)):
+    """
+    Get the status, progress and (once finished) the result of a job.
+    """
+    job = await _queue(settings).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@router.delete("/{job_id}", response_model=JobResponse, responses={404: {"model": ErrorResponse}})
+async def cancel_job(job_id: str, settings=Depends(get_settings)):
+    """
+    Cancel a job.
+
+    A queued job is cancelled at once; a running job stops within a few
+    seconds (its status then turns to cancelled). Finished jobs are
+    returned unchanged.
+    """
+    job = await _queue(settings).cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@router.get("/{job_id}/events", responses={404: {"model": ErrorResponse}})
+async def stream_job_events(job_id: str, settings=Depends(get_settings)):
+    """
+    Follow a job as server-sent events.
+
+    Each event carries the job (as from GET /api/jobs/{id}) whenever its
+    status or progress changes; the stream ends after the event with the
+    final status. If the stream ends early (e.g. the server restarts),
+    reconnect to continue following the job.
+    """
+    queue = _queue(settings)
+    if await queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_generator():
+        """Generate server-sent events until the job has finished"""
+        try:
+            async with aclosing(queue.watch(job_id)) as jobs:
+                async for job in jobs:
+                    yield f"data: {json.dumps(public_job(job))}\n\n"
+        except Exception as e:
+            logger.exception("Job events streaming error: %s", e)
+            error_data = {"error": "Failed to follow the job. Please reconnect."}
+            yield f"data: {json.dumps(error_data)}\n\n"
+
+    # Set headers required for SSE
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"  # Prevents proxy buffering for Nginx
+    }
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=headers
+    )
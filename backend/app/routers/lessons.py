@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.models.lesson_schemas import LessonResponse, LessonSearchResponse
+from app.models.schemas import ErrorResponse
+from app.services.lesson_library import get_lesson_library
+from app.services.lesson_store import LESSON_KINDS
+from config.settings import get_settings
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _library(settings):
+    if not settings.LESSON_LIBRARY_ENABLED:
+        raise HTTPException(status_code=503, detail="The lesson library is disabled")
+    return get_lesson_library(settings)
+
+@router.get("/search", response_model=LessonSearchResponse, responses={400: {"model": ErrorResponse}})
+async def search_lessons(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for"),
+    kind: Optional[str] = Query(None, description="Only content or research"),
+    audience: Optional[str] = Query(None, description="Only lessons for this audience or academic level"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    settings=Depends(get_settings)
+):
+    """
+    Search the generated lessons and research.
+
+    Finds lessons containing all words of the search (the last one may be
+    the start of a word) in their topic or text, best matches first. Open
+    a result with GET /api/lessons/{id} instead of generating it again.
+    """
+    library = _library(settings)
+    if kind is not None and kind not in LESSON_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(LESSON_KINDS)}")
+    try:
+        results = await library.search(q, kind=kind, audience=audience, limit=limit, offset=offset)
+    except Exception as e:
+        logger.exception("Error searching lessons: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to search lessons. Please try again.")
+    return {"query": q, "results": results}
+
+@router.get("/{lesson_id}", response_model=LessonResponse, responses={404: {"model": ErrorResponse}})
+async def get_lesson(lesson_id: str, settings=Depends(get_settings)):
+    """
+    Get a lesson of the library, with its content as it was generated.
+    """
+    lesson = await _library(settings).get(lesson_id)
+    if lesson is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    return lesson
@@ -2,3 +2,14 @@
 from . import content_service
 from . import image_service
 from . import deep_research_service
+from . import json_extractor
+from . import reference_service
+from . import research_store
+from . import prompt_builder
+from . import prefetch_service
+from . import job_store
+from . import job_service
+from . import curriculum_service
+from . import similarity_index
+from . import lesson_store
+from . import lesson_library
@@ -1,21 +1,119 @@
-from config.settings import Settings
-from app.nvidia_api.llm_client import LLMClient
-from typing import Dict, List, Any, AsyncGenerator
+from config.settings import Settings, get_override, settings_override
+from app.nvidia_api.llm_client import LLMClient, ResponseTruncated
+from app.services.prompt_builder import PromptBuilder, normalize_level
+from app.core.prompt_templates import register_template, system_template, templates_version
+from app.core.metrics import collect_fallbacks, record_cache, record_fallback
+from app.core.shared_state import get_shared_store
+from app.services.similarity_index import get_similarity_index, similarity_threshold
+from app.services.lesson_library import get_lesson_library
+from app.core.tracing import span
+from app.core.deadlines import DeadlineExceeded
+from contextlib import aclosing
+from typing import Dict, List, Any, AsyncGenerator, Optional
+import hashlib
 import json
+import logging
 import re
 import asyncio
 
+logger = logging.getLogger(__name__)
+
+# The audience levels lessons are written for, and how to write for each
+AUDIENCE_LEVEL_DESCRIPTIONS = {
+    "elementary": "ages 6-10, simple language, concrete examples, engaging and fun content",
+    "middle-school": "ages 11-13, moderate complexity, mix of concrete and abstract concepts, engaging examples",
+    "high-school": "ages 14-18, higher complexity, abstract concepts, real-world applications, critical thinking",
+    "college": "undergraduate level, sophisticated concepts, theoretical and practical applications, critical analysis",
+    "graduate": "graduate level, advanced concepts, research focus, critical evaluation of competing theories"
+}
+
+# Prompt templates: the instructions come first and the topic and audience last, so that
+# the start of every prompt is the same and the upstream can reuse its prompt cache
+CONTENT_PROMPT = register_template("content", """
+    You are an expert educator specializing in creating high-quality, in-depth educational content for students.
+
+    Each lesson must demonstrate deep reasoning and expert knowledge on its subject, and include:
+
+    1. A detailed explanation in markdown format with:
+       - An engaging title and introduction that frames the topic in an interesting context
+       - Background/historical context for the topic when relevant
+       - Core concepts explained clearly with precise, accurate information
+       - Advanced analysis that demonstrates deeper connections and implications
+       - Practical examples or applications that make the content relatable
+       - Questions that promote critical thinking about the topic
+
+    2. After your main content, include a section titled "IMAGE_PROMPTS" that provides 3 detailed image prompts,
+       each on a separate line starting with "- " that would effectively illustrate key concepts from this lesson.
+       Make these image prompts specific, detailed, and appropriate for the students the lesson is for.
+
+    Structure your response with clear markdown formatting (headings, lists, etc.) to enhance readability.
+    Ensure all content is accurate, thoughtful, and demonstrates sophisticated reasoning about the topic.
+
+    Generate a comprehensive and insightful educational lesson on "{topic}" targeted at {audience_description} students.
+    Make the image prompts appropriate for {audience} students.
+""")
+
+LESSON_OUTLINE_PROMPT = register_template("lesson_outline", """
+    You are an expert educator planning a lesson that will be written for several audiences,
+    from elementary school students to graduate students.
+
+    Write the shared lesson plan in markdown, with these sections:
+
+    1. "## Outline": the 4-6 sections of the lesson, each with a one-line summary
+    2. "## Key Facts": 8-12 precise, accurate facts, definitions and figures the lesson relies on
+    3. "## Examples": 4-6 examples or applications, ranging from everyday to advanced
+    4. "## Misconceptions": common misconceptions about the topic and their corrections
+
+    Be accurate and concise. Do not write the lesson itself.
+
+    The lesson is on "{topic}".
+""")
+
+# Everything up to the audience is the same for all versions of a lesson
+CONTENT_VARIANT_PROMPT = register_template("content_variant", """
+    You are an expert educator writing versions of a lesson for different audiences, all from the
+    lesson plan below.
+
+    Write the lesson in markdown, with an engaging title and introduction, the sections of the
+    outline, and questions that promote critical thinking. Follow the outline and rely on the key
+    facts; do not repeat the plan itself.
+
+    After the lesson, include a section titled "IMAGE_PROMPTS" that provides 3 detailed image prompts,
+    each on a separate line starting with "- " that would effectively illustrate key concepts from this lesson.
+
+    The lesson is on "{topic}".
+
+    LESSON PLAN:
+    {outline}
+
+    Write this version for {audience_description} students: pick the examples that suit them and
+    adapt depth, vocabulary and tone to them. Make the image prompts appropriate for {audience} students.
+""")
+
+# Versions of the prompts each kind of cached result is generated with, part of its cache key
+PROMPT_VERSIONS = {
+    "lesson": templates_version(CONTENT_PROMPT, LESSON_OUTLINE_PROMPT, CONTENT_VARIANT_PROMPT),
+    "lesson_outline": templates_version(LESSON_OUTLINE_PROMPT)
+}
+
 class ContentService:
     """Service for educational content generation"""
     
     def __init__(self, settings: Settings):
         self.settings = settings
         self.llm_client = LLMClient(settings)
+        self.prompt_builder = PromptBuilder(settings)
+        self.cache = get_shared_store(settings)
+        self.similar_topics = get_similarity_index("lesson", settings)
         
     async def generate_educational_content(self, topic: str, audience: str) -> Dict[str, Any]:
         """
         Generate educational content based on a topic and audience level.
         
+        Lessons are cached for CONTENT_CACHE_TTL; a lesson cached for the
+        same audience on a near-duplicate topic (e.g. "Photosynthesis
+        process" for "How does photosynthesis work?") is reused as well.
+        
         Args:
             topic: Educational topic to generate content for
             audience: Target audience level
@@ -23,55 +121,80 @@ class ContentService:
         Returns:
             Dictionary containing the explanation and image prompts
         """
-        print(f"DEBUG: Starting generate_educational_content for {topic}, {audience}")
-        print(f"DEBUG: USE_MOCK_DATA = {self.settings.USE_MOCK_DATA}")
-        
-        # Force USE_MOCK_DATA to be False to ensure we use the real API
-        self.settings.USE_MOCK_DATA = False
-        print(f"DEBUG: FORCED USE_MOCK_DATA = {self.settings.USE_MOCK_DATA}")
-        
-        if self.settings.USE_MOCK_DATA:
+        # Content is generated by the LLM even with USE_MOCK_DATA set, unless the request itself asked for mock data
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            cached = await self._cached_lesson(topic, audience, "content")
+            if cached is not None:
+                return cached
+            with collect_fallbacks() as fallbacks:
+                content = await self._generate_educational_content(topic, audience)
+            if not fallbacks:
+                await self._cache_lesson(topic, audience, content)
+            return content
+    
+    async def _generate_educational_content(self, topic: str, audience: str, outline: Optional[str] = None) -> Dict[str, Any]:
+        """Generate content (from a shared lesson outline, if given), or mock content in mock mode"""
+        if self.settings.current("USE_MOCK_DATA"):
             # For development/demo, return mock data
-            print("DEBUG: Using mock data")
+            record_fallback("content", "mock_mode")
             return self._generate_mock_content(topic, audience)
         
         try:
             # Construct prompt for the LLM
-            prompt = self._create_content_prompt(topic, audience)
-            print(f"DEBUG: Sending prompt to LLM: {prompt[:100]}...")
+            with span("content.prompt_build", audience=audience) as build_span:
+                prompt = self._build_prompt(topic, audience, outline)
+                build_span.set_attribute("input_tokens", prompt.input_tokens)
+            logger.debug("Generating content", extra={
+                "topic": topic, "audience": audience,
+                "input_tokens": prompt.input_tokens, "max_tokens": prompt.max_tokens
+            })
             
             # Call the LLM API
-            print("DEBUG: Calling LLM API...")
             response = await self.llm_client.generate_text(prompt)
-            print(f"DEBUG: Received response from LLM API: {response[:100]}...")
             
             # Parse the response to extract explanation and image prompts
-            print("DEBUG: Parsing LLM response...")
-            explanation, image_prompts = self._parse_llm_response(response, topic, audience)
+            with span("content.parse", response_chars=len(response)):
+                explanation, image_prompts = self._parse_llm_response(response, topic, audience)
             
             return {
                 "explanation": explanation,
                 "image_prompts": image_prompts
             }
+        except ResponseTruncated as e:
+            # The lesson so far is still sent, but as a fallback so that it is not cached
+            logger.warning("Lesson was cut off at its output budget", extra={"topic": topic, "audience": audience, "max_tokens": e.max_tokens})
+            record_fallback("content", "truncated")
+            explanation, image_prompts = self._parse_llm_response(e.text, topic, audience)
+            return {
+                "explanation": explanation,
+                "image_prompts": image_prompts
+            }
+        except DeadlineExceeded:
+            logger.warning("Content generation ran out of time, falling back to mock data", extra={"topic": topic, "audience": audience})
+            record_fallback("content", "deadline")
+            return self._generate_mock_content(topic, audience)
         except Exception as e:
-            print(f"ERROR in generate_educational_content: {str(e)}")
             # For development/demo, return mock data as fallback
-            print("DEBUG: Falling back to mock data due to error")
+            logger.error("Content generation failed, falling back to mock data: %s", e, extra={"topic": topic, "audience": audience})
+            record_fallback("content", "upstream_error")
             return self._generate_mock_content(topic, audience)
     
-    async def generate_educational_content_stream(self, topic: str, audience: str) -> AsyncGenerator[Dict[str, Any], None]:
+    async def generate_educational_content_stream(self, topic: str, audience: str,
+                                                  outline: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Generate educational content with streaming responses.
         
         Args:
             topic: Educational topic to generate content for
             audience: Target audience level
+            outline: Shared lesson outline to write the lesson from (see generate_audience_variants)
             
         Yields:
             Dictionary containing chunks of the explanation
         """
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             # For development/demo, yield mock data in chunks
+            record_fallback("content", "mock_mode")
             mock_content = self._generate_mock_content(topic, audience)
             explanation = mock_content["explanation"]
             
@@ -91,18 +214,49 @@ class ContentService:
             }
             return
         
+        # A cached lesson (see generate_educational_content) is sent whole; lessons written from an outline are cached by their caller
+        if outline is None:
+            cached = await self._cached_lesson(topic, audience, "content")
+            if cached is not None:
+                yield {"chunk": cached["explanation"], "finished": False}
+                yield {"chunk": "", "finished": True, "image_prompts": cached["image_prompts"]}
+                return
+        
         # Construct prompt for the LLM
-        prompt = self._create_content_prompt(topic, audience)
+        with span("content.prompt_build", audience=audience) as build_span:
+            prompt = self._build_prompt(topic, audience, outline)
+            build_span.set_attribute("input_tokens", prompt.input_tokens)
         
         # Call the LLM API with streaming
         collected_text = ""
+        complete = True
         
-        async for chunk in self.llm_client.generate_text_stream(prompt):
-            collected_text += chunk
-            yield {"chunk": chunk, "finished": False}
+        try:
+            # Identical concurrent requests share one upstream stream; closing this one
+            # (e.g. when the client disconnects) stops the upstream once nobody else is listening
+            async with aclosing(self.llm_client.shared_text_stream(prompt)) as chunks:
+                async for chunk in chunks:
+                    collected_text += chunk
+                    yield {"chunk": chunk, "finished": False}
+        except ResponseTruncated as e:
+            # The lesson stopped at its output budget: it is sent as it is, but not cached
+            logger.warning("Lesson stream was cut off at its output budget", extra={"topic": topic, "audience": audience, "max_tokens": e.max_tokens})
+            record_fallback("content", "truncated")
+            complete = False
+        except DeadlineExceeded:
+            # Out of time: finish with what has been streamed so far, or mock content if nothing was
+            logger.warning("Content stream ran out of time", extra={"topic": topic, "audience": audience, "chars": len(collected_text)})
+            record_fallback("content", "deadline")
+            complete = False
+            if not collected_text:
+                collected_text = self._generate_mock_content(topic, audience)["explanation"]
+                yield {"chunk": collected_text, "finished": False}
         
         # Parse the complete response to extract explanation and image prompts
-        explanation, image_prompts = self._parse_llm_response(collected_text, topic, audience)
+        with span("content.parse", response_chars=len(collected_text)):
+            explanation, image_prompts = self._parse_llm_response(collected_text, topic, audience)
+        if complete and outline is None:
+            await self._cache_lesson(topic, audience, {"explanation": explanation, "image_prompts": image_prompts})
         
         # Final yield with image prompts
         yield {
@@ -111,41 +265,299 @@ class ContentService:
             "image_prompts": image_prompts
         }
     
-    def _create_content_prompt(self, topic: str, audience: str) -> str:
-        """Create a prompt for the LLM to generate educational content"""
-        audience_level_descriptions = {
-            "elementary": "ages 6-10, simple language, concrete examples, engaging and fun content",
-            "middle-school": "ages 11-13, moderate complexity, mix of concrete and abstract concepts, engaging examples",
-            "high-school": "ages 14-18, higher complexity, abstract concepts, real-world applications, critical thinking",
-            "college": "undergraduate level, sophisticated concepts, theoretical and practical applications, critical analysis",
-            "graduate": "graduate level, advanced concepts, research focus, critical evaluation of competing theories"
+    async def generate_audience_variants(self, topic: str, audiences: List[str]) -> Dict[str, Any]:
+        """
+        Generate the lesson on one topic for several audiences.
+        
+        An outline and fact base for the topic is generated once, then the
+        lesson of each audience is written from it, concurrently and with a
+        shorter prompt than a full lesson's. Lessons and outlines are cached
+        for CONTENT_CACHE_TTL, so a later request only generates the
+        audiences that are not cached yet.
+        
+        Args:
+            topic: Educational topic to generate content for
+            audiences: Target audience levels
+        
+        Returns:
+            Dictionary with the topic, the shared outline (None when every lesson
+            was cached or the outline could not be generated) and the variants:
+            audience, explanation, image_prompts, cached and url_key (see
+            lesson_url_key; None for a lesson served from a fallback), in the order requested
+        """
+        audiences = self._distinct_audiences(audiences)
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            variants = await self._cached_variants(topic, audiences)
+            missing = [audience for audience in audiences if audience not in variants]
+            outline = await self._lesson_outline(topic) if missing else None
+            generated = await asyncio.gather(*(self._audience_variant(topic, audience, outline) for audience in missing))
+        variants.update(zip(missing, generated))
+        
+        return {
+            "topic": topic,
+            "outline": outline,
+            "variants": [{"audience": audience, **variants[audience]} for audience in audiences]
         }
+    
+    async def generate_audience_variants_stream(self, topic: str, audiences: List[str]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream the lesson on one topic for several audiences (see generate_audience_variants).
         
-        audience_description = audience_level_descriptions.get(audience.lower(), f"{audience} level")
+        Args:
+            topic: Educational topic to generate content for
+            audiences: Target audience levels
         
-        return f"""
-        You are an expert educator specializing in creating high-quality, in-depth educational content for students. 
+        Yields:
+            {"outline": ...} once the shared outline is ready (not when every lesson
+            is cached), then the chunks of all lessons as they are generated, each
+            as {"audience", "chunk", "finished": False}; each lesson ends with
+            {"audience", "chunk": "", "finished": True, "image_prompts", "cached"}
+            or, if it failed, {"audience", "error"}
+        """
+        audiences = self._distinct_audiences(audiences)
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            cached = await self._cached_variants(topic, audiences)
+        for audience, variant in cached.items():
+            yield {"audience": audience, "chunk": variant["explanation"], "finished": False}
+            yield {"audience": audience, "chunk": "", "finished": True, "image_prompts": variant["image_prompts"], "cached": True}
         
-        Generate a comprehensive and insightful educational lesson on "{topic}" targeted at {audience_description} students.
+        missing = [audience for audience in audiences if audience not in cached]
+        if not missing:
+            return
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            outline = await self._lesson_outline(topic)
+        if outline is not None:
+            yield {"outline": outline}
         
-        Your response must demonstrate deep reasoning and expert knowledge on the subject. Include:
-
-        1. A detailed explanation in markdown format with:
-           - An engaging title and introduction that frames the topic in an interesting context
-           - Background/historical context for the topic when relevant
-           - Core concepts explained clearly with precise, accurate information
-           - Advanced analysis that demonstrates deeper connections and implications
-           - Practical examples or applications that make the content relatable
-           - Questions that promote critical thinking about the topic
+        # The lessons are generated by one task each; their chunks are passed on in arrival order
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def produce(audience: str) -> None:
+            try:
+                explanation = ""
+                with collect_fallbacks() as fallbacks:
+                    async with aclosing(self.generate_educational_content_stream(topic, audience, outline)) as chunks:
+                        async for chunk in chunks:
+                            if chunk["finished"]:
+                                content = {"explanation": explanation, "image_prompts": chunk["image_prompts"]}
+                                chunk = {**chunk, "cached": False}
+                            else:
+                                explanation += chunk["chunk"]
+                            await events.put({"audience": audience, **chunk})
+                if not fallbacks:
+                    await self._cache_lesson(topic, audience, content)
+            except Exception as e:
+                logger.exception("Audience variant stream failed: %s", e, extra={"topic": topic, "audience": audience})
+                await events.put({"audience": audience, "error": "Failed to generate the lesson for this audience."})
+            finally:
+                await events.put(None)
+        
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            producers = [asyncio.create_task(produce(audience)) for audience in missing]
+        try:
+            running = len(producers)
+            while running:
+                event = await events.get()
+                if event is None:
+                    running -= 1
+                else:
+                    yield event
+        finally:
+            # The client went away (or all lessons are done): stop what is still generating
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+    
+    def _distinct_audiences(self, audiences: List[str]) -> List[str]:
+        """Audiences without repeats of the same level (e.g. "high school" and "High-School")"""
+        distinct = {}
+        for audience in audiences:
+            distinct.setdefault(normalize_level(audience), audience)
+        return list(distinct.values())
+    
+    async def _cached_variants(self, topic: str, audiences: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached lessons of the audiences, by audience"""
+        variants = {}
+        for audience in audiences:
+            content = await self._cached_lesson(topic, audience, "audiences")
+            if content is not None:
+                variants[audience] = {**content, "cached": True, "url_key": self.lesson_url_key(topic, audience)}
+        return variants
+    
+    async def _lesson_outline(self, topic: str) -> Optional[str]:
+        """The outline and fact base of a topic's lesson, or None if it cannot be generated"""
+        key = self._cache_key("lesson_outline", topic)
+        cached = await self._cache_get(key)
+        record_cache("lesson_outline", "hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached["outline"]
         
-        2. After your main content, include a section titled "IMAGE_PROMPTS" that provides 3 detailed image prompts,
-           each on a separate line starting with "- " that would effectively illustrate key concepts from this lesson.
-           Make these image prompts specific, detailed, and appropriate for {audience} students.
+        if self.settings.current("USE_MOCK_DATA"):
+            record_fallback("lesson_outline", "mock_mode")
+            return self._generate_mock_outline(topic)
         
-        Structure your response with clear markdown formatting (headings, lists, etc.) to enhance readability.
-        Ensure all content is accurate, thoughtful, and demonstrates sophisticated reasoning about the topic.
+        try:
+            with span("content.outline_build") as build_span:
+                prompt = self.prompt_builder.lesson_outline(self._create_outline_prompt(topic))
+                build_span.set_attribute("input_tokens", prompt.input_tokens)
+            # Concurrent requests for the same topic share one generation
+            outline = ""
+            truncated = False
+            async with aclosing(self.llm_client.shared_text_stream(prompt)) as chunks:
+                async for chunk in chunks:
+                    outline += chunk
+        except ResponseTruncated:
+            # The outline so far still guides this request's lessons, but is not cached
+            logger.warning("Lesson outline was cut off at its output budget", extra={"topic": topic})
+            record_fallback("lesson_outline", "truncated")
+            truncated = True
+        except DeadlineExceeded:
+            logger.warning("Lesson outline ran out of time, writing full lessons instead", extra={"topic": topic})
+            record_fallback("lesson_outline", "deadline")
+            return None
+        except Exception as e:
+            logger.error("Lesson outline failed, writing full lessons instead: %s", e, extra={"topic": topic})
+            record_fallback("lesson_outline", "upstream_error")
+            return None
+        
+        outline = outline.strip()
+        if not outline:
+            return None
+        if not truncated:
+            await self._cache_set(key, {"outline": outline})
+        return outline
+    
+    async def _audience_variant(self, topic: str, audience: str, outline: Optional[str]) -> Dict[str, Any]:
+        """Generate one audience's lesson (from the outline, if there is one) and cache it"""
+        with collect_fallbacks() as fallbacks:
+            content = await self._generate_educational_content(topic, audience, outline)
+        if not fallbacks:
+            await self._cache_lesson(topic, audience, content)
+        return {**content, "cached": False, "url_key": None if fallbacks else self.lesson_url_key(topic, audience)}
+    
+    async def _cached_lesson(self, topic: str, audience: str, endpoint: str) -> Optional[Dict[str, Any]]:
         """
+        The cached lesson of a topic for an audience, or else one on a near-duplicate topic.
+        
+        Near-duplicates must reach the endpoint's SIMILAR_TOPIC_THRESHOLDS
+        similarity; they are looked up in this process's index of the
+        lessons it cached.
+        """
+        content = await self._cache_get(self._cache_key("lesson", topic, audience))
+        if content is not None:
+            record_cache("lesson", "hit")
+            return content
+        
+        threshold = similarity_threshold(self.settings, endpoint)
+        if threshold is not None and self.settings.CONTENT_CACHE_TTL > 0 and not self.settings.current("USE_MOCK_DATA"):
+            match = self.similar_topics.lookup(self._similarity_scope(audience), topic, threshold)
+            if match is not None:
+                key, similarity = match
+                content = await self._cache_get(key)
+                if content is not None:
+                    logger.debug("Reusing the cached lesson of a similar topic", extra={
+                        "topic": topic, "audience": audience, "similarity": round(similarity, 3)
+                    })
+                    record_cache("lesson", "similar")
+                    # Also under this topic's own key, so that its GET URL finds it
+                    await self._cache_set(self._cache_key("lesson", topic, audience), content)
+                    return content
+                # Expired from the cache
+                self.similar_topics.remove(key)
+        
+        record_cache("lesson", "miss")
+        return None
+    
+    async def _cache_lesson(self, topic: str, audience: str, content: Dict[str, Any]) -> None:
+        """Keep a freshly generated lesson: in the lesson library, and cached with its topic indexed for near-duplicate lookups"""
+        key = self._cache_key("lesson", topic, audience)
+        get_lesson_library(self.settings).record("content", topic, audience, content, self.llm_client.model_id, request_key=key)
+        if self.settings.CONTENT_CACHE_TTL <= 0:
+            return
+        await self._cache_set(key, content)
+        self.similar_topics.add(self._similarity_scope(audience), topic, key)
+    
+    def lesson_url_key(self, topic: str, audience: str) -> Optional[str]:
+        """
+        Key of the lesson for a topic and audience in its GET URL (/api/content/{key}).
+        
+        Derived from the normalized topic, audience level, model and prompt
+        versions, like the lesson cache key; None when lessons are neither cached nor kept in the
+        lesson library, so there is nothing to serve at the URL.
+        """
+        if self.settings.CONTENT_CACHE_TTL <= 0 and not self.settings.LESSON_LIBRARY_ENABLED:
+            return None
+        return self._cache_key("lesson", topic, audience).split(":", 1)[1]
     
+    async def get_lesson(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        A generated lesson by the key of its GET URL (see lesson_url_key).
+        
+        Looked up in the lesson cache, then in the lesson library (the lesson
+        most recently generated for the key).
+        
+        Returns:
+            Dictionary containing the explanation and image prompts, or None
+        """
+        with settings_override(USE_MOCK_DATA=False):
+            content = await self._cache_get(f"lesson:{key}")
+        if content is None and self.settings.LESSON_LIBRARY_ENABLED:
+            lesson = await get_lesson_library(self.settings).get_by_request_key(f"lesson:{key}")
+            content = lesson["content"] if lesson is not None else None
+        return content
+    
+    def _similarity_scope(self, audience: str) -> str:
+        """Only lessons for the same audience level and of the same model are near-duplicates"""
+        return f"{normalize_level(audience)}|{self.llm_client.model_id}"
+    
+    def _cache_key(self, kind: str, topic: str, audience: str = "") -> str:
+        """Key of a cached lesson or outline; lessons of another model or other prompts are not reused"""
+        raw = json.dumps([
+            " ".join(topic.lower().split()), normalize_level(audience), self.llm_client.model_id,
+            PROMPT_VERSIONS.get(kind, ""), system_template(self.settings.LLM_SYSTEM_MESSAGE).version
+        ])
+        return f"{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]}"
+    
+    async def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look a lesson or outline up; None if absent, caching is off or in mock mode"""
+        if self.settings.CONTENT_CACHE_TTL <= 0 or self.settings.current("USE_MOCK_DATA"):
+            return None
+        try:
+            return await asyncio.to_thread(self.cache.get, key)
+        except Exception as e:
+            logger.warning("Error reading the lesson cache: %s", e)
+            return None
+    
+    async def _cache_set(self, key: str, value: Dict[str, Any]) -> None:
+        """Cache a lesson or outline for CONTENT_CACHE_TTL seconds"""
+        if self.settings.CONTENT_CACHE_TTL <= 0:
+            return
+        try:
+            await asyncio.to_thread(self.cache.set, key, value, self.settings.CONTENT_CACHE_TTL)
+        except Exception as e:
+            logger.warning("Error writing the lesson cache: %s", e)
+
+    def _build_prompt(self, topic: str, audience: str, outline: Optional[str]):
+        """Lesson prompt with its output budget: a full lesson, or one written from a shared outline"""
+        if outline is None:
+            return self.prompt_builder.content(self._create_content_prompt(topic, audience), audience)
+        return self.prompt_builder.content_variant(self._create_variant_prompt(topic, audience, outline), audience)
+    
+    def _create_content_prompt(self, topic: str, audience: str) -> str:
+        """Create a prompt for the LLM to generate educational content"""
+        audience_description = AUDIENCE_LEVEL_DESCRIPTIONS.get(audience.lower(), f"{audience} level")
+        return CONTENT_PROMPT.render(topic=topic, audience=audience, audience_description=audience_description)
+    
+    def _create_outline_prompt(self, topic: str) -> str:
+        """Create a prompt for the outline and fact base shared by the audience versions of a lesson"""
+        return LESSON_OUTLINE_PROMPT.render(topic=topic)
+    
+    def _create_variant_prompt(self, topic: str, audience: str, outline: str) -> str:
+        """Create a prompt for one audience's lesson, written from the shared lesson plan"""
+        audience_description = AUDIENCE_LEVEL_DESCRIPTIONS.get(normalize_level(audience), f"{audience} level")
+        return CONTENT_VARIANT_PROMPT.render(topic=topic, outline=outline, audience=audience,
+                                             audience_description=audience_description)
+
     def _parse_llm_response(self, response: str, topic: str, audience: str) -> tuple:
         """
         Parse the LLM response to extract explanation and image prompts.
@@ -184,7 +596,8 @@ class ContentService:
             
         except Exception as e:
             # If parsing fails, return a default structure
-            print(f"Error parsing LLM response: {str(e)}")
+            logger.warning("Error parsing LLM response: %s", e)
+            record_fallback("content", "parse_error")
             default_explanation = f"""
             # {topic.capitalize()} (for {audience})
             
@@ -235,3 +648,20 @@ At the {audience} level, students should begin to grasp how {topic} connects to
             "explanation": explanation,
             "image_prompts": image_prompts
         }
+    
+    def _generate_mock_outline(self, topic: str) -> str:
+        """Generate a mock lesson outline for development and testing"""
+        return f"""## Outline
+- Introduction: what {topic} is and why it matters
+- Core concepts: the key principles of {topic}
+- Applications: {topic} in real world scenarios
+
+## Key Facts
+- First principle of {topic}
+- Second principle of {topic}
+
+## Examples
+- An everyday example of {topic}
+
+## Misconceptions
+- A common misconception about {topic}"""
@@ -0,0 +1,162 @@
+from config.settings import Settings
+from app.services.content_service import ContentService
+from app.services.deep_research_service import DeepResearchService
+from app.services.image_service import ImageService
+from app.services.research_store import normalize_subtopics
+from app.core.metrics import collect_fallbacks
+from app.core.tracing import span
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LessonSpec:
+    """One row of a curriculum: a lesson to generate"""
+    topic: str
+    audience: str
+    subtopics: List[str] = field(default_factory=list)
+    academic_level: Optional[str] = None  # For the research; defaults to the audience
+    id: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Stable key of the lesson: its id, or a hash of what it is generated from"""
+        if self.id:
+            return self.id
+        raw = json.dumps([
+            " ".join(self.topic.lower().split()),
+            " ".join(self.audience.lower().split()),
+            [s.lower() for s in self.subtopics],
+            " ".join((self.academic_level or "").lower().split())
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _lesson_spec(row: Dict[str, Any], where: str) -> LessonSpec:
+    topic = " ".join(str(row.get("topic") or "").split())
+    audience = " ".join(str(row.get("audience") or "").split())
+    if not topic or not audience:
+        raise ValueError(f"{where}: topic and audience are required")
+    subtopics = row.get("subtopics") or []
+    if isinstance(subtopics, str):
+        subtopics = subtopics.replace("|", ";").split(";")
+    return LessonSpec(
+        topic=topic,
+        audience=audience,
+        subtopics=normalize_subtopics([str(s) for s in subtopics]),
+        academic_level=(str(row.get("academic_level") or "").strip() or None),
+        id=(str(row.get("id") or "").strip() or None)
+    )
+
+
+def read_curriculum(path: str) -> List[LessonSpec]:
+    """
+    Read a curriculum file.
+
+    JSON Lines files (.jsonl) hold one object per line; CSV files have a
+    header row. Either way the fields are topic, audience and optionally
+    subtopics (a list, or a string separated by ";" or "|"),
+    academic_level and id.
+
+    Raises:
+        ValueError: If a row lacks its topic or audience, or a line is not valid JSON
+    """
+    specs = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson", ".json")):
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{number}: invalid JSON: {e}") from e
+                specs.append(_lesson_spec(row, f"{path}:{number}"))
+        else:
+            for number, row in enumerate(csv.DictReader(f), 2):
+                specs.append(_lesson_spec(row, f"{path}:{number}"))
+    return specs
+
+
+async def _none() -> None:
+    return None
+
+
+class CurriculumService:
+    """
+    Generation of whole lessons for bulk (curriculum) work.
+
+    A lesson is the educational content for its topic and audience,
+    optionally with deep research on the topic (stored in the research
+    store like any research) and images for its first image prompts.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.content_service = ContentService(settings)
+        self.image_service = ImageService(settings)
+
+    async def generate_lesson(self, spec: LessonSpec, research: bool = False, images: int = 0,
+                              image_provider: str = "nvidia") -> Dict[str, Any]:
+        """
+        Generate one lesson.
+
+        Args:
+            spec: Lesson to generate
+            research: Also generate deep research on the topic (with the spec's subtopics)
+            images: Number of image prompts to generate images for
+            image_provider: "nvidia" or "gemini"
+
+        Returns:
+            Dictionary with the lesson's key, topic, audience, subtopics, explanation,
+            image_prompts, research (or None), images (prompt and URL each), seconds,
+            and fallbacks: the parts served from mock data or a fallback, as "component:reason"
+        """
+        started = time.perf_counter()
+        with span("curriculum.lesson", audience=spec.audience), collect_fallbacks() as fallbacks:
+            # Research does not depend on the lesson text, so both are generated at once
+            content, research_result = await asyncio.gather(
+                self.content_service.generate_educational_content(spec.topic, spec.audience),
+                self._research(spec) if research else _none()
+            )
+
+            prompts = content.get("image_prompts", [])[:max(0, images)]
+            urls = await asyncio.gather(*(self._generate_image(prompt, image_provider) for prompt in prompts))
+            generated_images = [{"prompt": prompt, "image_url": url} for prompt, url in zip(prompts, urls)]
+
+        return {
+            "key": spec.key,
+            "topic": spec.topic,
+            "audience": spec.audience,
+            "subtopics": spec.subtopics,
+            "explanation": content.get("explanation"),
+            "image_prompts": content.get("image_prompts", []),
+            "research": research_result,
+            "images": generated_images,
+            "seconds": round(time.perf_counter() - started, 3),
+            "fallbacks": sorted({f"{component}:{reason}" for component, reason in fallbacks})
+        }
+
+    async def _research(self, spec: LessonSpec) -> Dict[str, Any]:
+        return await DeepResearchService(self.settings).generate_research(
+            topic=spec.topic,
+            subtopics=spec.subtopics or None,
+            academic_level=spec.academic_level or spec.audience,
+            include_references=True
+        )
+
+    async def _generate_image(self, prompt: str, provider: str) -> Optional[str]:
+        if provider == "gemini":
+            result = await self.image_service.generate_gemini_image(prompt=prompt)
+            if not result.get("success"):
+                raise RuntimeError(f"Gemini image generation failed: {result.get('error')}")
+            return result.get("image_url")
+        return await self.image_service.generate_image(prompt=prompt)
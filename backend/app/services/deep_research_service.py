@@ -1,10 +1,145 @@
 from config.settings import Settings
-from app.nvidia_api.llm_client import LLMClient
-from typing import Dict, List, Any, Optional
+from app.nvidia_api.llm_client import LLMClient, ResponseTruncated
+from app.services.json_extractor import JSONExtractionError, extract_json, iter_json_items
+from app.services.reference_service import ReferenceEnricher, parse_reference
+from app.services.prompt_builder import PromptBuilder, PromptSpec, normalize_level
+from app.core.prompt_templates import register_template, system_template, templates_version
+from app.services.research_store import ResearchStore, get_research_store, normalize_subtopics, outline_key, research_key, subtopic_hash, subtopics_hash
+from app.core.metrics import collect_fallbacks, record_cache, record_fallback
+from app.core.tracing import span
+from app.services.similarity_index import SimilarityIndex, get_similarity_index, similarity_threshold
+from app.services.lesson_library import get_lesson_library
+from app.core.deadlines import DeadlineExceeded
+from contextlib import aclosing
+from typing import Dict, List, Any, Optional, AsyncGenerator
 import json
+import logging
 import re
 import asyncio
 import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+_indexed_stores = set()
+_indexed_stores_lock = threading.Lock()
+
+# Prompt templates: the instructions come first and the request's topic, level and subtopics
+# last, so that the start of every prompt is the same and the upstream can reuse its prompt cache
+RESEARCH_OUTLINE_PROMPT = register_template("research_outline", """
+    Create an outline for a comprehensive research document.
+
+    List 4-6 content sections covering the key aspects of the topic, each with a clear title
+    and a one-sentence summary of what it covers.
+
+    Respond with a JSON object only, in this format:
+    {{
+      "sections": [{{"title": "Section title", "summary": "One-sentence summary"}}]{introduction_field}
+    }}
+
+    The research document is on "{topic}", suitable for {academic_level} level.
+""")
+
+TRENDING_TOPICS_PROMPT = register_template("trending_topics", """
+    Generate a list of trending educational topics for research.
+
+    For each topic, provide:
+    1. The topic name
+    2. A brief description (2-3 sentences)
+    3. Why it's currently relevant or trending
+
+    Format the response as a JSON array with objects containing "topic", "description", and "relevance" fields.
+
+    List {limit} topics suitable for {academic_level} level research.
+""")
+
+RESEARCH_PROMPT = register_template("research", """
+    Generate a comprehensive research document on the topic below.
+
+    The response should be structured as follows:
+
+    1. INTRODUCTION: A detailed introduction to the topic
+
+    2. SECTIONS: Multiple content sections covering key aspects of the topic
+       Each section should have a clear title and comprehensive content
+
+    3. KEY_CONCEPTS: A list of important concepts covered
+
+    4. VISUALIZATION_PROMPTS: 3-5 detailed prompts for generating visualizations that would enhance understanding
+
+    5. RELATED_TOPICS: 3-5 related topics with brief explanations of their relevance to the main topic
+
+    Format the response with clear section headings and detailed content for each section.
+    The content should be academically rigorous and appropriate for the academic level below.
+
+    {references_text}
+
+    The research document is on "{topic}", suitable for {academic_level} level.
+
+    {subtopics_text}
+
+    {outline_text}
+""")
+
+RESEARCH_SECTIONS_PROMPT = register_template("research_sections", """
+    Generate additional sections for an existing research document.
+
+    The response should be structured as follows:
+
+    1. SECTIONS: One section per subtopic, each starting with "## " followed by the subtopic as its title,
+       with comprehensive content
+
+    2. KEY_CONCEPTS: A list of important concepts covered in these sections
+
+    3. VISUALIZATION_PROMPTS: 1-2 detailed prompts for generating visualizations of these subtopics
+
+    Do not write an introduction or repeat general material about the main topic.
+    The content should be academically rigorous and appropriate for the academic level below.
+
+    {references_text}
+
+    The research document is on "{topic}", suitable for {academic_level} level.
+
+    Write exactly one section for each of these subtopics:
+    {subtopics_text}
+""")
+
+
+def research_prompt_version(settings: Settings) -> str:
+    """Version of the prompts stored research is generated with, part of its key"""
+    return templates_version(RESEARCH_PROMPT, RESEARCH_SECTIONS_PROMPT, system_template(settings.LLM_SYSTEM_MESSAGE))
+
+
+def outline_prompt_version(settings: Settings) -> str:
+    """Version of the prompt stored research outlines are generated with, part of their key"""
+    return templates_version(RESEARCH_OUTLINE_PROMPT, system_template(settings.LLM_SYSTEM_MESSAGE))
+
+
+def research_scope(academic_level: str, include_references: bool) -> str:
+    """Only research for the same academic level and reference choice is a near-duplicate"""
+    return f"{normalize_level(academic_level)}|{int(bool(include_references))}"
+
+
+def research_topic_index(settings: Settings) -> SimilarityIndex:
+    """
+    Index of the stored research topics, for near-duplicate lookups.
+    
+    Filled from the research store on first use (a blocking read, so call it
+    in a thread) and kept up to date as research is stored.
+    """
+    index = get_similarity_index("research", settings)
+    store = get_research_store(settings)
+    prompt_version = research_prompt_version(settings)
+    with _indexed_stores_lock:
+        if store.db_path not in _indexed_stores:
+            for record in store.topics(settings.SIMILARITY_INDEX_SIZE):
+                # Research generated with older prompts is no longer reused
+                if record["key"] != research_key(record["topic"], record["academic_level"], record["include_references"], prompt_version):
+                    continue
+                index.add(research_scope(record["academic_level"], record["include_references"]), record["topic"], record["key"])
+            _indexed_stores.add(store.db_path)
+    return index
+
 
 class DeepResearchService:
     """Service for deep educational research"""
@@ -12,6 +147,8 @@ class DeepResearchService:
     def __init__(self, settings: Settings):
         self.settings = settings
         self.llm_client = LLMClient(settings)
+        self.reference_enricher = ReferenceEnricher(settings)
+        self.prompt_builder = PromptBuilder(settings)
     
     async def generate_research(self, topic: str, subtopics: Optional[List[str]] = None, 
                                academic_level: str = "undergraduate", include_references: bool = True) -> Dict[str, Any]:
@@ -27,21 +164,404 @@ class DeepResearchService:
         Returns:
             Dictionary containing the research content
         """
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             # For development/demo, return mock data
+            record_fallback("research", "mock_mode")
             return self._generate_mock_research(topic, subtopics, academic_level, include_references)
         
-        # Construct prompt for the LLM
-        prompt = self._create_research_prompt(topic, subtopics, academic_level, include_references)
+        subtopics = normalize_subtopics(subtopics)
+        if not self.settings.RESEARCH_STORE_ENABLED:
+            try:
+                with collect_fallbacks() as fallbacks:
+                    research_content = await self._generate_full_research(topic, subtopics, academic_level, include_references)
+            except DeadlineExceeded:
+                return self._deadline_fallback(topic, subtopics, academic_level, include_references)
+            if not fallbacks:
+                get_lesson_library(self.settings).record("research", topic, academic_level, research_content, self.llm_client.model_id)
+            return research_content
         
-        # Call NVIDIA's LLM API
-        response = await self.llm_client.generate_text(prompt)
+        store = get_research_store(self.settings)
+        key = research_key(topic, academic_level, include_references, research_prompt_version(self.settings))
+        with span("research.store_lookup"):
+            stored = await asyncio.to_thread(store.get, key, self._store_max_age())
+            similar = False
+            if stored is None:
+                # Research on a near-duplicate topic ("Photosynthesis process" for "Photosynthesis") serves as well
+                stored = await self._similar_research(store, topic, academic_level, include_references)
+                similar = stored is not None
+        
+        if stored and stored["subtopics_hash"] == subtopics_hash(subtopics):
+            # Identical request: reuse the stored result as is
+            record_cache("research", "similar" if similar else "hit")
+            if similar:
+                # Also under this topic's own key, so that its GET URL finds it
+                try:
+                    await asyncio.to_thread(store.put, key, topic, academic_level, include_references, subtopics,
+                                            stored["payload"], stored["sections"])
+                except Exception as e:
+                    logger.error("Error saving research: %s", e, extra={"topic": topic})
+            return self._assemble_research(stored["payload"], stored["sections"])
+        
+        with collect_fallbacks() as fallbacks:
+            if stored:
+                # Same topic with a different subtopic list: only generate the new sections
+                record_cache("research", "partial")
+                try:
+                    payload, sections = await self._generate_incremental(stored, topic, subtopics, academic_level, include_references)
+                except DeadlineExceeded:
+                    # Out of time for the new subtopics: the stored research is better than nothing
+                    return self._deadline_fallback(topic, subtopics, academic_level, include_references, stored)
+            else:
+                record_cache("research", "miss")
+                try:
+                    research_content = await self._generate_full_research(topic, subtopics, academic_level, include_references)
+                except DeadlineExceeded:
+                    return self._deadline_fallback(topic, subtopics, academic_level, include_references)
+                payload = research_content
+                sections = self._attribute_sections(research_content["sections"], subtopics)
+        
+        if fallbacks:
+            # (Part of) the research is mock data: serve it, but never store it for later requests
+            return self._assemble_research(payload, sections)
+        
+        try:
+            with span("research.store_save", sections=len(sections)):
+                await asyncio.to_thread(store.put, key, topic, academic_level, include_references, subtopics, payload, sections)
+            get_similarity_index("research", self.settings).add(research_scope(academic_level, include_references), topic, key)
+        except Exception as e:
+            logger.error("Error saving research: %s", e, extra={"topic": topic})
+        
+        research_content = self._assemble_research(payload, sections)
+        get_lesson_library(self.settings).record("research", topic, academic_level, research_content, self.llm_client.model_id)
+        return research_content
+    
+    def research_url_key(self, topic: str, subtopics: Optional[List[str]], academic_level: str,
+                         include_references: bool) -> Optional[str]:
+        """
+        Key of the research for a request in its GET URL (/api/deep-research/research/{key}).
+        
+        The research store key of the normalized topic, level, references
+        choice and prompt versions, followed by the hash of the normalized subtopics; None when
+        research is not stored, so there is nothing to serve at the URL.
+        """
+        if not self.settings.RESEARCH_STORE_ENABLED:
+            return None
+        prompt_version = research_prompt_version(self.settings)
+        return research_key(topic, academic_level, include_references, prompt_version) + subtopics_hash(normalize_subtopics(subtopics))
+    
+    async def get_stored_research(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Stored research by the key of its GET URL (see research_url_key).
+        
+        Returns:
+            The research content, or None if none is stored for the key (or it
+            is now stored for other subtopics)
+        """
+        if not self.settings.RESEARCH_STORE_ENABLED:
+            return None
+        store = get_research_store(self.settings)
+        stored = await asyncio.to_thread(store.get, key[:64], self._store_max_age())
+        if stored is None or stored["subtopics_hash"] != key[64:]:
+            return None
+        return self._assemble_research(stored["payload"], stored["sections"])
+    
+    async def _similar_research(self, store: ResearchStore, topic: str, academic_level: str,
+                                include_references: bool) -> Optional[Dict[str, Any]]:
+        """Stored research on a topic similar enough to reuse (see SIMILAR_TOPIC_THRESHOLDS), or None"""
+        threshold = similarity_threshold(self.settings, "research")
+        if threshold is None:
+            return None
+        index = await asyncio.to_thread(research_topic_index, self.settings)
+        match = index.lookup(research_scope(academic_level, include_references), topic, threshold)
+        if match is None:
+            return None
+        key, similarity = match
+        stored = await asyncio.to_thread(store.get, key, self._store_max_age())
+        if stored is None:
+            index.remove(key)
+            return None
+        logger.debug("Reusing the stored research of a similar topic", extra={"topic": topic, "similarity": round(similarity, 3)})
+        return stored
+    
+    def _store_max_age(self) -> Optional[float]:
+        """Age after which stored research is generated again (RESEARCH_STORE_TTL; None: never)"""
+        return self.settings.RESEARCH_STORE_TTL if self.settings.RESEARCH_STORE_TTL > 0 else None
+    
+    def _deadline_fallback(self, topic: str, subtopics: List[str], academic_level: str, include_references: bool,
+                           stored: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Research to serve when the request's time budget ran out: stored research if any, else mock data"""
+        logger.warning("Research generation ran out of time, serving %s", "stored research" if stored else "fallback content",
+                       extra={"topic": topic})
+        record_fallback("research", "deadline")
+        if stored:
+            return self._assemble_research(stored["payload"], stored["sections"])
+        return self._generate_mock_research(topic, subtopics, academic_level, include_references)
+    
+    async def _generate_full_research(self, topic: str, subtopics: List[str], academic_level: str,
+                                      include_references: bool) -> Dict[str, Any]:
+        """
+        Generate research with the full research prompt.
+        
+        Without subtopics, a stored outline of the topic (e.g. one prefetched
+        while the user read research on a related topic) seeds the prompt: the
+        LLM writes its sections in order, and its introduction, if it has one,
+        is used instead of being generated again.
+        """
+        outline = await self._seed_outline(topic, subtopics, academic_level)
+        research_content = await self._generate_from_prompt(
+            self._build_research_prompt(topic, subtopics, academic_level, include_references, outline),
+            topic, academic_level, include_references
+        )
+        if outline and outline["introduction"]:
+            research_content["introduction"] = outline["introduction"]
+        return research_content
+    
+    async def _seed_outline(self, topic: str, subtopics: List[str], academic_level: str) -> Optional[Dict[str, Any]]:
+        """The stored outline to generate research from, or None"""
+        if subtopics or not self.settings.RESEARCH_OUTLINE_SEEDING:
+            # Requested subtopics decide the sections themselves
+            return None
+        try:
+            outline = await self.get_outline(topic, academic_level, generate=False)
+        except Exception as e:
+            logger.error("Error reading research outline: %s", e, extra={"topic": topic})
+            return None
+        record_cache("research_outline", "hit" if outline else "miss")
+        return outline
+    
+    def _build_research_prompt(self, topic: str, subtopics: List[str], academic_level: str, include_references: bool,
+                               outline: Optional[Dict[str, Any]] = None) -> PromptSpec:
+        """Create the full research prompt with an output budget sized to the level and subtopic count"""
+        with span("research.prompt_build", academic_level=academic_level, subtopics=len(subtopics),
+                  outline=outline is not None):
+            return self.prompt_builder.research(
+                self._create_research_prompt(topic, subtopics, academic_level, include_references, outline),
+                academic_level,
+                subtopic_count=len(subtopics),
+                introduction=not (outline and outline["introduction"])
+            )
+    
+    async def _generate_from_prompt(self, prompt: PromptSpec, topic: str, academic_level: str, include_references: bool) -> Dict[str, Any]:
+        """
+        Call the LLM with a research prompt and parse and enrich the response.
+        
+        Args:
+            prompt: Research prompt with its output budget
+            topic: Main research topic
+            academic_level: Academic level requested
+            include_references: Whether references were requested
+            
+        Returns:
+            Parsed research content
+        """
+        # Warm the citation index for this topic while the LLM is generating
+        enrich_references = include_references and self.settings.REFERENCE_ENRICHMENT_ENABLED
+        prefetch_task = asyncio.create_task(self.reference_enricher.prefetch(topic)) if enrich_references else None
+        
+        try:
+            # Call NVIDIA's LLM API
+            response = await self.llm_client.generate_text(prompt)
+        except ResponseTruncated as e:
+            # The research so far is still served, but as a fallback so that it is not stored
+            logger.warning("Research was cut off at its output budget", extra={"topic": topic, "max_tokens": e.max_tokens})
+            record_fallback("research", "truncated")
+            response = e.text
+        except BaseException:
+            if prefetch_task:
+                prefetch_task.cancel()
+            raise
         
         # Parse the response to extract research content
-        research_content = self._parse_research_response(response, topic, academic_level, include_references)
+        with span("research.parse", response_chars=len(response)):
+            research_content = self._parse_research_response(response, topic, academic_level, include_references)
+        
+        if enrich_references:
+            with span("research.enrich_references", references=len(research_content["references"])):
+                await prefetch_task
+                research_content["references"] = await self.reference_enricher.enrich(
+                    research_content["references"],
+                    research_content["sections"]
+                )
         
         return research_content
     
+    async def _generate_incremental(self, stored: Dict[str, Any], topic: str, subtopics: List[str],
+                                    academic_level: str, include_references: bool) -> tuple:
+        """
+        Build research for a changed subtopic list from a stored result.
+        
+        Sections about the main topic and about subtopics that are still requested
+        are reused; sections for removed subtopics are dropped, and only the added
+        subtopics are sent to the LLM.
+        
+        Args:
+            stored: Stored record from ResearchStore.get()
+            topic: Main research topic
+            subtopics: Normalized subtopic list of the new request
+            academic_level: Academic level requested
+            include_references: Whether references were requested
+            
+        Returns:
+            Tuple of (payload, sections) where sections carry their subtopic hash
+        """
+        payload = dict(stored["payload"])
+        requested = {subtopic_hash(s): s for s in subtopics}
+        previous = {subtopic_hash(s) for s in stored["subtopics"]}
+        added = [s for h, s in requested.items() if h not in previous]
+        
+        sections = [
+            section for section in stored["sections"]
+            if section["subtopic_hash"] is None or section["subtopic_hash"] in requested
+        ]
+        
+        if added:
+            with span("research.generate_sections", added=len(added), reused=len(sections)):
+                new_content = await self._generate_from_prompt(
+                    self.prompt_builder.research_sections(
+                        self._create_subtopic_sections_prompt(topic, added, academic_level, include_references),
+                        len(added)
+                    ),
+                    topic, academic_level, include_references
+                )
+            sections += self._attribute_sections(new_content["sections"], added, assign_unmatched=True)
+            payload["key_concepts"] = self._merge_unique(payload.get("key_concepts", []), new_content["key_concepts"])
+            payload["visualization_prompts"] = self._merge_unique(
+                payload.get("visualization_prompts", []), new_content["visualization_prompts"]
+            )
+            if include_references:
+                references = (payload.get("references") or []) + (new_content["references"] or [])
+                if self.settings.REFERENCE_ENRICHMENT_ENABLED:
+                    # Dedupe against the stored references (resolved ones are cache hits)
+                    references = await self.reference_enricher.enrich(references)
+                payload["references"] = references
+        
+        # Main topic sections first, then subtopic sections in the order they were requested
+        order = {h: i for i, h in enumerate(requested)}
+        sections.sort(key=lambda section: -1 if section["subtopic_hash"] is None else order[section["subtopic_hash"]])
+        
+        return payload, sections
+    
+    def _attribute_sections(self, sections: List[Dict[str, str]], subtopics: List[str], assign_unmatched: bool = False) -> List[Dict[str, Any]]:
+        """
+        Tag each section with the hash of the subtopic it covers.
+        
+        A section belongs to a subtopic when its title contains most of the
+        subtopic's words; other sections are about the main topic (hash None).
+        
+        Args:
+            sections: Parsed sections with "title" and "content"
+            subtopics: Subtopics the sections were generated for
+            assign_unmatched: Assign sections that match no subtopic by position
+                (used when every section was generated for one of the subtopics)
+            
+        Returns:
+            Sections with an added "subtopic_hash" field
+        """
+        subtopic_words = [(subtopic_hash(s), set(re.findall(r'\w+', s.lower()))) for s in subtopics]
+        attributed = []
+        for position, section in enumerate(sections):
+            title_words = set(re.findall(r'\w+', section["title"].lower()))
+            match = None
+            for hash_value, words in subtopic_words:
+                if words and len(words & title_words) / len(words) >= 0.6:
+                    match = hash_value
+                    break
+            if match is None and assign_unmatched and subtopic_words:
+                match = subtopic_words[min(position, len(subtopic_words) - 1)][0]
+            attributed.append({"title": section["title"], "content": section["content"], "subtopic_hash": match})
+        return attributed
+    
+    @staticmethod
+    def _assemble_research(payload: Dict[str, Any], sections: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the research response from a stored payload and its sections"""
+        research_content = dict(payload)
+        research_content["sections"] = [{"title": s["title"], "content": s["content"]} for s in sections]
+        return research_content
+    
+    @staticmethod
+    def _merge_unique(existing: List[str], new: List[str]) -> List[str]:
+        """Append new items to a list, skipping case-insensitive duplicates"""
+        seen = {item.lower() for item in existing}
+        merged = list(existing)
+        for item in new:
+            if item.lower() not in seen:
+                seen.add(item.lower())
+                merged.append(item)
+        return merged
+    
+    async def get_outline(self, topic: str, academic_level: str = "undergraduate", include_introduction: bool = False,
+                          generate: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get a research outline for a topic, from the research cache when available.
+        
+        Args:
+            topic: Research topic
+            academic_level: Academic level
+            include_introduction: Whether to also generate an introduction when not cached
+            generate: Whether to call the LLM on a cache miss
+            
+        Returns:
+            Dictionary with "sections" (title and summary), "introduction" and "cached",
+            or None on a cache miss when generate is False
+        """
+        store = get_research_store(self.settings)
+        key = outline_key(topic, academic_level, outline_prompt_version(self.settings))
+        
+        stored = await asyncio.to_thread(store.get_outline, key, self.settings.OUTLINE_CACHE_TTL)
+        hit = bool(stored and (stored["introduction"] or not include_introduction))
+        if generate:
+            # Probes by the prefetcher (generate=False) are not counted
+            record_cache("research_outline", "hit" if hit else "miss")
+        if hit:
+            return {"sections": stored["sections"], "introduction": stored["introduction"], "cached": True}
+        if not generate:
+            return None
+        
+        if self.settings.current("USE_MOCK_DATA"):
+            record_fallback("research_outline", "mock_mode")
+            return self._mock_outline(topic, academic_level, include_introduction)
+        
+        prompt = self.prompt_builder.outline(
+            self._create_outline_prompt(topic, academic_level, include_introduction),
+            include_introduction
+        )
+        truncated = False
+        try:
+            response = await self.llm_client.generate_text(prompt)
+        except ResponseTruncated as e:
+            # The sections parsed from the cut-off outline are used, but not stored
+            record_fallback("research_outline", "truncated")
+            response, truncated = e.text, True
+        except DeadlineExceeded:
+            # Out of time: an outline past its TTL (or without the introduction) beats a mock one
+            record_fallback("research_outline", "deadline")
+            stale = stored or await asyncio.to_thread(store.get_outline, key)
+            if stale:
+                return {"sections": stale["sections"], "introduction": stale["introduction"], "cached": True}
+            return self._mock_outline(topic, academic_level, include_introduction)
+        
+        with span("research.outline_parse", response_chars=len(response)):
+            outline = extract_json(response)
+        if not isinstance(outline, dict):
+            outline = {"sections": outline if isinstance(outline, list) else []}
+        sections = [
+            {"title": str(item.get("title", "")).strip(), "summary": str(item.get("summary", "")).strip()}
+            for item in outline.get("sections", []) if isinstance(item, dict) and item.get("title")
+        ]
+        if not sections:
+            raise ValueError(f"No outline sections found in response for {topic}")
+        introduction = outline.get("introduction") if include_introduction else None
+        
+        if not truncated:
+            await asyncio.to_thread(store.put_outline, key, topic, academic_level, sections, introduction)
+        return {"sections": sections, "introduction": introduction, "cached": False}
+    
+    def _mock_outline(self, topic: str, academic_level: str, include_introduction: bool) -> Dict[str, Any]:
+        """Outline built from the mock research content"""
+        mock = self._generate_mock_research(topic, None, academic_level, False)
+        sections = [{"title": s["title"], "summary": s["content"].strip().split("\n")[0]} for s in mock["sections"]]
+        return {"sections": sections, "introduction": mock["introduction"] if include_introduction else None, "cached": False}
+    
     async def get_trending_topics(self, academic_level: str = "undergraduate", limit: int = 10) -> List[Dict[str, str]]:
         """
         Get trending educational topics for research.
@@ -53,72 +573,132 @@ class DeepResearchService:
         Returns:
             List of trending topics with descriptions
         """
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             # For development/demo, return mock trending topics
+            record_fallback("trending_topics", "mock_mode")
             return self._generate_mock_trending_topics(academic_level, limit)
         
         # Construct prompt for the LLM
-        prompt = f"""
-        Generate a list of {limit} trending educational topics suitable for {academic_level} level research.
-        
-        For each topic, provide:
-        1. The topic name
-        2. A brief description (2-3 sentences)
-        3. Why it's currently relevant or trending
-        
-        Format the response as a JSON array with objects containing "topic", "description", and "relevance" fields.
-        """
+        prompt = self.prompt_builder.trending_topics(self._create_trending_topics_prompt(academic_level, limit), limit)
         
         # Call NVIDIA's LLM API
-        response = await self.llm_client.generate_text(prompt)
+        try:
+            response = await self.llm_client.generate_text(prompt)
+        except ResponseTruncated as e:
+            # The topics completed before the cut-off are still usable
+            record_fallback("trending_topics", "truncated")
+            response = e.text
+        except DeadlineExceeded:
+            record_fallback("trending_topics", "deadline")
+            return self._generate_mock_trending_topics(academic_level, limit)
         
         # Parse the response to extract topics
         try:
-            # Try to parse as JSON
-            topics_data = json.loads(response)
-            
-            # Ensure we have the right structure
-            if isinstance(topics_data, list) and all("topic" in item for item in topics_data):
-                # Limit to requested number of topics
-                return topics_data[:limit]
-            else:
-                # Fallback if structure is wrong
-                return self._generate_mock_trending_topics(academic_level, limit)
-        except:
+            # Pull the JSON array out of any preamble, fences or trailing commentary
+            topics_data = extract_json(response)
+        except JSONExtractionError:
             # Fallback if parsing fails
+            record_fallback("trending_topics", "parse_error")
             return self._generate_mock_trending_topics(academic_level, limit)
-    
-    def _create_research_prompt(self, topic: str, subtopics: Optional[List[str]], academic_level: str, include_references: bool) -> str:
-        """Create a prompt for the LLM to generate comprehensive research"""
-        subtopics_text = ""
-        if subtopics and len(subtopics) > 0:
-            subtopics_text = "Focus on these specific subtopics:\n" + "\n".join([f"- {subtopic}" for subtopic in subtopics])
         
-        references_text = "Include academic references in Chicago style at the end." if include_references else "Do not include references."
+        # Ensure we have the right structure
+        if isinstance(topics_data, list):
+            topics = [item for item in topics_data if self._is_valid_topic(item)]
+            if topics:
+                # Limit to requested number of topics
+                return topics[:limit]
         
-        return f"""
-        Generate a comprehensive research document on "{topic}" suitable for {academic_level} level.
+        # Fallback if structure is wrong
+        record_fallback("trending_topics", "parse_error")
+        return self._generate_mock_trending_topics(academic_level, limit)
+    
+    async def stream_trending_topics(self, academic_level: str = "undergraduate", limit: int = 10) -> AsyncGenerator[Dict[str, str], None]:
+        """
+        Stream trending educational topics, yielding each one as soon as the LLM has finished it.
         
-        {subtopics_text}
+        Args:
+            academic_level: Academic level filter
+            limit: Maximum number of topics to return
+            
+        Yields:
+            Trending topics with descriptions
+        """
+        if self.settings.current("USE_MOCK_DATA"):
+            record_fallback("trending_topics", "mock_mode")
+            for topic in self._generate_mock_trending_topics(academic_level, limit):
+                yield topic
+            return
         
-        The response should be structured as follows:
+        prompt = self.prompt_builder.trending_topics(self._create_trending_topics_prompt(academic_level, limit), limit)
         
-        1. INTRODUCTION: A detailed introduction to the topic
+        count = 0
+        timed_out = False
+        try:
+            async with aclosing(iter_json_items(self.llm_client.shared_text_stream(prompt))) as items:
+                async for item in items:
+                    if not self._is_valid_topic(item):
+                        continue
+                    yield item
+                    count += 1
+                    if count >= limit:
+                        return
+        except ResponseTruncated:
+            # The topics completed before the cut-off have been sent
+            record_fallback("trending_topics", "truncated")
+        except DeadlineExceeded:
+            # Keep the topics already sent; fall back only if there are none
+            timed_out = True
         
-        2. SECTIONS: Multiple content sections covering key aspects of the topic
-           Each section should have a clear title and comprehensive content
+        # Fallback if the stream produced no usable topics
+        if count == 0:
+            record_fallback("trending_topics", "deadline" if timed_out else "parse_error")
+            for topic in self._generate_mock_trending_topics(academic_level, limit):
+                yield topic
+    
+    def _create_outline_prompt(self, topic: str, academic_level: str, include_introduction: bool) -> str:
+        """Create a prompt for the LLM to outline a research document"""
+        introduction_field = (
+            ',\n  "introduction": "A detailed introduction to the topic (2-3 paragraphs, markdown)"'
+            if include_introduction else ""
+        )
+        return RESEARCH_OUTLINE_PROMPT.render(topic=topic, academic_level=academic_level, introduction_field=introduction_field)
+    
+    def _create_trending_topics_prompt(self, academic_level: str, limit: int) -> str:
+        """Create a prompt for the LLM to list trending research topics"""
+        return TRENDING_TOPICS_PROMPT.render(academic_level=academic_level, limit=limit)
+    
+    @staticmethod
+    def _is_valid_topic(item: Any) -> bool:
+        """Check that a parsed trending topic has the expected structure"""
+        return isinstance(item, dict) and "topic" in item
+    
+    def _create_research_prompt(self, topic: str, subtopics: Optional[List[str]], academic_level: str, include_references: bool,
+                                outline: Optional[Dict[str, Any]] = None) -> str:
+        """Create a prompt for the LLM to generate comprehensive research, following an outline if given"""
+        subtopics_text = ""
+        if subtopics and len(subtopics) > 0:
+            subtopics_text = "Focus on these specific subtopics:\n" + "\n".join([f"- {subtopic}" for subtopic in subtopics])
         
-        3. KEY_CONCEPTS: A list of important concepts covered
+        outline_text = ""
+        if outline:
+            outline_text = "Write one section for each part of this outline, in this order, each starting with \"## \" followed by its title:\n"
+            outline_text += "\n".join(f"- {section['title']}: {section['summary']}" for section in outline["sections"])
+            if outline["introduction"]:
+                outline_text += "\n\nThe introduction is already written: leave out INTRODUCTION and start with SECTIONS."
         
-        4. VISUALIZATION_PROMPTS: 3-5 detailed prompts for generating visualizations that would enhance understanding
+        references_text = "Include academic references in Chicago style at the end." if include_references else "Do not include references."
         
-        5. RELATED_TOPICS: 3-5 related topics with brief explanations of their relevance to the main topic
+        return RESEARCH_PROMPT.render(topic=topic, academic_level=academic_level, subtopics_text=subtopics_text,
+                                      references_text=references_text, outline_text=outline_text)
+    
+    def _create_subtopic_sections_prompt(self, topic: str, subtopics: List[str], academic_level: str, include_references: bool) -> str:
+        """Create a prompt for the LLM to generate only the sections for the given subtopics"""
+        subtopics_text = "\n".join([f"- {subtopic}" for subtopic in subtopics])
         
-        {references_text}
+        references_text = "Include academic references for these sections in Chicago style at the end." if include_references else "Do not include references."
         
-        Format the response with clear section headings and detailed content for each section.
-        The content should be academically rigorous and appropriate for {academic_level} level.
-        """
+        return RESEARCH_SECTIONS_PROMPT.render(topic=topic, academic_level=academic_level, subtopics_text=subtopics_text,
+                                               references_text=references_text)
     
     def _parse_research_response(self, response: str, topic: str, academic_level: str, include_references: bool) -> Dict[str, Any]:
         """
@@ -216,32 +796,16 @@ class DeepResearchService:
                     
                     # Process each reference
                     for ref in ref_lines:
-                        if not ref or ref.startswith('-') or len(ref) < 10:
-                            continue
-                        
-                        # Extract basic reference data
-                        author_match = re.search(r'^([^\.]+)', ref)
-                        title_match = re.search(r'"([^"]+)"', ref) or re.search(r'"([^"]+)"', ref)
-                        year_match = re.search(r'\((\d{4})\)', ref) or re.search(r',\s*(\d{4})\b', ref)
-                        doi_match = re.search(r'(10\.\d{4,}(?:\.\d+)*\/\S+)', ref)
-                        url_match = re.search(r'(https?://\S+)', ref)
-                        
-                        # Construct reference object
-                        reference = {
-                            "title": title_match.group(1) if title_match else "Unknown title",
-                            "authors": [a.strip() for a in author_match.group(1).split(',') if a.strip()] if author_match else ["Unknown author"],
-                            "year": int(year_match.group(1)) if year_match else None,
-                            "doi": doi_match.group(1) if doi_match else None,
-                            "url": url_match.group(1) if url_match else None
-                        }
-                        
-                        research_content["references"].append(reference)
+                        reference = parse_reference(ref)
+                        if reference:
+                            research_content["references"].append(reference)
             
             return research_content
             
         except Exception as e:
             # If parsing fails, return a default structure
-            print(f"Error parsing research response: {str(e)}")
+            logger.warning("Error parsing research response: %s", e, extra={"topic": topic})
+            record_fallback("research", "parse_error")
             return self._generate_mock_research(topic, None, academic_level, include_references)
     
     def _generate_mock_research(self, topic: str, subtopics: Optional[List[str]], academic_level: str, include_references: bool) -> Dict[str, Any]:
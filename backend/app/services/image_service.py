@@ -1,6 +1,9 @@
-from config.settings import Settings
+from config.settings import Settings, get_override, settings_override
 from app.nvidia_api.image_client import NvidiaImageClient
 from app.gemini_api.gemini_image_client import GeminiImageClient
+from app.core.metrics import record_fallback
+from app.core.tracing import span
+from app.core.deadlines import DeadlineExceeded
 from typing import Dict, List, Any
 import asyncio
 import time
@@ -8,8 +11,6 @@ import random
 import hashlib
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class ImageService:
@@ -30,15 +31,22 @@ class ImageService:
         Returns:
             URL to the generated image
         """
-        if self.settings.USE_MOCK_DATA:
+        if self.settings.current("USE_MOCK_DATA"):
             # For development/demo, return a placeholder image
+            record_fallback("image", "mock_mode")
             return self._generate_mock_image(prompt)
         
         # Enhance the prompt for educational context
         enhanced_prompt = self._enhance_prompt(prompt)
         
         # Call NVIDIA's text-to-image API
-        image_url = await self.image_client.generate_image(enhanced_prompt)
+        with span("image.generate", provider="nvidia"):
+            try:
+                image_url = await self.image_client.generate_image(enhanced_prompt)
+            except DeadlineExceeded:
+                logger.warning("Image generation ran out of time, serving a placeholder")
+                record_fallback("image", "deadline")
+                return self._generate_mock_image(prompt)
         
         return image_url
     
@@ -55,18 +63,15 @@ class ImageService:
         Returns:
             Dictionary containing success status, image URL, and any error message
         """
-        logger.info(f"Starting Gemini image generation for prompt: {prompt[:50]}...")
-        logger.info(f"USE_MOCK_DATA is set to: {self.settings.USE_MOCK_DATA}")
-        
-        # Force mock mode to off for image generation
-        original_mock_setting = self.settings.USE_MOCK_DATA
-        self.settings.USE_MOCK_DATA = False
-        logger.info(f"Forced USE_MOCK_DATA to: {self.settings.USE_MOCK_DATA}")
-        
+        # Gemini images are generated even with USE_MOCK_DATA set, unless the request itself asked for mock data
+        with settings_override(USE_MOCK_DATA=get_override("USE_MOCK_DATA", False)):
+            return await self._generate_gemini_image(prompt, filename_prefix)
+    
+    async def _generate_gemini_image(self, prompt: str, filename_prefix: str = None) -> Dict[str, Any]:
+        """Generate a Gemini image, or a placeholder in mock mode"""
         try:
-            if self.settings.USE_MOCK_DATA:
+            if self.settings.current("USE_MOCK_DATA"):
                 # For development/demo, return a placeholder image URL
-                logger.info("Using mock data for image generation")
                 mock_url = self._generate_mock_image(prompt)
                 return {
                     "success": True,
@@ -77,26 +82,22 @@ class ImageService:
             
             # Enhance the prompt for educational context
             enhanced_prompt = self._enhance_prompt(prompt)
-            logger.info(f"Enhanced prompt: {enhanced_prompt[:50]}...")
             
             # Call Gemini's text-to-image API
-            logger.info("Calling Gemini image client...")
-            result = await self.gemini_client.generate_image(enhanced_prompt, filename_prefix)
-            logger.info(f"Gemini image generation result: {result}")
+            with span("image.generate", provider="gemini") as image_span:
+                result = await self.gemini_client.generate_image(enhanced_prompt, filename_prefix)
+                image_span.set_attribute("success", result.get("success"))
+            logger.info("Gemini image generated", extra={"success": result.get("success"), "image_url": result.get("image_url")})
             
             return result
         except Exception as e:
-            logger.error(f"Error in generate_gemini_image: {str(e)}")
+            logger.exception("Error in generate_gemini_image: %s", e)
             return {
                 "success": False,
                 "image_url": None,
                 "file_path": None,
                 "error": str(e)
             }
-        finally:
-            # Restore original mock setting
-            self.settings.USE_MOCK_DATA = original_mock_setting
-            logger.info(f"Restored USE_MOCK_DATA to: {self.settings.USE_MOCK_DATA}")
     
     def _enhance_prompt(self, prompt: str) -> str:
         """
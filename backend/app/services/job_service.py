@@ -0,0 +1,516 @@
+from config.settings import OVERRIDABLE_SETTINGS, Settings, get_override, settings_override
+from app.models.deep_research_schemas import DeepResearchRequest
+from app.models.job_schemas import CurriculumJobParams, ImageBatchJobParams
+from app.services.job_store import FINAL_STATUSES, JobStore, get_job_store
+from app.core.deadlines import DeadlineExceeded, deadline_scope
+from app.core.lifecycle import get_drain_state
+from app.core.metrics import JOB_DURATION, JOBS_FINISHED
+from app.core.tracing import span
+from app.core.upstream_clients import get_webhook_session
+from app.core.webhook_targets import WebhookTargetRejected, check_webhook_url, parse_allowed_hosts
+from app.core.upstream_scheduler import priority_class
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Type
+from pydantic import BaseModel, ValidationError
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of expired jobs by each worker process
+PURGE_INTERVAL = 3600.0
+
+# Longest interval between lease renewals, which is also when a worker sees a cancellation made by another worker
+RENEW_INTERVAL = 5.0
+
+
+class JobContext:
+    """Handle through which a running job reports its progress"""
+
+    def __init__(self, queue: "JobQueue", job: Dict[str, Any]):
+        self.queue = queue
+        self.job_id = job["id"]
+        self.settings = queue.settings
+
+    async def progress(self, completed: int, total: int, message: Optional[str] = None) -> None:
+        """Record progress; clients following the job's events see it at once"""
+        await asyncio.to_thread(self.queue.store.set_progress, self.job_id, self.queue.worker_id, completed, total, message)
+        self.queue.notify(self.job_id)
+
+
+class JobKind(NamedTuple):
+    params_model: Type[BaseModel]
+    handler: Callable[[Dict[str, Any], JobContext], Awaitable[Any]]
+
+
+# Job kinds by name; register_job_kind() adds one
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def register_job_kind(name: str, params_model: Type[BaseModel]):
+    """Register an async handler(params, context) returning the job's JSON-serializable result"""
+    def decorator(handler):
+        JOB_KINDS[name] = JobKind(params_model, handler)
+        return handler
+    return decorator
+
+
+def validate_job(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check a job submission and normalize its parameters.
+
+    Raises:
+        ValueError: If the kind is unknown or the parameters are invalid
+    """
+    job_kind = JOB_KINDS.get(kind)
+    if job_kind is None:
+        raise ValueError(f"Unknown job kind: {kind} (expected one of {', '.join(sorted(JOB_KINDS))})")
+    try:
+        return job_kind.params_model(**params).model_dump()
+    except ValidationError as e:
+        raise ValueError(f"Invalid parameters for {kind} job: {e.errors(include_url=False)}") from e
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a stored job that are shown to clients (JobResponse)"""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "webhook_status": job["webhook_status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+
+async def _gather_items(context: JobContext, items: List[str], run, item_field: str) -> List[Dict[str, Any]]:
+    """
+    Run run(item) for each item, JOB_ITEM_CONCURRENCY at a time, reporting progress as items finish.
+
+    A failed item is recorded as {item_field: item, "error": ...}; the job only fails if every item does.
+    """
+    semaphore = asyncio.Semaphore(max(1, context.settings.JOB_ITEM_CONCURRENCY))
+    completed = 0
+    await context.progress(0, len(items))
+
+    async def run_one(item):
+        nonlocal completed
+        async with semaphore:
+            try:
+                result = await run(item)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning("Job item failed: %s", e, extra={"job_id": context.job_id})
+                result = {item_field: item, "error": str(e) or type(e).__name__}
+        completed += 1
+        await context.progress(completed, len(items), f"{'Failed' if result.get('error') else 'Generated'} {item[:60]}")
+        return result
+
+    results = await asyncio.gather(*(run_one(item) for item in items))
+    if all(result.get("error") for result in results):
+        raise RuntimeError(f"All {len(items)} items failed, e.g.: {results[0]['error']}")
+    return results
+
+
+@register_job_kind("deep_research", DeepResearchRequest)
+async def run_deep_research(params: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Deep research on a topic; the result is the /api/deep-research/research response"""
+    from app.services.deep_research_service import DeepResearchService
+
+    await context.progress(0, 1, f"Researching {params['topic']}")
+    result = await DeepResearchService(context.settings).generate_research(
+        topic=params["topic"],
+        subtopics=params["subtopics"],
+        academic_level=params["academic_level"],
+        include_references=params["include_references"]
+    )
+    await context.progress(1, 1, "Research complete")
+    return result
+
+
+@register_job_kind("images", ImageBatchJobParams)
+async def run_image_batch(params: Dict[str, Any], context: JobContext) -> List[Dict[str, Any]]:
+    """One image per prompt; the result lists each prompt with its image URL or error"""
+    from app.services.image_service import ImageService
+
+    image_service = ImageService(context.settings)
+
+    async def generate(prompt: str) -> Dict[str, Any]:
+        if params["provider"] == "gemini":
+            result = await image_service.generate_gemini_image(prompt=prompt)
+            return {"prompt": prompt, "image_url": result.get("image_url"), "error": result.get("error")}
+        return {"prompt": prompt, "image_url": await image_service.generate_image(prompt=prompt), "error": None}
+
+    return await _gather_items(context, params["prompts"], generate, "prompt")
+
+
+@register_job_kind("curriculum", CurriculumJobParams)
+async def run_curriculum(params: Dict[str, Any], context: JobContext) -> List[Dict[str, Any]]:
+    """One lesson (see CurriculumService.generate_lesson) per topic, optionally with an image"""
+    from app.services.curriculum_service import CurriculumService, LessonSpec
+
+    curriculum_service = CurriculumService(context.settings)
+
+    async def generate(topic: str) -> Dict[str, Any]:
+        lesson = await curriculum_service.generate_lesson(
+            LessonSpec(topic=topic, audience=params["audience"]),
+            images=1 if params["generate_images"] else 0
+        )
+        return {**lesson, "error": None}
+
+    return await _gather_items(context, params["topics"], generate, "topic")
+
+
+def _request_hash(kind: str, params: Dict[str, Any], webhook_url: Optional[str], overrides: Dict[str, Any]) -> str:
+    raw = json.dumps([kind, params, webhook_url, overrides], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _current_overrides() -> Dict[str, Any]:
+    """Settings overridden for the current request, which the job keeps when it runs later"""
+    missing = object()
+    overrides = {}
+    for name in sorted(OVERRIDABLE_SETTINGS):
+        value = get_override(name, missing)
+        if value is not missing:
+            overrides[name] = value
+    return overrides
+
+
+class JobQueue:
+    """
+    Background jobs for work too long to hold a request open for.
+
+    Jobs are submitted to the JobStore (a SQLite file shared by the worker
+    processes of a host) and run by JOB_WORKERS worker tasks in each process,
+    so a burst of jobs never takes more than that from a worker's upstream
+    capacity. Running jobs renew a lease; the jobs of a crashed or restarted
+    worker are run again by any worker once the lease expires, and a worker
+    shutting down puts its running jobs back in the queue. Per-request
+    setting overrides at submission (e.g. mock mode) apply when the job runs.
+    Jobs' upstream calls run in the background priority class, behind
+    interactive requests.
+
+    When a job finishes, the worker that ran it POSTs the job to its
+    webhook_url (if any), retrying JOB_WEBHOOK_RETRIES times.
+    """
+
+    def __init__(self, settings: Settings, store: Optional[JobStore] = None):
+        self.settings = settings
+        self.store = store or get_job_store(settings)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._signal: Optional[asyncio.Semaphore] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelling: Set[str] = set()
+        self._webhooks: Set[asyncio.Task] = set()
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        self._last_purge = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Start the worker tasks of this process"""
+        if self._workers:
+            return
+        self._signal = asyncio.Semaphore(0)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, self.settings.JOB_WORKERS))]
+        logger.info("Job workers started", extra={"workers": len(self._workers), "worker_id": self.worker_id})
+
+    async def stop(self) -> None:
+        """Stop the workers; their running jobs go back to the queue for the next worker to pick up"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if self._webhooks:
+            # Give webhooks of jobs that just finished a moment to be delivered
+            await asyncio.wait(set(self._webhooks), timeout=self.settings.JOB_WEBHOOK_TIMEOUT)
+
+    def notify(self, job_id: str) -> None:
+        """Wake up clients of this process following a job's events"""
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    async def submit(self, kind: str, params: Dict[str, Any], webhook_url: Optional[str] = None,
+                     idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job.
+
+        Args:
+            kind: Job kind (see JOB_KINDS)
+            params: Parameters of the kind
+            webhook_url: URL to notify when the job has finished
+            idempotency_key: Client key; submitting the same job with it again returns the first job
+
+        Returns:
+            The job and whether it was created (False when returned for an idempotency key)
+
+        Raises:
+            ValueError: If the kind or parameters are invalid, or the webhook URL is not allowed
+                (WebhookTargetRejected, see JOB_WEBHOOK_ALLOWED_HOSTS)
+            IdempotencyConflict: If the key was used for a different job
+            QueueFull: If JOB_MAX_QUEUED jobs are already queued
+        """
+        params = validate_job(kind, params)
+        if webhook_url:
+            await check_webhook_url(webhook_url, parse_allowed_hosts(self.settings.JOB_WEBHOOK_ALLOWED_HOSTS))
+        overrides = _current_overrides()
+        job, created = await asyncio.to_thread(
+            self.store.create, kind, params, overrides, webhook_url, idempotency_key,
+            _request_hash(kind, params, webhook_url, overrides), self.settings.JOB_MAX_QUEUED
+        )
+        if created:
+            logger.info("Job queued", extra={"job_id": job["id"], "kind": kind})
+            if self._signal is not None:
+                self._signal.release()
+        return job, created
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job, or ask the worker running it to stop"""
+        job = await asyncio.to_thread(self.store.cancel, job_id)
+        if job is not None:
+            task = self._running.get(job_id)
+            if task is not None and job["cancel_requested"]:
+                # Running in this process: stop it now rather than at the next lease renewal
+                self._cancelling.add(job_id)
+                task.cancel()
+            self.notify(job_id)
+            if job["status"] == "cancelled" and job["webhook_status"] == "pending":
+                self._send_webhook(job_id)
+        return job
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a job each time it changes, until it has finished.
+
+        Changes made in this process are seen at once, those made by other
+        worker processes within JOB_POLL_INTERVAL. Stops early when this
+        worker starts draining for shutdown; clients should reconnect.
+        """
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        try:
+            seen = None
+            while True:
+                state = await asyncio.to_thread(self.store.version, job_id)
+                if state is None:
+                    return
+                if state[0] != seen:
+                    seen = state[0]
+                    job = await asyncio.to_thread(self.store.get, job_id)
+                    yield job
+                    if job["status"] in FINAL_STATUSES:
+                        return
+                if get_drain_state().draining:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), self.settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    async def _worker(self) -> None:
+        settings = self.settings
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.worker_id, settings.JOB_LEASE_SECONDS,
+                                              settings.JOB_MAX_ATTEMPTS)
+            except Exception as e:
+                logger.warning("Could not claim a job: %s", e)
+                job = None
+            if job is not None:
+                await self._run(job)
+                continue
+            await self._purge()
+            try:
+                await asyncio.wait_for(self._signal.acquire(), settings.JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _purge(self) -> None:
+        """Delete jobs finished more than JOB_RETENTION seconds ago, now and then"""
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        try:
+            purged = await asyncio.to_thread(self.store.purge, self.settings.JOB_RETENTION)
+        except Exception as e:
+            logger.warning("Could not purge finished jobs: %s", e)
+            return
+        if purged:
+            logger.info("Purged finished jobs", extra={"jobs": purged})
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Run one claimed job, renewing its lease until it finishes"""
+        settings = self.settings
+        job_id, kind = job["id"], job["kind"]
+        job_kind = JOB_KINDS.get(kind)
+        started = time.perf_counter()
+        logger.info("Job started", extra={"job_id": job_id, "kind": kind, "attempt": job["attempts"]})
+        self.notify(job_id)
+        if job_kind is None:
+            await self._finish(job, "failed", error=f"Unknown job kind: {kind}", started=started)
+            return
+
+        # The job runs with the overrides of the request that submitted it, its own time budget, and
+        # below interactive requests in the upstream scheduler
+        with settings_override(**(job["overrides"] or {})), deadline_scope(settings.JOB_TIMEOUT or None), \
+                priority_class("background"):
+            task = asyncio.create_task(self._execute(job_kind, job))
+        self._running[job_id] = task
+
+        cancelled = lost = False
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=min(settings.JOB_LEASE_SECONDS / 3, RENEW_INTERVAL))
+                if task.done():
+                    break
+                try:
+                    cancel_requested = await asyncio.to_thread(self.store.renew, job_id, self.worker_id,
+                                                               settings.JOB_LEASE_SECONDS)
+                except Exception as e:
+                    logger.warning("Could not renew job lease: %s", e, extra={"job_id": job_id})
+                    continue
+                if cancel_requested is None:
+                    lost = True
+                    task.cancel()
+                elif cancel_requested:
+                    cancelled = True
+                    task.cancel()
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # The worker is stopping: stop the job and hand it to the next worker
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.to_thread(self.store.release, job_id, self.worker_id)
+            logger.info("Job released for another worker", extra={"job_id": job_id, "kind": kind})
+            raise
+        finally:
+            self._running.pop(job_id, None)
+            if job_id in self._cancelling:
+                self._cancelling.discard(job_id)
+                cancelled = True
+
+        if lost:
+            logger.warning("Job lease was lost to another worker", extra={"job_id": job_id, "kind": kind})
+        elif cancelled or task.cancelled():
+            await self._finish(job, "cancelled", started=started)
+        elif isinstance(task.exception(), DeadlineExceeded):
+            await self._finish(job, "failed", error=f"Job did not finish within {settings.JOB_TIMEOUT:.0f}s",
+                               started=started)
+        elif task.exception() is not None:
+            error = task.exception()
+            logger.error("Job failed: %s", error, exc_info=error, extra={"job_id": job_id, "kind": kind})
+            await self._finish(job, "failed", error=str(error) or type(error).__name__, started=started)
+        else:
+            await self._finish(job, "succeeded", result=task.result(), started=started)
+
+    async def _execute(self, job_kind: JobKind, job: Dict[str, Any]) -> Any:
+        with span("job.run", kind=job["kind"], job_id=job["id"]):
+            return await job_kind.handler(job["params"], JobContext(self, job))
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None,
+                      started: Optional[float] = None) -> None:
+        job_id, kind = job["id"], job["kind"]
+        try:
+            owned = await asyncio.to_thread(self.store.finish, job_id, self.worker_id, status, result, error)
+        except (TypeError, ValueError) as e:
+            # The result could not be stored as JSON
+            status, error = "failed", f"Job result could not be stored: {e}"
+            owned = await asyncio.to_thread(self.store.finish, job_id, self.worker_id, status, None, error)
+        if not owned:
+            logger.warning("Job finished after its lease was lost", extra={"job_id": job_id, "kind": kind})
+            return
+
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        JOBS_FINISHED.inc(kind=kind, status=status)
+        JOB_DURATION.observe(seconds, kind=kind, status=status)
+        logger.info("Job finished", extra={"job_id": job_id, "kind": kind, "status": status,
+                                           "seconds": round(seconds, 3)})
+        self.notify(job_id)
+        if job["webhook_url"]:
+            self._send_webhook(job_id)
+
+    def _send_webhook(self, job_id: str) -> None:
+        task = asyncio.create_task(self._deliver_webhook(job_id))
+        self._webhooks.add(task)
+        task.add_done_callback(self._webhooks.discard)
+
+    async def _deliver_webhook(self, job_id: str) -> None:
+        """POST the finished job to its webhook URL, retrying with exponential backoff"""
+        import aiohttp
+
+        settings = self.settings
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or not job["webhook_url"]:
+            return
+        body = json.dumps(public_job(job)).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-EduAI-Job-Id": job_id}
+        if settings.JOB_WEBHOOK_SECRET:
+            signature = hmac.new(settings.JOB_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-EduAI-Signature"] = f"sha256={signature}"
+
+        status = "failed"
+        allowed_hosts = parse_allowed_hosts(settings.JOB_WEBHOOK_ALLOWED_HOSTS)
+        try:
+            # Checked again: the allow-list or the host's addresses may have changed since the job was submitted
+            await check_webhook_url(job["webhook_url"], allowed_hosts)
+        except WebhookTargetRejected as e:
+            logger.warning("Webhook not delivered: %s", e, extra={"job_id": job_id})
+            await asyncio.to_thread(self.store.set_webhook_status, job_id, status)
+            self.notify(job_id)
+            return
+        for attempt in range(max(1, settings.JOB_WEBHOOK_RETRIES)):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                # Redirects are not followed, as they could lead to internal addresses
+                async with get_webhook_session(allowed_hosts).post(
+                    job["webhook_url"], data=body, headers=headers, allow_redirects=False,
+                    timeout=aiohttp.ClientTimeout(total=settings.JOB_WEBHOOK_TIMEOUT)
+                ) as response:
+                    await response.read()
+                    if 200 <= response.status < 300:
+                        status = "delivered"
+                        break
+                    logger.warning("Webhook answered %s", response.status, extra={"job_id": job_id})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Webhook delivery failed: %s", e, extra={"job_id": job_id})
+        await asyncio.to_thread(self.store.set_webhook_status, job_id, status)
+        self.notify(job_id)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue(settings: Settings) -> JobQueue:
+    """Get the job queue of this process"""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(settings)
+    return _queue
@@ -0,0 +1,310 @@
+from config.settings import Settings
+from typing import Dict, Any, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Job statuses; the last three are final
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    """Raised when JOB_MAX_QUEUED jobs are already waiting"""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different job"""
+
+
+class JobStore:
+    """
+    SQLite-backed store of background jobs; the store is also the queue.
+
+    Any worker process of the host can pick up a queued job: claim() marks
+    the oldest one as running under a lease that the worker renews while the
+    job runs. A job whose worker died (lease expired) is queued again, up to
+    max_attempts runs, so jobs survive restarts and crashes. Each process
+    opens its own connection, as in SQLiteStore.
+    """
+
+    def __init__(self, db_path: str, busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection for this process, opened (and the schema created) on first use"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                overrides TEXT,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                webhook_url TEXT,
+                webhook_status TEXT,
+                idempotency_key TEXT UNIQUE,
+                request_hash TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+        """)
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def _transaction(self, work):
+        """Run work(conn) in a write transaction; BEGIN IMMEDIATE serializes writers across processes"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("params", "overrides", "progress", "result"):
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Load a job, or None if there is no such job"""
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def version(self, job_id: str) -> Optional[Tuple[int, str]]:
+        """(version, status) of a job, a cheap check for changes; None if there is no such job"""
+        with self._lock:
+            row = self._connection().execute("SELECT version, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else (row["version"], row["status"])
+
+    def create(self, kind: str, params: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None,
+               webhook_url: Optional[str] = None, idempotency_key: Optional[str] = None,
+               request_hash: Optional[str] = None, max_queued: Optional[int] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job.
+
+        Args:
+            kind: Job kind
+            params: Validated parameters of the kind
+            overrides: Per-request setting overrides the job runs with
+            webhook_url: URL to notify when the job has finished
+            idempotency_key: Client key; submitting it again returns the first job
+            request_hash: Hash of the submission, to detect a key reused for another job
+            max_queued: Refuse the job when this many are already queued
+
+        Returns:
+            The job and whether it was created (False when returned for an idempotency key)
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different submission
+            QueueFull: If max_queued jobs are already queued
+        """
+        def work(conn):
+            if idempotency_key is not None:
+                row = conn.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                if row is not None:
+                    if row["request_hash"] != request_hash:
+                        raise IdempotencyConflict("Idempotency key was already used for a different job")
+                    return row, False
+            if max_queued is not None:
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= max_queued:
+                    raise QueueFull(f"{queued} jobs are already queued")
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, overrides, status, progress, webhook_url, idempotency_key, "
+                "request_hash, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), json.dumps(overrides) if overrides else None,
+                 json.dumps({"completed": 0, "total": 0, "message": None}), webhook_url, idempotency_key,
+                 request_hash, time.time())
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone(), True
+
+        row, created = self._transaction(work)
+        return self._to_dict(row), created
+
+    def claim(self, worker: str, lease: float, max_attempts: int) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest queued job (or one whose worker's lease expired) and mark it running.
+
+        Jobs whose lease expired after max_attempts runs are failed instead, and those
+        asked to cancel are cancelled.
+
+        Returns:
+            The claimed job, or None if there is nothing to run
+        """
+        def work(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, worker = NULL, lease_expires_at = NULL, "
+                "version = version + 1 WHERE status = 'running' AND lease_expires_at < ? AND cancel_requested = 1",
+                (now, now)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                "finished_at = ?, worker = NULL, lease_expires_at = NULL, version = version + 1 "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "started_at = ?, version = version + 1 WHERE id = ?",
+                (worker, now + lease, now, row["id"])
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        return self._to_dict(self._transaction(work))
+
+    def renew(self, job_id: str, worker: str, lease: float) -> Optional[bool]:
+        """
+        Extend a running job's lease.
+
+        Returns:
+            Whether cancellation was requested, or None if the worker no longer owns the job
+        """
+        def work(conn):
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease, job_id, worker)
+            ).rowcount
+            if not updated:
+                return None
+            return bool(conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+        return self._transaction(work)
+
+    def set_progress(self, job_id: str, worker: str, completed: int, total: int, message: Optional[str] = None) -> None:
+        """Record the progress of a running job"""
+        progress = json.dumps({"completed": completed, "total": total, "message": message})
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET progress = ?, version = version + 1 WHERE id = ? AND worker = ? AND status = 'running'",
+                (progress, job_id, worker)
+            )
+
+    def finish(self, job_id: str, worker: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a running job.
+
+        Returns:
+            False if the worker no longer owns the job (its lease expired and another worker took it)
+        """
+        if status not in FINAL_STATUSES:
+            raise ValueError(f"Not a final job status: {status}")
+        with self._lock:
+            updated = self._connection().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, worker = NULL, "
+                "lease_expires_at = NULL, webhook_status = CASE WHEN webhook_url IS NULL THEN NULL ELSE 'pending' END, "
+                "version = version + 1 WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, worker)
+            ).rowcount
+        return bool(updated)
+
+    def release(self, job_id: str, worker: str) -> None:
+        """Put a running job back in the queue, e.g. when its worker shuts down (or cancel it if that was asked)"""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                "finished_at = CASE WHEN cancel_requested THEN ? ELSE NULL END, worker = NULL, "
+                "lease_expires_at = NULL, attempts = attempts - 1, version = version + 1 "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job: a queued job is cancelled at once, a running one when its worker next renews its lease.
+
+        Returns:
+            The job, or None if there is no such job
+        """
+        def work(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, "
+                "webhook_status = CASE WHEN webhook_url IS NULL THEN NULL ELSE 'pending' END, "
+                "version = version + 1 WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, version = version + 1 WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        return self._to_dict(self._transaction(work))
+
+    def set_webhook_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET webhook_status = ?, version = version + 1 WHERE id = ?", (status, job_id)
+            )
+
+    def purge(self, older_than: float) -> int:
+        """Delete jobs that finished more than older_than seconds ago; returns how many"""
+        with self._lock:
+            return self._connection().execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - older_than,)
+            ).rowcount
+
+    def close(self) -> None:
+        """Close this process's database connection"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_stores: Dict[str, JobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_job_store(settings: Settings) -> JobStore:
+    """Get the process-wide job store for the configured database path"""
+    db_path = settings.JOB_STORE_PATH or os.path.join(settings.DATA_DIR, "jobs.db")
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = JobStore(db_path)
+        return _stores[db_path]
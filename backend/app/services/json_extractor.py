@@ -0,0 +1,274 @@
+import json
+from typing import Any, AsyncGenerator, AsyncIterable, List, Optional, Tuple
+
+# Closing character for each opening bracket
+_CLOSERS = {"[": "]", "{": "}"}
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no JSON value can be recovered from an LLM reply"""
+
+
+class StreamingJSONExtractor:
+    """
+    Incremental extractor for the first JSON array or object in an LLM reply.
+
+    LLM replies often wrap JSON in a preamble, a markdown fence or trailing
+    commentary, and may be cut off by the token limit. The extractor is fed the
+    reply chunk by chunk, skips everything before the first ``[`` or ``{``,
+    tolerates trailing commas and returns every element of a top-level array as
+    soon as it closes, so callers can act on list items before the reply ends.
+
+    Example:
+        extractor = StreamingJSONExtractor()
+        async for chunk in llm_client.generate_text_stream(prompt):
+            for item in extractor.feed(chunk):
+                ...
+        value = extractor.result()
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        """Clear the scanner state"""
+        self._started = False
+        self._done = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # JSON text of the value, with trailing commas removed as we go
+        self._buf: List[str] = []
+        # Start offset in _buf of the top-level array element being read
+        self._item_start: Optional[int] = None
+        # Offset in _buf and open containers at the last point where the value can be cut cleanly
+        self._safe_point: Tuple[int, Tuple[str, ...]] = (0, ())
+        self._items: List[Any] = []
+        self._value: Any = None
+
+    @property
+    def done(self) -> bool:
+        """Whether the first JSON value has been read completely"""
+        return self._done
+
+    @property
+    def items(self) -> List[Any]:
+        """Top-level array elements decoded so far"""
+        return list(self._items)
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Feed the next chunk of the reply.
+
+        Args:
+            chunk: Next piece of text from the LLM
+
+        Returns:
+            Top-level array elements that were completed by this chunk
+        """
+        completed = []
+        for char in chunk:
+            if self._done:
+                break
+            if not self._started:
+                if char in _CLOSERS:
+                    self._started = True
+                    self._stack.append(char)
+                    self._buf.append(char)
+                continue
+            item = self._consume(char)
+            if item is not None:
+                completed.append(item[0])
+        return completed
+
+    def result(self) -> Any:
+        """
+        Return the extracted JSON value.
+
+        A value whose tail is missing (e.g. the reply hit the token limit) is
+        repaired by cutting it back to the last complete member and closing the
+        open containers.
+
+        Returns:
+            The decoded JSON value
+
+        Raises:
+            JSONExtractionError: If the reply contains no JSON array or object
+        """
+        if not self._started:
+            raise JSONExtractionError("No JSON array or object found in response")
+
+        if self._done:
+            return self._value
+
+        cut, stack = self._safe_point
+        text = "".join(self._buf[:cut]).rstrip().rstrip(",") + "".join(_CLOSERS[c] for c in reversed(stack))
+
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            # A top-level array can still be returned from the elements that closed cleanly
+            if self._stack and self._stack[0] == "[" and self._items:
+                return list(self._items)
+            raise JSONExtractionError(f"Could not decode JSON from response: {str(e)}") from e
+
+    def _consume(self, char: str) -> Optional[Tuple[Any]]:
+        """Advance the scanner by one character, returning a completed array element if any"""
+        buf = self._buf
+
+        if self._in_string:
+            buf.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return None
+
+        if char == '"':
+            self._in_string = True
+            self._mark_item_start()
+            buf.append(char)
+            return None
+
+        if char in _CLOSERS:
+            self._mark_item_start()
+            self._stack.append(char)
+            buf.append(char)
+            return None
+
+        if char in "]}":
+            if _CLOSERS[self._stack[-1]] != char:
+                # "]" closing a "{" (or the reverse): not the JSON value we are looking for
+                self._abandon()
+                return None
+            # Drop a trailing comma before the closing bracket
+            self._strip_trailing_comma()
+            completed = None
+            if len(self._stack) == 1:
+                completed = self._close_item(len(buf))
+            self._stack.pop()
+            buf.append(char)
+            self._safe_point = (len(buf), tuple(self._stack))
+            if not self._stack:
+                self._finish()
+            elif len(self._stack) == 1:
+                completed = self._close_item(len(buf)) or completed
+            return completed
+
+        if char == ",":
+            completed = None
+            if len(self._stack) == 1:
+                completed = self._close_item(len(buf))
+            self._safe_point = (len(buf), tuple(self._stack))
+            buf.append(char)
+            return completed
+
+        if not char.isspace():
+            self._mark_item_start()
+        buf.append(char)
+        return None
+
+    def _finish(self):
+        """Decode the completed value, or resume scanning if it was not valid JSON"""
+        try:
+            self._value = json.loads("".join(self._buf))
+            self._done = True
+        except json.JSONDecodeError:
+            self._abandon()
+
+    def _abandon(self):
+        """
+        Give up on a value that turned out not to be valid JSON.
+
+        Bracketed prose such as "[see below]" is skipped to keep looking for
+        the real value. If array elements were already returned by feed()
+        (e.g. "[{...} {...}]", with a comma missing), those elements are the
+        result, so callers never see items followed by an error.
+        """
+        if self._items:
+            self._value = list(self._items)
+            self._done = True
+        else:
+            self._reset()
+
+    def _mark_item_start(self):
+        """Record where a top-level array element begins"""
+        if len(self._stack) == 1 and self._stack[0] == "[" and self._item_start is None:
+            self._item_start = len(self._buf)
+
+    def _close_item(self, end: int) -> Optional[Tuple[Any]]:
+        """Decode the top-level array element ending at ``end``"""
+        if self._stack[0] != "[" or self._item_start is None:
+            return None
+        text = "".join(self._buf[self._item_start:end]).strip()
+        self._item_start = None
+        if not text:
+            return None
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        self._items.append(value)
+        return (value,)
+
+    def _strip_trailing_comma(self):
+        """Remove a comma (and whitespace) left directly before a closing bracket"""
+        buf = self._buf
+        i = len(buf) - 1
+        while i >= 0 and buf[i].isspace():
+            i -= 1
+        if i >= 0 and buf[i] == ",":
+            del buf[i:]
+
+
+def extract_json(text: str) -> Any:
+    """
+    Extract the first JSON array or object from a complete LLM reply.
+
+    Args:
+        text: Raw response from the LLM
+
+    Returns:
+        The decoded JSON value
+
+    Raises:
+        JSONExtractionError: If no JSON value can be recovered
+    """
+    extractor = StreamingJSONExtractor()
+    extractor.feed(text)
+    return extractor.result()
+
+
+async def iter_json_items(chunks: AsyncIterable[str]) -> AsyncGenerator[Any, None]:
+    """
+    Yield the elements of a JSON array as they close in a streamed LLM reply.
+
+    Args:
+        chunks: Async iterable of text chunks, e.g. ``LLMClient.generate_text_stream``
+
+    Yields:
+        Decoded array elements, in order
+    """
+    extractor = StreamingJSONExtractor()
+    try:
+        async for chunk in chunks:
+            for item in extractor.feed(chunk):
+                yield item
+            if extractor.done:
+                break
+    finally:
+        # Stop the upstream as soon as the array is complete or the consumer stops
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+    if not extractor.done:
+        # Recover elements from a truncated tail that never produced a separator
+        try:
+            value = extractor.result()
+        except JSONExtractionError:
+            return
+        if isinstance(value, list):
+            for item in value[len(extractor.items):]:
+                yield item
@@ -0,0 +1,121 @@
+from config.settings import Settings
+from app.services.lesson_store import LessonStore, get_lesson_store
+from app.core.metrics import LESSON_LIBRARY_WRITES
+from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LessonLibrary:
+    """
+    The library of generated lessons: searchable, and written off the request path.
+
+    Services hand each freshly generated lesson to record(), which only
+    queues it; a background task writes the queue to the lesson store in
+    batches of up to LESSON_LIBRARY_BATCH_SIZE lessons, at most
+    LESSON_LIBRARY_FLUSH_INTERVAL seconds after the first one arrived.
+    When the queue is full (the disk cannot keep up), lessons are dropped
+    rather than slowing responses down. stop() writes what is still queued.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.store: LessonStore = get_lesson_store(settings)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.LESSON_LIBRARY_QUEUE_SIZE))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background writer (also started by the first record())"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background writer and write the lessons still queued"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._write(batch)
+
+    def record(self, kind: str, topic: str, audience: str, payload: Dict[str, Any], model: Optional[str] = None,
+               request_key: Optional[str] = None) -> None:
+        """
+        Queue a generated lesson for the library.
+
+        Args:
+            kind: "content" (a ContentResponse) or "research" (a DeepResearchResponse)
+            topic: Topic the lesson was generated for
+            audience: Audience or academic level it was written for
+            payload: The response payload
+            model: Model that generated it
+            request_key: Key of the request it answers, to find it by (see get_by_request_key)
+        """
+        if not self.settings.LESSON_LIBRARY_ENABLED:
+            return
+        lesson = {"kind": kind, "topic": topic, "audience": audience, "payload": payload, "model": model,
+                  "request_key": request_key, "created_at": time.time()}
+        try:
+            self._queue.put_nowait(lesson)
+        except asyncio.QueueFull:
+            logger.warning("Lesson library queue is full, dropping a lesson", extra={"topic": topic})
+            LESSON_LIBRARY_WRITES.inc(result="dropped")
+            return
+        self.start()
+
+    async def search(self, query: str, kind: Optional[str] = None, audience: Optional[str] = None,
+                     limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Search the library (see LessonStore.search)"""
+        return await asyncio.to_thread(self.store.search, query, kind, audience, limit, offset)
+
+    async def get(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        """Load a lesson of the library (see LessonStore.get)"""
+        return await asyncio.to_thread(self.store.get, lesson_id)
+
+    async def get_by_request_key(self, request_key: str) -> Optional[Dict[str, Any]]:
+        """Load the latest lesson recorded for a request key (see LessonStore.get_by_request_key)"""
+        return await asyncio.to_thread(self.store.get_by_request_key, request_key)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch_size = max(1, self.settings.LESSON_LIBRARY_BATCH_SIZE)
+        while True:
+            batch = [await self._queue.get()]
+            flush_at = loop.time() + self.settings.LESSON_LIBRARY_FLUSH_INTERVAL
+            while len(batch) < batch_size:
+                timeout = flush_at - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            added = await asyncio.to_thread(self.store.put_many, batch)
+        except Exception as e:
+            logger.error("Error writing %d lessons to the library: %s", len(batch), e)
+            LESSON_LIBRARY_WRITES.inc(len(batch), result="failed")
+            return
+        logger.debug("Wrote lessons to the library", extra={"lessons": len(batch), "added": added})
+        LESSON_LIBRARY_WRITES.inc(added, result="added")
+        LESSON_LIBRARY_WRITES.inc(len(batch) - added, result="duplicate")
+
+
+_library: Optional[LessonLibrary] = None
+
+
+def get_lesson_library(settings: Settings) -> LessonLibrary:
+    """Get the lesson library of this process"""
+    global _library
+    if _library is None:
+        _library = LessonLibrary(settings)
+    return _library
@@ -0,0 +1,235 @@
+from config.settings import Settings
+from app.services.prompt_builder import normalize_level
+from typing import Dict, Any, Iterable, List, Optional
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# What the library keeps: educational content (ContentResponse) and deep research (DeepResearchResponse)
+LESSON_KINDS = ("content", "research")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def lesson_id(kind: str, topic: str, audience: str, payload: Dict[str, Any]) -> str:
+    """Content-addressed ID of a lesson: the same lesson stored twice is kept once"""
+    raw = json.dumps([kind, " ".join(topic.lower().split()), normalize_level(audience), payload], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def lesson_text(kind: str, payload: Dict[str, Any]) -> str:
+    """The searchable text of a lesson"""
+    if kind == "research":
+        parts = [payload.get("introduction") or ""]
+        for section in payload.get("sections") or []:
+            parts.append(section.get("title") or "")
+            parts.append(section.get("content") or "")
+        parts.extend(payload.get("key_concepts") or [])
+        return "\n\n".join(part for part in parts if part)
+    return payload.get("explanation") or ""
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Full-text query matching lessons with all words of a search, the last one as a prefix.
+
+    Words are quoted, so FTS5 operators in user input are searched for as text.
+    None if the text has no words.
+    """
+    words = _WORD_RE.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+class LessonStore:
+    """
+    SQLite-backed library of generated lessons with a full-text index.
+
+    Each lesson keeps its whole response payload and metadata; its topic
+    and text are indexed with FTS5 (porter stemming, so "volcano" finds
+    "volcanoes"). Each process opens its own connection, as in JobStore.
+    """
+
+    def __init__(self, db_path: str, busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection for this process, opened (and the schema created) on first use"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS lessons (
+                seq INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                audience TEXT NOT NULL,
+                level TEXT NOT NULL,
+                model TEXT,
+                request_key TEXT,
+                body TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5(
+                topic, body, content = 'lessons', content_rowid = 'seq', tokenize = 'porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS lessons_fts_insert AFTER INSERT ON lessons BEGIN
+                INSERT INTO lessons_fts (rowid, topic, body) VALUES (new.seq, new.topic, new.body);
+            END;
+            CREATE TRIGGER IF NOT EXISTS lessons_fts_delete AFTER DELETE ON lessons BEGIN
+                INSERT INTO lessons_fts (lessons_fts, rowid, topic, body) VALUES ('delete', old.seq, old.topic, old.body);
+            END;
+        """)
+        # Libraries created before lessons had request keys
+        if "request_key" not in {row["name"] for row in conn.execute("PRAGMA table_info(lessons)")}:
+            conn.execute("ALTER TABLE lessons ADD COLUMN request_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS lessons_request_key ON lessons (request_key)")
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def open(self) -> None:
+        """Open the database, creating the schema if needed"""
+        with self._lock:
+            self._connection()
+
+    def put_many(self, lessons: Iterable[Dict[str, Any]]) -> int:
+        """
+        Store lessons in one transaction; lessons already stored are skipped.
+
+        Args:
+            lessons: Dictionaries with "kind", "topic", "audience", "payload"
+                and optionally "model", "request_key" (the key of the request it
+                answers, see get_by_request_key) and "created_at"
+
+        Returns:
+            Number of lessons added
+        """
+        rows = []
+        for lesson in lessons:
+            kind, topic, audience, payload = lesson["kind"], lesson["topic"], lesson["audience"], lesson["payload"]
+            rows.append((
+                lesson_id(kind, topic, audience, payload), kind, topic, audience, normalize_level(audience),
+                lesson.get("model"), lesson.get("request_key"), lesson_text(kind, payload), json.dumps(payload),
+                lesson.get("created_at") or time.time()
+            ))
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = conn.executemany(
+                    "INSERT OR IGNORE INTO lessons (id, kind, topic, audience, level, model, request_key, body, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def get(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load a lesson.
+
+        Returns:
+            Dictionary with "id", "kind", "topic", "audience", "model", "created_at"
+            and "content" (the response payload), or None if there is no such lesson
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, kind, topic, audience, model, payload, created_at FROM lessons WHERE id = ?", (lesson_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        lesson = dict(row)
+        lesson["content"] = json.loads(lesson.pop("payload"))
+        return lesson
+
+    def get_by_request_key(self, request_key: str) -> Optional[Dict[str, Any]]:
+        """The latest lesson stored for a request key (as from get), or None"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id FROM lessons WHERE request_key = ? ORDER BY seq DESC LIMIT 1", (request_key,)
+            ).fetchone()
+        return None if row is None else self.get(row["id"])
+
+    def search(self, query: str, kind: Optional[str] = None, audience: Optional[str] = None,
+               limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Find lessons containing all words of a query, best matches first.
+
+        Args:
+            query: Words to search for in the topic and text (matches in the topic weigh more)
+            kind: Only lessons of this kind ("content" or "research")
+            audience: Only lessons for this audience level (e.g. "high school" or "high-school")
+            limit: Maximum number of results
+            offset: Results to skip, for paging
+
+        Returns:
+            Dictionaries with "id", "kind", "topic", "audience", "model", "created_at",
+            "snippet" (the matching text, matches in **bold**) and "score" (higher is better)
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        sql = (
+            "SELECT l.id, l.kind, l.topic, l.audience, l.model, l.created_at, "
+            "snippet(lessons_fts, 1, '**', '**', '…', 24) AS snippet, bm25(lessons_fts, 5.0, 1.0) AS rank "
+            "FROM lessons_fts JOIN lessons l ON l.seq = lessons_fts.rowid WHERE lessons_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if kind:
+            sql += " AND l.kind = ?"
+            params.append(kind)
+        if audience:
+            sql += " AND l.level = ?"
+            params.append(normalize_level(audience))
+        sql += " ORDER BY rank LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["score"] = round(-result.pop("rank"), 4)
+            results.append(result)
+        return results
+
+    def close(self) -> None:
+        """Close this process's database connection"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_stores: Dict[str, LessonStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_lesson_store(settings: Settings) -> LessonStore:
+    """Get the process-wide lesson store for the configured database path"""
+    db_path = settings.LESSON_LIBRARY_PATH or os.path.join(settings.DATA_DIR, "lessons.db")
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = LessonStore(db_path)
+        return _stores[db_path]
@@ -0,0 +1,163 @@
+from config.settings import Settings
+from app.services.deep_research_service import DeepResearchService
+from app.core.upstream_activity import background_work, get_upstream_activity
+from app.core.upstream_scheduler import UpstreamPreempted
+from app.core.deadlines import deadline_scope
+from app.core.shared_state import get_shared_store
+from typing import Dict, List, Any, Optional, Set
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchBudget:
+    """
+    Fixed-window limit on the number of prefetches per user.
+
+    Counters live in the shared store. With a store shared by the workers
+    (SHARED_STATE_BACKEND=sqlite, the default of gunicorn.conf.py with more
+    than one worker) the budget holds across all worker processes; with
+    the memory backend each worker counts on its own, so a user gets up to
+    PREFETCH_USER_BUDGET prefetches per worker.
+    """
+
+    def __init__(self, settings: Settings):
+        self.store = get_shared_store(settings)
+
+    def try_acquire(self, user_id: str, limit: int, window: float) -> bool:
+        """
+        Take one prefetch from a user's budget.
+
+        Args:
+            user_id: User (or client) the prefetch is done for
+            limit: Maximum prefetches in the window
+            window: Window length in seconds
+
+        Returns:
+            True if the prefetch is allowed
+        """
+        window = max(1, int(window))
+        key = f"prefetch_budget:{user_id}:{int(time.time()) // window}"
+        try:
+            used = self.store.incr(key, ttl=window)
+        except Exception as e:
+            logger.warning("Prefetch budget unavailable: %s", e)
+            return False
+        return used <= limit
+
+
+_tasks: Set[asyncio.Task] = set()
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+class PrefetchService:
+    """
+    Speculative prefetch of research outlines for related topics.
+
+    After a research response has been delivered, the outlines (and
+    optionally introductions) of the top related topics are generated as
+    background work and stored in the research cache, so that following a
+    related topic is near-instant. Prefetch never competes with foreground
+    requests: it waits until no user-facing upstream call has been running
+    for PREFETCH_IDLE_SECONDS, is cancelled and retried later if one starts
+    while it runs, runs at most PREFETCH_MAX_CONCURRENCY at a time per worker
+    process, and each
+    user has a hard budget of PREFETCH_USER_BUDGET prefetches per
+    PREFETCH_BUDGET_WINDOW.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.budget = PrefetchBudget(settings)
+
+    async def schedule(self, related_topics: List[Dict[str, Any]], academic_level: str, user_id: str) -> int:
+        """
+        Schedule prefetch of the top related topics.
+
+        Args:
+            related_topics: Related topics from a research response
+            academic_level: Academic level of the original request
+            user_id: User (or client) the research was generated for
+
+        Returns:
+            Number of prefetches scheduled
+        """
+        if not self.settings.PREFETCH_ENABLED or self.settings.current("USE_MOCK_DATA"):
+            return 0
+
+        scheduled = 0
+        for related in related_topics[:self.settings.PREFETCH_TOP_N]:
+            topic = (related.get("topic") if isinstance(related, dict) else getattr(related, "topic", None)) or ""
+            if not topic.strip():
+                continue
+            if not await asyncio.to_thread(self.budget.try_acquire, user_id, self.settings.PREFETCH_USER_BUDGET, self.settings.PREFETCH_BUDGET_WINDOW):
+                break
+            # Prefetches outlive the request, so they do not inherit its deadline
+            with deadline_scope(None):
+                task = asyncio.create_task(self._prefetch(topic.strip(), academic_level))
+            _tasks.add(task)
+            task.add_done_callback(_tasks.discard)
+            scheduled += 1
+        return scheduled
+
+    async def _prefetch(self, topic: str, academic_level: str) -> None:
+        """Generate and cache one outline once there is idle upstream capacity"""
+        global _semaphore
+        if _semaphore is None:
+            _semaphore = asyncio.Semaphore(self.settings.PREFETCH_MAX_CONCURRENCY)
+
+        research_service = DeepResearchService(self.settings)
+        include_introduction = self.settings.PREFETCH_INTRODUCTIONS
+        try:
+            # Nothing to do if the outline is already cached
+            if await research_service.get_outline(topic, academic_level, include_introduction, generate=False):
+                return
+
+            async with _semaphore:
+                deadline = time.monotonic() + self.settings.PREFETCH_MAX_WAIT
+                while True:
+                    if not await self._wait_for_idle(deadline):
+                        logger.info("Skipping prefetch: no idle upstream capacity", extra={"topic": topic})
+                        return
+                    with background_work():
+                        task = asyncio.create_task(
+                            research_service.get_outline(topic, academic_level, include_introduction)
+                        )
+                    if await self._run_unless_preempted(task):
+                        return
+        except Exception as e:
+            logger.warning("Error prefetching outline: %s", e, extra={"topic": topic})
+
+    async def _wait_for_idle(self, deadline: float) -> bool:
+        """Wait until foreground upstream calls have been idle long enough, up to the deadline"""
+        activity = get_upstream_activity()
+        while not activity.is_idle(self.settings.PREFETCH_IDLE_SECONDS):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.25)
+        return True
+
+    async def _run_unless_preempted(self, task: asyncio.Task) -> bool:
+        """
+        Wait for a prefetch task, cancelling it as soon as a foreground call starts.
+
+        Returns:
+            True if the task finished, False if it was preempted
+        """
+        activity = get_upstream_activity()
+        while not task.done():
+            await asyncio.wait({task}, timeout=0.25)
+            if not task.done() and activity.foreground_inflight > 0:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, UpstreamPreempted):
+                    pass
+                return False
+        if isinstance(task.exception(), UpstreamPreempted):
+            # The upstream scheduler cancelled the call for waiting interactive requests
+            return False
+        task.result()
+        return True
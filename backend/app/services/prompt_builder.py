@@ -0,0 +1,141 @@
+from config.settings import Settings
+from app.core.prompt_templates import system_template
+from app.core.token_accounting import PromptSpec, estimate_tokens, get_token_ledger
+from typing import Optional
+import math
+
+# Output token budgets for lessons, by audience level
+CONTENT_BUDGETS = {
+    "elementary": 1200,
+    "middle-school": 1600,
+    "high-school": 2200,
+    "college": 3000,
+    "undergraduate": 3000,
+    "graduate": 3600
+}
+
+# Output token budgets for a lesson written from a shared lesson plan, which already
+# holds the structure, facts and examples, by audience level
+CONTENT_VARIANT_BUDGETS = {
+    "elementary": 900,
+    "middle-school": 1200,
+    "high-school": 1650,
+    "college": 2250,
+    "undergraduate": 2250,
+    "graduate": 2700
+}
+
+# Output token budgets for full research documents, by academic level
+RESEARCH_BUDGETS = {
+    "elementary": 1800,
+    "middle-school": 2200,
+    "high-school": 2600,
+    "college": 3200,
+    "undergraduate": 3200,
+    "graduate": 3800
+}
+
+# Extra output tokens reserved for each requested subtopic section
+RESEARCH_TOKENS_PER_SUBTOPIC = 450
+
+# Output tokens for one generated subtopic section when extending stored research
+SECTION_TOKENS_PER_SUBTOPIC = 700
+SECTION_TOKENS_OVERHEAD = 400
+
+# Output tokens for a research outline, and extra for a pre-generated introduction
+OUTLINE_TOKENS = 450
+OUTLINE_INTRODUCTION_TOKENS = 500
+
+# Output tokens for the outline and fact base shared by the audience versions of a lesson
+LESSON_OUTLINE_TOKENS = 900
+
+# Output tokens per trending topic (name, description, relevance as JSON)
+TRENDING_TOKENS_PER_TOPIC = 110
+TRENDING_TOKENS_OVERHEAD = 64
+
+
+def normalize_level(level: Optional[str]) -> str:
+    """Normalize an audience/academic level name, e.g. "High School" -> "high-school" """
+    return "-".join((level or "").lower().split())
+
+
+class PromptBuilder:
+    """
+    Builds prompts with an output token budget sized to the request.
+
+    Trending topics, short elementary lessons and graduate research need very
+    different output lengths; reserving LLM_MAX_TOKENS for all of them wastes
+    upstream capacity and TPM quota. The builder picks a budget per request
+    type and audience: once LLM_BUDGET_MIN_SAMPLES completions of the same
+    kind are in the token ledger, their 95th percentile length plus
+    LLM_BUDGET_HEADROOM, otherwise the budget tables above. The budget is
+    scaled by LLM_OUTPUT_BUDGET_SCALE and clamped to
+    [LLM_MIN_OUTPUT_TOKENS, LLM_MAX_TOKENS] and to what fits in the context
+    window next to the input.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._system_tokens = system_template(settings.LLM_SYSTEM_MESSAGE).static_tokens
+
+    def content(self, prompt: str, audience: str) -> PromptSpec:
+        """Build a lesson prompt for the given audience"""
+        level = normalize_level(audience)
+        budget = CONTENT_BUDGETS.get(level, CONTENT_BUDGETS["high-school"])
+        return self._build("content", prompt, budget, f"content:{level}")
+
+    def content_variant(self, prompt: str, audience: str) -> PromptSpec:
+        """Build a prompt writing one audience's lesson from a shared lesson outline"""
+        level = normalize_level(audience)
+        budget = CONTENT_VARIANT_BUDGETS.get(level, CONTENT_VARIANT_BUDGETS["high-school"])
+        return self._build("content_variant", prompt, budget, f"content_variant:{level}")
+
+    def lesson_outline(self, prompt: str) -> PromptSpec:
+        """Build the prompt for the outline shared by the audience versions of a lesson"""
+        return self._build("lesson_outline", prompt, LESSON_OUTLINE_TOKENS, "lesson_outline")
+
+    def research(self, prompt: str, academic_level: str, subtopic_count: int = 0, introduction: bool = True) -> PromptSpec:
+        """Build a full research prompt for the given academic level, with or without the introduction to write"""
+        level = normalize_level(academic_level)
+        budget = RESEARCH_BUDGETS.get(level, RESEARCH_BUDGETS["undergraduate"])
+        budget += RESEARCH_TOKENS_PER_SUBTOPIC * subtopic_count
+        budget_key = f"research:{level}:{subtopic_count}"
+        if not introduction:
+            # The introduction comes from a stored outline
+            budget -= OUTLINE_INTRODUCTION_TOKENS
+            budget_key += ":no_introduction"
+        return self._build("research", prompt, budget, budget_key)
+
+    def research_sections(self, prompt: str, subtopic_count: int) -> PromptSpec:
+        """Build a prompt that only generates sections for the given number of subtopics"""
+        budget = SECTION_TOKENS_OVERHEAD + SECTION_TOKENS_PER_SUBTOPIC * max(subtopic_count, 1)
+        return self._build("research_sections", prompt, budget, f"research_sections:{subtopic_count}")
+
+    def outline(self, prompt: str, include_introduction: bool = False) -> PromptSpec:
+        """Build a research outline prompt, optionally with room for an introduction"""
+        budget = OUTLINE_TOKENS + (OUTLINE_INTRODUCTION_TOKENS if include_introduction else 0)
+        return self._build("outline", prompt, budget, f"outline:{int(include_introduction)}")
+
+    def trending_topics(self, prompt: str, limit: int) -> PromptSpec:
+        """Build a trending-topics prompt for the given number of topics"""
+        budget = TRENDING_TOKENS_OVERHEAD + TRENDING_TOKENS_PER_TOPIC * max(limit, 1)
+        return self._build("trending_topics", prompt, budget, f"trending_topics:{limit}")
+
+    def _build(self, request_type: str, prompt: str, budget: int, budget_key: str) -> PromptSpec:
+        """Estimate input size, then size and clamp the output budget"""
+        input_tokens = self._system_tokens + estimate_tokens(prompt)
+        if self.settings.LLM_OBSERVED_BUDGETS:
+            observed = get_token_ledger().observed_budget(budget_key, self.settings.LLM_BUDGET_MIN_SAMPLES)
+            if observed is not None:
+                budget = math.ceil(observed * self.settings.LLM_BUDGET_HEADROOM)
+        limit = self.settings.current("LLM_MAX_TOKENS")
+        max_tokens = int(budget * self.settings.LLM_OUTPUT_BUDGET_SCALE)
+        max_tokens = min(max_tokens, limit, self.settings.LLM_CONTEXT_WINDOW - input_tokens)
+        max_tokens = max(max_tokens, min(self.settings.LLM_MIN_OUTPUT_TOKENS, limit))
+        return PromptSpec(
+            request_type=request_type,
+            prompt=prompt,
+            input_tokens=input_tokens,
+            max_tokens=max_tokens,
+            budget_key=budget_key
+        )
@@ -0,0 +1,507 @@
+from config.settings import Settings
+from app.core.metrics import record_cache
+from app.core.shared_state import get_shared_store
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Patterns used to pull citation fields out of a single reference line
+_AUTHOR_RE = re.compile(r'^([^\.]+)')
+_QUOTED_TITLE_RE = re.compile(r'["“]([^"”]+)["”]')
+_YEAR_RE = re.compile(r'\((\d{4})\)|,\s*(\d{4})\b')
+_DOI_RE = re.compile(r'(10\.\d{4,}(?:\.\d+)*\/[^\s"<>]+)')
+_URL_RE = re.compile(r'(https?://\S+)')
+_LIST_MARKER_RE = re.compile(r'^(?:\d+\.|\[\d+\]|[*•]|-(?=\s))\s*')
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a citation title for matching and caching.
+
+    Args:
+        title: Raw title text
+
+    Returns:
+        Lower-cased, accent-free title with punctuation removed and whitespace collapsed
+    """
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def normalize_doi(doi: Optional[str]) -> Optional[str]:
+    """Normalize a DOI to its lower-case bare form"""
+    if not doi:
+        return None
+    doi = doi.strip().rstrip(".,;)")
+    doi = re.sub(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', '', doi, flags=re.IGNORECASE)
+    return doi.lower()
+
+
+def parse_reference(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a single reference line from an LLM response.
+
+    Args:
+        line: One line of the references section
+
+    Returns:
+        Reference dictionary, or None if the line does not look like a citation
+    """
+    ref = _LIST_MARKER_RE.sub('', line.strip())
+    if not ref or ref.startswith('-') or len(ref) < 10:
+        return None
+
+    # Extract basic reference data
+    author_match = _AUTHOR_RE.search(ref)
+    title_match = _QUOTED_TITLE_RE.search(ref)
+    year_match = _YEAR_RE.search(ref)
+    doi_match = _DOI_RE.search(ref)
+    url_match = _URL_RE.search(ref)
+
+    return {
+        "title": title_match.group(1).strip().rstrip(',.') if title_match else "Unknown title",
+        "authors": [a.strip() for a in author_match.group(1).split(',') if a.strip()] if author_match else ["Unknown author"],
+        "publication": None,
+        "year": int(year_match.group(1) or year_match.group(2)) if year_match else None,
+        "doi": normalize_doi(doi_match.group(1)) if doi_match else None,
+        "url": url_match.group(1).rstrip('.,;)') if url_match else None
+    }
+
+
+def extract_inline_dois(text: str) -> List[str]:
+    """Find DOIs cited inline in section content"""
+    return [normalize_doi(match) for match in _DOI_RE.findall(text or "")]
+
+
+def _reference_key(reference: Dict[str, Any]) -> Optional[str]:
+    """Key used to dedupe references: DOI if known, otherwise normalized title"""
+    if reference.get("doi"):
+        return f"doi:{normalize_doi(reference['doi'])}"
+    title = normalize_title(reference.get("title", ""))
+    if title and title != "unknown title":
+        return f"title:{title}"
+    return None
+
+
+class CitationIndex:
+    """
+    Local citation index backed by SQLite FTS5.
+
+    The index is seeded from a JSON or JSONL file of citation records
+    (title, authors, publication, year, doi, url) and is rebuilt whenever the
+    seed file changes (checked at most every ``seed_check_interval`` seconds).
+    No network access is needed to resolve references.
+    """
+
+    def __init__(self, db_path: str, seed_file: Optional[str] = None, seed_check_interval: float = 60.0):
+        self.db_path = db_path
+        self.seed_file = seed_file
+        self.seed_check_interval = seed_check_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._seed_checked_at = 0.0
+
+    def open(self) -> None:
+        """Open the database and (re)seed it if the seed file has changed"""
+        with self._lock:
+            if self._conn is not None:
+                if time.monotonic() - self._seed_checked_at >= self.seed_check_interval:
+                    self._seed_if_changed()
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS citation_records (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    authors TEXT NOT NULL,
+                    publication TEXT NOT NULL,
+                    norm_title TEXT NOT NULL,
+                    year INTEGER,
+                    doi TEXT,
+                    url TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_citation_records_doi ON citation_records (doi);
+                CREATE INDEX IF NOT EXISTS idx_citation_records_norm_title ON citation_records (norm_title);
+                CREATE VIRTUAL TABLE IF NOT EXISTS citations USING fts5(
+                    title, authors, publication,
+                    content='citation_records', content_rowid='id'
+                );
+            """)
+            self._conn = conn
+            self._seed_if_changed()
+
+    def close(self) -> None:
+        """Close the underlying database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def lookup(self, reference: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a parsed reference against the index.
+
+        Matching is tried by DOI, then by exact normalized title, then by a
+        full-text title search accepted only when the word overlap is high.
+
+        Args:
+            reference: Parsed reference dictionary
+
+        Returns:
+            Matching citation record, or None if nothing matches well enough
+        """
+        self.open()
+        doi = normalize_doi(reference.get("doi"))
+        norm_title = normalize_title(reference.get("title", ""))
+
+        with self._lock:
+            if doi:
+                row = self._conn.execute("SELECT * FROM citation_records WHERE doi = ? LIMIT 1", (doi,)).fetchone()
+                if row:
+                    return self._row_to_reference(row)
+
+            if not norm_title or norm_title == "unknown title":
+                return None
+
+            row = self._conn.execute("SELECT * FROM citation_records WHERE norm_title = ? LIMIT 1", (norm_title,)).fetchone()
+            if row:
+                return self._row_to_reference(row)
+
+            query = self._match_query(norm_title)
+            if not query:
+                return None
+            rows = self._conn.execute(
+                "SELECT r.* FROM citations JOIN citation_records r ON r.id = citations.rowid "
+                "WHERE citations MATCH ? ORDER BY bm25(citations) LIMIT 5",
+                (f"title : ({query})",)
+            ).fetchall()
+
+        # Accept a full-text hit only if most words of the two titles overlap
+        words = set(norm_title.split())
+        for row in rows:
+            candidate = set(row["norm_title"].split())
+            if len(words & candidate) / max(len(words | candidate), 1) >= 0.6:
+                return self._row_to_reference(row)
+        return None
+
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search of titles, authors and publications.
+
+        Args:
+            text: Free text to search for (e.g. a research topic)
+            limit: Maximum number of results
+
+        Returns:
+            Matching citation records, best match first
+        """
+        self.open()
+        query = self._match_query(normalize_title(text))
+        if not query:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.* FROM citations JOIN citation_records r ON r.id = citations.rowid "
+                "WHERE citations MATCH ? ORDER BY bm25(citations) LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        return [self._row_to_reference(row) for row in rows]
+
+    def _seed_if_changed(self) -> None:
+        """Load the seed file into the index if it is new or has been modified"""
+        self._seed_checked_at = time.monotonic()
+        if not self.seed_file or not os.path.exists(self.seed_file):
+            return
+
+        stat = os.stat(self.seed_file)
+        signature = f"{os.path.abspath(self.seed_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+        current = self._conn.execute("SELECT value FROM meta WHERE key = 'seed'").fetchone()
+        if current and current["value"] == signature:
+            return
+
+        with open(self.seed_file, "r", encoding="utf-8") as f:
+            text = f.read()
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            records = json.loads(stripped)
+        else:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+        with self._conn:
+            self._conn.execute("DELETE FROM citation_records")
+            self._conn.executemany(
+                "INSERT INTO citation_records (title, authors, publication, norm_title, year, doi, url) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        record["title"],
+                        "; ".join(record.get("authors") or []),
+                        record.get("publication") or "",
+                        normalize_title(record["title"]),
+                        record.get("year"),
+                        normalize_doi(record.get("doi")),
+                        record.get("url")
+                    )
+                    for record in records if record.get("title")
+                ]
+            )
+            self._conn.execute("INSERT INTO citations (citations) VALUES ('rebuild')")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seed', ?)", (signature,))
+
+    @staticmethod
+    def _match_query(norm_title: str) -> str:
+        """Build an FTS5 OR query from the words of a normalized title"""
+        words = [w for w in norm_title.split() if len(w) > 2]
+        return " OR ".join(f'"{w}"' for w in words[:16])
+
+    @staticmethod
+    def _row_to_reference(row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert an index row into a reference dictionary"""
+        return {
+            "title": row["title"],
+            "authors": [a for a in row["authors"].split("; ") if a],
+            "publication": row["publication"] or None,
+            "year": int(row["year"]) if row["year"] is not None else None,
+            "doi": row["doi"],
+            "url": row["url"]
+        }
+
+
+_indexes: Dict[str, CitationIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_citation_index(settings: Settings) -> CitationIndex:
+    """Get the process-wide citation index for the configured database path"""
+    db_path = settings.CITATION_INDEX_PATH or os.path.join(settings.DATA_DIR, "citations.db")
+    seed_file = settings.CITATION_SEED_FILE or os.path.join(settings.DATA_DIR, "citations_seed.jsonl")
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = CitationIndex(db_path, seed_file, settings.REFERENCE_MISS_CACHE_TTL)
+        return _indexes[db_path]
+
+
+class ReferenceCache:
+    """
+    Thread-safe LRU cache of resolved references, keyed by normalized title or DOI.
+
+    Known misses (None) expire after ``miss_ttl`` seconds, so references
+    added to the citation seed file later get resolved.
+    """
+
+    _MISS = object()
+
+    def __init__(self, max_size: int, miss_ttl: float = 300.0):
+        self.max_size = max_size
+        self.miss_ttl = miss_ttl
+        # key -> (reference or None, expiry time of a miss or None)
+        self._data: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or ReferenceCache._MISS if absent or an expired miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return self._MISS
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._data[key]
+                return self._MISS
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Optional[Dict[str, Any]]) -> None:
+        """Store a resolved reference (or None for a known miss)"""
+        expires_at = time.monotonic() + self.miss_ttl if value is None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_reference_cache: Optional[ReferenceCache] = None
+
+
+def get_reference_cache(settings: Settings) -> ReferenceCache:
+    """Get the process-wide reference cache"""
+    global _reference_cache
+    if _reference_cache is None:
+        _reference_cache = ReferenceCache(settings.REFERENCE_CACHE_SIZE, settings.REFERENCE_MISS_CACHE_TTL)
+    return _reference_cache
+
+
+class ReferenceEnricher:
+    """
+    Enrichment stage for references parsed from research responses.
+
+    References are normalized, deduped across the references section and
+    inline DOI citations in the content sections, and resolved through a list
+    of resolvers (the local citation index by default). Any object with a
+    ``lookup(reference)`` method returning a citation dictionary or None can be
+    plugged in as a resolver.
+    """
+
+    def __init__(self, settings: Settings, resolvers: Optional[List[Any]] = None):
+        self.settings = settings
+        self.resolvers = resolvers if resolvers is not None else [get_citation_index(settings)]
+        self.cache = get_reference_cache(settings)
+        # Second-level cache shared with the other workers, when there are any
+        store = get_shared_store(settings)
+        self.shared_cache = store if store.shared else None
+
+    async def prefetch(self, topic: str) -> None:
+        """
+        Warm the index and the cache with citations relevant to a topic.
+
+        Meant to run concurrently with the LLM call so that enrichment after
+        parsing is mostly cache hits.
+
+        Args:
+            topic: Research topic being generated
+        """
+        for resolver in self.resolvers:
+            search = getattr(resolver, "search", None)
+            if search is None:
+                continue
+            try:
+                citations = await asyncio.to_thread(search, topic)
+            except Exception as e:
+                logger.warning("Error prefetching citations: %s", e, extra={"topic": topic})
+                continue
+            for citation in citations:
+                for key in (_reference_key(citation), f"title:{normalize_title(citation['title'])}"):
+                    if key and self.cache.get(key) is ReferenceCache._MISS:
+                        self.cache.set(key, citation)
+
+    async def enrich(self, references: Optional[List[Dict[str, Any]]], sections: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Normalize, dedupe and resolve a list of references.
+
+        Args:
+            references: References parsed from the response
+            sections: Content sections, scanned for inline DOI citations
+
+        Returns:
+            Deduped list of references with fields filled in from the resolvers
+        """
+        candidates = list(references or [])
+        for section in sections or []:
+            for doi in extract_inline_dois(section.get("content", "")):
+                candidates.append({"title": "Unknown title", "authors": ["Unknown author"], "publication": None,
+                                   "year": None, "doi": doi, "url": None, "_inline": True})
+
+        # Resolve all references concurrently; the index lookups run in worker threads
+        resolved = await asyncio.gather(*(self._resolve(ref) for ref in candidates))
+
+        enriched: List[Dict[str, Any]] = []
+        seen: Dict[str, int] = {}
+        for ref, match in zip(candidates, resolved):
+            inline = ref.pop("_inline", False)
+            if inline and match is None:
+                # A bare DOI that could not be resolved is not worth listing
+                continue
+            merged = self._merge(ref, match)
+            keys = {k for k in (_reference_key(ref), _reference_key(merged)) if k}
+            duplicate = next((seen[k] for k in keys if k in seen), None)
+            if duplicate is not None:
+                enriched[duplicate] = self._merge(enriched[duplicate], merged, authoritative=match is not None)
+                index = duplicate
+            else:
+                enriched.append(merged)
+                index = len(enriched) - 1
+            for key in keys | {k for k in [_reference_key(enriched[index])] if k}:
+                seen[key] = index
+
+        return enriched
+
+    async def _resolve(self, reference: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Resolve one reference through the cache and the resolvers"""
+        key = _reference_key(reference)
+        if key is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is not ReferenceCache._MISS:
+            record_cache("reference", "hit")
+            return cached
+
+        if self.shared_cache is not None:
+            shared = await self._shared_get(key)
+            if shared is not None:
+                record_cache("reference", "hit")
+                self.cache.set(key, shared["match"])
+                return shared["match"]
+        record_cache("reference", "miss")
+
+        match = None
+        for resolver in self.resolvers:
+            try:
+                match = await asyncio.to_thread(resolver.lookup, reference)
+            except Exception as e:
+                logger.warning("Error resolving reference %s: %s", key, e)
+                match = None
+            if match:
+                break
+
+        self.cache.set(key, match)
+        if self.shared_cache is not None:
+            await self._shared_set(key, match)
+        return match
+
+    async def _shared_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look a reference up in the shared cache; None if absent or unavailable"""
+        try:
+            return await asyncio.to_thread(self.shared_cache.get, f"reference:{key}")
+        except Exception as e:
+            logger.warning("Error reading shared reference cache: %s", e)
+            return None
+
+    async def _shared_set(self, key: str, match: Optional[Dict[str, Any]]) -> None:
+        """Store a resolved reference (or a known miss, for REFERENCE_MISS_CACHE_TTL only) in the shared cache"""
+        ttl = self.settings.REFERENCE_CACHE_TTL if match is not None else self.settings.REFERENCE_MISS_CACHE_TTL
+        try:
+            await asyncio.to_thread(self.shared_cache.set, f"reference:{key}", {"match": match}, ttl)
+        except Exception as e:
+            logger.warning("Error writing shared reference cache: %s", e)
+
+    @staticmethod
+    def _merge(reference: Dict[str, Any], match: Optional[Dict[str, Any]], authoritative: bool = True) -> Dict[str, Any]:
+        """
+        Combine a reference with another record of the same work.
+
+        Args:
+            reference: Reference to enrich
+            match: Citation resolved from the index, or a duplicate reference
+            authoritative: If True, fields from ``match`` replace those of ``reference``;
+                otherwise they only fill fields that are missing
+
+        Returns:
+            Merged reference dictionary
+        """
+        merged = dict(reference)
+        if not match:
+            return merged
+        placeholders = {"title": "Unknown title", "authors": ["Unknown author"]}
+        for field in ("title", "authors", "publication", "year", "doi", "url"):
+            value = match.get(field)
+            if not value or value == placeholders.get(field):
+                continue
+            current = merged.get(field)
+            if authoritative or not current or current == placeholders.get(field):
+                merged[field] = value
+        return merged
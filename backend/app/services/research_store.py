@@ -0,0 +1,308 @@
+from config.settings import Settings
+from typing import Dict, List, Any, Optional
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_subtopics(subtopics: Optional[List[str]]) -> List[str]:
+    """
+    Normalize a subtopic list: trim whitespace and drop empty and duplicate entries.
+
+    Args:
+        subtopics: Subtopics as sent by the client
+
+    Returns:
+        Subtopics in their original order, without duplicates
+    """
+    result = []
+    seen = set()
+    for subtopic in subtopics or []:
+        subtopic = " ".join(subtopic.split())
+        if subtopic and subtopic.lower() not in seen:
+            seen.add(subtopic.lower())
+            result.append(subtopic)
+    return result
+
+
+def subtopic_hash(subtopic: str) -> str:
+    """Stable hash identifying the section(s) generated for one subtopic"""
+    return hashlib.sha256(" ".join(_WORD_RE.findall(subtopic.lower())).encode("utf-8")).hexdigest()[:16]
+
+
+def subtopics_hash(subtopics: List[str]) -> str:
+    """Stable hash of a whole subtopic list, independent of order"""
+    return hashlib.sha256("\n".join(sorted(subtopic_hash(s) for s in subtopics)).encode("utf-8")).hexdigest()[:16]
+
+
+def research_key(topic: str, academic_level: str, include_references: bool, prompt_version: str = "") -> str:
+    """
+    Key under which research results are stored.
+
+    Args:
+        topic: Main research topic
+        academic_level: Academic level requested
+        include_references: Whether references were requested
+        prompt_version: Version of the prompts the research is generated with, if any
+            (see templates_version), so that research from older prompts is not reused
+
+    Returns:
+        Hex digest identifying the (topic, academic_level, include_references) triple
+    """
+    raw = [
+        " ".join(topic.lower().split()),
+        " ".join(academic_level.lower().split()),
+        bool(include_references)
+    ]
+    if prompt_version:
+        raw.append(prompt_version)
+    return hashlib.sha256(json.dumps(raw).encode("utf-8")).hexdigest()
+
+
+def outline_key(topic: str, academic_level: str, prompt_version: str = "") -> str:
+    """Key under which a research outline is stored (outlines do not depend on references)"""
+    return research_key(topic, academic_level, False, prompt_version)
+
+
+class ResearchStore:
+    """
+    SQLite-backed store of generated research.
+
+    Each record holds the full research payload minus its sections. Sections
+    are stored one per row together with the hash of the subtopic they were
+    generated for (NULL for sections about the main topic), so that a later
+    request with a different subtopic list can reuse the unchanged ones.
+
+    Records older than a maximum age (RESEARCH_STORE_TTL) are ignored by
+    get() and deleted by purge(), so stale or bad generations are replaced.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        """Open the database, creating the schema if needed"""
+        with self._lock:
+            if self._conn is not None:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.executescript("""
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS research_results (
+                    key TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    academic_level TEXT NOT NULL,
+                    include_references INTEGER NOT NULL,
+                    subtopics TEXT NOT NULL,
+                    subtopics_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS research_sections (
+                    key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    subtopic_hash TEXT,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (key, position)
+                );
+                CREATE TABLE IF NOT EXISTS research_outlines (
+                    key TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    academic_level TEXT NOT NULL,
+                    outline TEXT NOT NULL,
+                    introduction TEXT,
+                    created_at REAL NOT NULL
+                );
+            """)
+            self._conn = conn
+
+    def close(self) -> None:
+        """Close the underlying database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Load a stored research record.
+
+        Args:
+            key: Key from research_key()
+            max_age: Ignore records older than this many seconds
+
+        Returns:
+            Dictionary with "subtopics", "subtopics_hash", "payload" and "sections"
+            (each section carrying its "subtopic_hash"), or None if not stored
+        """
+        self.open()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM research_results WHERE key = ?", (key,)).fetchone()
+            if row is None or (max_age is not None and time.time() - row["updated_at"] > max_age):
+                return None
+            sections = self._conn.execute(
+                "SELECT subtopic_hash, title, content FROM research_sections WHERE key = ? ORDER BY position",
+                (key,)
+            ).fetchall()
+        return {
+            "subtopics": json.loads(row["subtopics"]),
+            "subtopics_hash": row["subtopics_hash"],
+            "payload": json.loads(row["payload"]),
+            "sections": [dict(section) for section in sections],
+            "updated_at": row["updated_at"]
+        }
+
+    def put(self, key: str, topic: str, academic_level: str, include_references: bool,
+            subtopics: List[str], payload: Dict[str, Any], sections: List[Dict[str, Any]]) -> None:
+        """
+        Store (or replace) a research record.
+
+        Args:
+            key: Key from research_key()
+            topic: Main research topic
+            academic_level: Academic level requested
+            include_references: Whether references were requested
+            subtopics: Normalized subtopic list the record was built for
+            payload: Research content without its sections
+            sections: Sections with "title", "content" and "subtopic_hash"
+        """
+        self.open()
+        payload = {k: v for k, v in payload.items() if k != "sections"}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO research_results "
+                "(key, topic, academic_level, include_references, subtopics, subtopics_hash, payload, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, topic, academic_level, int(include_references), json.dumps(subtopics),
+                 subtopics_hash(subtopics), json.dumps(payload), time.time())
+            )
+            self._conn.execute("DELETE FROM research_sections WHERE key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO research_sections (key, position, subtopic_hash, title, content) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, position, section.get("subtopic_hash"), section["title"], section["content"])
+                    for position, section in enumerate(sections)
+                ]
+            )
+
+    def purge(self, max_age: Optional[float] = None, topic: Optional[str] = None) -> int:
+        """
+        Delete stored research records and outlines.
+
+        Args:
+            max_age: Only those older than this many seconds
+            topic: Only those for this topic (compared case- and whitespace-insensitively)
+
+        Returns:
+            Number of research records and outlines deleted
+        """
+        self.open()
+        cutoff = time.time() - max_age if max_age is not None else float("inf")
+        wanted = " ".join(topic.lower().split()) if topic is not None else None
+
+        def matches(row: sqlite3.Row) -> bool:
+            return wanted is None or " ".join(row["topic"].lower().split()) == wanted
+
+        with self._lock, self._conn:
+            results = [
+                (row["key"],) for row in self._conn.execute(
+                    "SELECT key, topic FROM research_results WHERE updated_at < ?", (cutoff,)
+                ) if matches(row)
+            ]
+            outlines = [
+                (row["key"],) for row in self._conn.execute(
+                    "SELECT key, topic FROM research_outlines WHERE created_at < ?", (cutoff,)
+                ) if matches(row)
+            ]
+            self._conn.executemany("DELETE FROM research_sections WHERE key = ?", results)
+            self._conn.executemany("DELETE FROM research_results WHERE key = ?", results)
+            self._conn.executemany("DELETE FROM research_outlines WHERE key = ?", outlines)
+        return len(results) + len(outlines)
+
+    def topics(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        The most recently stored research records, oldest first.
+
+        Args:
+            limit: Maximum number of records
+
+        Returns:
+            List of dictionaries with "key", "topic", "academic_level" and "include_references"
+        """
+        self.open()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, topic, academic_level, include_references FROM research_results "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {**dict(row), "include_references": bool(row["include_references"])}
+            for row in reversed(rows)
+        ]
+
+    def get_outline(self, key: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Load a stored research outline.
+
+        Args:
+            key: Key from outline_key()
+            max_age: Ignore outlines older than this many seconds
+
+        Returns:
+            Dictionary with "sections", "introduction" and "created_at", or None
+        """
+        self.open()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM research_outlines WHERE key = ?", (key,)).fetchone()
+        if row is None or (max_age is not None and time.time() - row["created_at"] > max_age):
+            return None
+        return {
+            "sections": json.loads(row["outline"]),
+            "introduction": row["introduction"],
+            "created_at": row["created_at"]
+        }
+
+    def put_outline(self, key: str, topic: str, academic_level: str, sections: List[Dict[str, str]],
+                    introduction: Optional[str] = None) -> None:
+        """
+        Store (or replace) a research outline.
+
+        Args:
+            key: Key from outline_key()
+            topic: Research topic
+            academic_level: Academic level the outline was written for
+            sections: Outline sections with "title" and "summary"
+            introduction: Optional pre-generated introduction
+        """
+        self.open()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO research_outlines (key, topic, academic_level, outline, introduction, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, topic, academic_level, json.dumps(sections), introduction, time.time())
+            )
+
+
+_stores: Dict[str, ResearchStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_research_store(settings: Settings) -> ResearchStore:
+    """Get the process-wide research store for the configured database path"""
+    db_path = settings.RESEARCH_STORE_PATH or os.path.join(settings.DATA_DIR, "research.db")
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = ResearchStore(db_path)
+        return _stores[db_path]
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import math
+import re
+import threading
+
+_WORD_RE = re.compile(r"\w+")
+
+# "How does X work?" asks for the same lesson as "X"
+_QUESTION_RE = re.compile(
+    r"^\s*(?:how|why)\s+(?:does|do|did|is|are|can)\s+(?P<topic>.+?)\s+(?:work|works|happen|happens|function)\W*$",
+    re.IGNORECASE
+)
+
+# Words that do not change what a topic is about
+STOPWORDS = frozenset("""
+a an the and or of in on at to for from by with about into as
+is are was were be do does did how what why which who this that these those it its
+explain explained explanation introduction intro overview basics fundamentals
+understanding process processes
+""".split())
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """
+    Content words of a topic: lowercased, singular, without stopwords and repeats.
+
+    Examples:
+        "Photosynthesis process" -> ["photosynthesis"]
+        "How does photosynthesis work?" -> ["photosynthesis"]
+        "Cells of plants" -> ["cell", "plant"]
+    """
+    match = _QUESTION_RE.match(text)
+    if match:
+        text = match.group("topic")
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        word = _singular(word)
+        if word not in tokens:
+            tokens.append(word)
+    return tokens
+
+
+def parse_thresholds(value: str) -> Dict[str, float]:
+    """Parse "content=0.85,research=0.9" into {"content": 0.85, "research": 0.9}"""
+    thresholds = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, threshold = item.split("=", 1)
+        try:
+            thresholds[name.strip()] = float(threshold)
+        except ValueError:
+            continue
+    return thresholds
+
+
+class SimilarityIndex:
+    """
+    In-memory index for finding near-duplicate topics, without any network.
+
+    Each entry is a short text (a topic) within a scope (e.g. an audience
+    level; only entries of the same scope are compared) pointing at the key
+    of a cached result. Texts are reduced to their content words
+    (normalize_tokens) and compared by the cosine of their TF-IDF vectors,
+    so rare words such as "photosynthesis" decide a match and common ones
+    such as "history" barely count.
+
+    Lookups first try the exact set of content words, then score only the
+    entries sharing one of the query's heaviest words (prefix filtering:
+    an entry sharing none of them cannot reach the threshold), at most
+    ``max_candidates`` of the most recent ones. When full, the oldest
+    entries are evicted.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_candidates: int = 128):
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        # key -> (scope, tokens), oldest first
+        self._entries: "OrderedDict[str, Tuple[str, Tuple[str, ...]]]" = OrderedDict()
+        self._exact: Dict[Tuple[str, FrozenSet[str]], str] = {}
+        self._postings: Dict[Tuple[str, str], Dict[str, None]] = {}
+        self._document_frequency: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _idf(self, token: str) -> float:
+        return math.log((1 + len(self._entries)) / (1 + self._document_frequency.get(token, 0))) + 1
+
+    def add(self, scope: str, text: str, key: str) -> None:
+        """Index a text under a key (replacing what the key pointed at before)"""
+        tokens = tuple(normalize_tokens(text))
+        if not tokens:
+            return
+        with self._lock:
+            self._remove(key)
+            for token in tokens:
+                self._document_frequency[token] = self._document_frequency.get(token, 0) + 1
+                self._postings.setdefault((scope, token), {})[key] = None
+            self._entries[key] = (scope, tokens)
+            self._exact[(scope, frozenset(tokens))] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key: str) -> None:
+        """Drop a key, e.g. once its cached result has expired"""
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope, tokens = entry
+        for token in tokens:
+            posting = self._postings.get((scope, token))
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[(scope, token)]
+            remaining = self._document_frequency.get(token, 1) - 1
+            if remaining > 0:
+                self._document_frequency[token] = remaining
+            else:
+                self._document_frequency.pop(token, None)
+        if self._exact.get((scope, frozenset(tokens))) == key:
+            del self._exact[(scope, frozenset(tokens))]
+
+    def lookup(self, scope: str, text: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """
+        Find the indexed text most similar to a text.
+
+        Args:
+            scope: Only entries of this scope are considered
+            text: Text to match
+            threshold: Minimum cosine similarity (1.0: the same content words only)
+
+        Returns:
+            (key, similarity) of the best match, or None if none reaches the threshold
+        """
+        tokens = normalize_tokens(text)
+        if not tokens:
+            return None
+        with self._lock:
+            key = self._exact.get((scope, frozenset(tokens)))
+            if key is not None:
+                return key, 1.0
+            if threshold >= 1.0:
+                return None
+
+            weights = {token: self._idf(token) for token in tokens}
+            norm = math.sqrt(sum(weight ** 2 for weight in weights.values()))
+            # The heaviest words until the remaining ones could not reach the threshold on their own
+            candidates: Dict[str, None] = {}
+            remaining = norm ** 2
+            for token in sorted(tokens, key=weights.get, reverse=True):
+                posting = self._postings.get((scope, token))
+                if posting:
+                    candidates.update(dict.fromkeys(islice(reversed(posting), self.max_candidates - len(candidates))))
+                remaining -= weights[token] ** 2
+                if math.sqrt(max(remaining, 0.0)) < threshold * norm or len(candidates) >= self.max_candidates:
+                    break
+
+            best = None
+            squares = {token: weight * weight for token, weight in weights.items()}
+            entries = self._entries
+            for key in candidates:
+                dot = entry_norm = 0.0
+                for token in entries[key][1]:
+                    square = squares.get(token)
+                    if square is None:
+                        square = squares[token] = self._idf(token) ** 2
+                    elif token in weights:
+                        dot += square
+                    entry_norm += square
+                similarity = dot / (norm * math.sqrt(entry_norm))
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            return best
+
+
+_indexes: Dict[str, SimilarityIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_similarity_index(name: str, settings) -> SimilarityIndex:
+    """Get the process-wide similarity index of a kind of cached result (e.g. "content", "research")"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = _indexes[name] = SimilarityIndex(settings.SIMILARITY_INDEX_SIZE)
+        return index
+
+
+def similarity_threshold(settings, endpoint: str) -> Optional[float]:
+    """
+    Similarity a cached result on another topic needs to be reused by an endpoint.
+
+    From SIMILAR_TOPIC_THRESHOLDS (1.0: the same content words only); None
+    when the endpoint is not listed or SIMILAR_TOPICS_ENABLED is off.
+    """
+    if not settings.SIMILAR_TOPICS_ENABLED:
+        return None
+    threshold = parse_thresholds(settings.SIMILAR_TOPIC_THRESHOLDS).get(endpoint)
+    return None if threshold is None else min(threshold, 1.0)
@@ -0,0 +1,255 @@
+"""
+Local stand-ins for the upstream model APIs, for benchmarks.
+
+Serves an OpenAI-compatible chat completions API (streaming and not), the
+NVIDIA text-to-image endpoint and the Gemini generateContent endpoint, with
+configurable time to first token, token rate, response length and error
+injection. Replies are shaped like what the services expect to parse, so the
+whole request path (prompt building, parsing, enrichment, file writes) runs.
+
+Usage:
+    python -m benchmarks.fake_upstreams --port 9100 --ttft 0.2 --tokens-per-second 300
+"""
+from aiohttp import web
+from typing import List
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import time
+
+# Characters per fake token, matching the estimate used for token accounting
+CHARS_PER_TOKEN = 4
+
+
+def _lesson_text(tokens: int) -> str:
+    body = "Photosynthesis converts light energy into chemical energy stored in glucose. " * max(1, tokens * CHARS_PER_TOKEN // 80)
+    return (
+        "# A Lesson\n\n## Introduction\n" + body +
+        "\n\nIMAGE_PROMPTS\n- Diagram of a leaf cell\n- Light and dark reactions\n- The carbon cycle\n"
+    )
+
+
+def _research_text(tokens: int) -> str:
+    paragraph = "Research in this field combines theory, experiment and computation. " * max(1, tokens * CHARS_PER_TOKEN // 400)
+    sections = "".join(f"## Section {i}\n{paragraph}\n\n" for i in range(1, 5))
+    return (
+        f"INTRODUCTION:\n{paragraph}\n\nSECTIONS:\n{sections}"
+        "KEY_CONCEPTS:\n- Concept one\n- Concept two\n- Concept three\n\n"
+        "VISUALIZATION_PROMPTS:\n- A timeline of discoveries\n- A diagram of the core mechanism\n\n"
+        "RELATED_TOPICS:\n- Related Topic A: shares methods\n- Related Topic B: applies the results\n\n"
+        "REFERENCES:\n"
+        '1. Watson, J. D., and F. H. C. Crick. "Molecular Structure of Nucleic Acids." Nature 171 (1953): 737-738. https://doi.org/10.1038/171737a0\n'
+    )
+
+
+def _json_reply(prompt: str) -> str:
+    if "outline" in prompt.lower():
+        return json.dumps({"sections": [{"title": f"Part {i}", "summary": "Summary of this part."} for i in range(1, 6)]})
+    return json.dumps([
+        {"topic": f"Trending Topic {i}", "description": "A topic attracting research attention.", "relevance": "High"}
+        for i in range(1, 11)
+    ])
+
+
+def reply_for(prompt: str, tokens: int) -> str:
+    """Pick a reply shape from the prompt, so each service's parser gets what it expects"""
+    lowered = prompt.lower()
+    if "json" in lowered:
+        return _json_reply(prompt)
+    if "research document" in lowered or "additional sections" in lowered:
+        return _research_text(tokens)
+    return _lesson_text(tokens)
+
+
+def _chunks(text: str) -> List[str]:
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+def _png_bytes() -> bytes:
+    """A small valid PNG, generated once"""
+    try:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (256, 256), color=(40, 120, 200)).save(buffer, format="PNG")
+        return buffer.getvalue()
+    except ImportError:
+        # 1x1 transparent PNG
+        return base64.b64decode(
+            "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+        )
+
+
+class FakeUpstreams:
+    """aiohttp application emulating the upstream APIs"""
+
+    def __init__(self, ttft: float, tokens_per_second: float, completion_tokens: int,
+                 image_latency: float, error_rate: float, disconnect_rate: float, seed: int = 0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+        self.requests = {"chat": 0, "chat_stream": 0, "nvidia_image": 0, "gemini_image": 0, "errors": 0, "streams_abandoned": 0}
+        self.png = _png_bytes()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_get("/stats", self.stats)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/image", self.nvidia_image)
+        app.router.add_post("/{version}/models/{model}:generateContent", self.gemini_generate_content)
+        return app
+
+    def _inject_error(self) -> bool:
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return True
+        return False
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.requests)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+        tokens = min(self.completion_tokens, body.get("max_tokens") or self.completion_tokens)
+        # Replies longer than the budget are cut off at it, as the real API does
+        finish_reason = "length" if tokens < self.completion_tokens else "stop"
+        text = reply_for(prompt, tokens)
+        prompt_tokens = max(1, sum(len(m.get("content", "")) for m in body.get("messages", [])) // CHARS_PER_TOKEN)
+        model = body.get("model", "fake-model")
+
+        if self._inject_error():
+            await asyncio.sleep(self.ttft)
+            return web.json_response({"error": {"message": "injected upstream error"}}, status=500)
+
+        if not body.get("stream"):
+            self.requests["chat"] += 1
+            await asyncio.sleep(self.ttft + len(_chunks(text)) / self.tokens_per_second)
+            return web.json_response({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(_chunks(text)),
+                    "total_tokens": prompt_tokens + len(_chunks(text))
+                }
+            })
+
+        self.requests["chat_stream"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await asyncio.sleep(self.ttft)
+
+        chunks = _chunks(text)
+        disconnect_at = (
+            self.random.randrange(len(chunks)) if self.disconnect_rate and self.random.random() < self.disconnect_rate else None
+        )
+        interval = 1.0 / self.tokens_per_second
+        started = time.perf_counter()
+        try:
+            for index, piece in enumerate(chunks):
+                if index == disconnect_at:
+                    self.requests["errors"] += 1
+                    # Drop the connection mid-stream
+                    request.transport.close()
+                    return response
+                event = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                # Pace tokens against the start time so timer drift does not slow the stream down
+                delay = started + (index + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            event = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+            }
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client stopped reading (e.g. the app cancelled the generation)
+            self.requests["streams_abandoned"] += 1
+        return response
+
+    async def nvidia_image(self, request: web.Request) -> web.Response:
+        await request.json()
+        await asyncio.sleep(self.image_latency)
+        if self._inject_error():
+            return web.json_response({"error": "injected upstream error"}, status=500)
+        self.requests["nvidia_image"] += 1
+        return web.json_response({"image_url": "https://images.example.invalid/fake.png"})
+
+    async def gemini_generate_content(self, request: web.Request) -> web.Response:
+        await request.json()
+        await asyncio.sleep(self.image_latency)
+        if self._inject_error():
+            return web.json_response({"error": {"code": 500, "message": "injected upstream error", "status": "INTERNAL"}}, status=500)
+        self.requests["gemini_image"] += 1
+        return web.json_response({
+            "candidates": [{
+                "content": {
+                    "role": "model",
+                    "parts": [
+                        {"text": "Here is the illustration."},
+                        {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(self.png).decode("ascii")}}
+                    ]
+                },
+                "finishReason": "STOP"
+            }]
+        })
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Upstream behaviour options, shared with the benchmark runner"""
+    parser.add_argument("--ttft", type=float, default=0.1, help="Seconds before the first token (and base LLM latency)")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Token rate of streamed and non-streamed replies")
+    parser.add_argument("--completion-tokens", type=int, default=400, help="Tokens per reply (capped by max_tokens)")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="Seconds per image generation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls answered with HTTP 500")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fraction of streams dropped mid-way")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for error injection")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake upstream model APIs for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        image_latency=args.image_latency,
+        error_rate=args.error_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed
+    )
+    web.run_app(upstreams.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Load-test and benchmark the API against local fake upstreams.
+
+Starts the fake upstream server and the FastAPI app (uvicorn, in separate
+processes), drives the selected scenarios at fixed concurrency levels and
+reports throughput, latency percentiles, time to first event for streams,
+and the app's resident memory. Results can be saved as JSON and compared
+against a saved baseline, exiting non-zero on a regression.
+
+Usage (from the backend directory):
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios content,content_stream --concurrency 1,16,64 --requests 200
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.15 --threshold image_gemini=0.3
+    python -m benchmarks.run --replay data/cassettes --replay-time-scale 1.0
+"""
+from benchmarks.fake_upstreams import add_arguments as add_upstream_arguments
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AUDIENCES = ["elementary", "middle-school", "high-school", "college", "graduate"]
+
+
+def _content_request(i: int) -> Dict[str, Any]:
+    return {"topic": f"benchmark topic {i}", "audience": AUDIENCES[i % len(AUDIENCES)]}
+
+
+def _research_request(i: int) -> Dict[str, Any]:
+    # Unique topics, so the research store does not turn the run into cache hits
+    return {
+        "topic": f"benchmark research topic {i}",
+        "subtopics": ["history", "methods"],
+        "academic_level": "undergraduate",
+        "include_references": True
+    }
+
+
+def _image_request(i: int) -> Dict[str, Any]:
+    return {"prompt": f"Educational diagram number {i} of the water cycle"}
+
+
+@dataclass
+class Scenario:
+    """One endpoint to drive, and how far it may regress against a baseline"""
+    name: str
+    path: str
+    body: Callable[[int], Dict[str, Any]]
+    stream: bool = False
+    tolerance: float = 0.15  # Allowed relative p95 latency and throughput regression
+    ttft_tolerance: float = 0.25  # Allowed relative time-to-first-event p95 regression (streams)
+
+
+SCENARIOS = {
+    "content": Scenario("content", "/api/content/generate", _content_request),
+    # The SSE router used to sleep 10 ms per event, hiding stream regressions below that; the whole
+    # stream, and its first event, are now held to the baseline
+    "content_stream": Scenario("content_stream", "/api/content/generate/stream", _content_request, stream=True,
+                               tolerance=0.10, ttft_tolerance=0.20),
+    # Mostly LLM time, plus reference enrichment against local SQLite
+    "research": Scenario("research", "/api/deep-research/research", _research_request),
+    # Image decoding and file writes run in worker threads, so thread pool scheduling adds noise
+    "image": Scenario("image", "/api/images/generate", _image_request, tolerance=0.20),
+    "image_gemini": Scenario("image_gemini", "/api/images/generate-gemini", _image_request, tolerance=0.20),
+}
+
+
+@dataclass
+class Result:
+    """Measurements for one scenario at one concurrency level"""
+    scenario: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration: float
+    throughput: float  # Successful requests per second
+    latency: Dict[str, float]  # p50/p95/p99/max in milliseconds
+    ttft: Optional[Dict[str, float]]  # Time to first SSE event, streams only
+    rss_peak_mb: Optional[float]
+    rss_end_mb: Optional[float]
+    error_samples: List[str] = field(default_factory=list)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of a list of seconds, in milliseconds (nearest-rank)"""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+        return round(ordered[index] * 1000.0, 2)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(ordered[-1] * 1000.0, 2)}
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process, from /proc (None where unavailable)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        return None
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.1)
+
+
+async def one_request(client: httpx.AsyncClient, scenario: Scenario, i: int) -> tuple:
+    """
+    Send one request.
+
+    Returns:
+        (latency seconds, time to first event or None, error message or None)
+    """
+    started = time.perf_counter()
+    if not scenario.stream:
+        response = await client.post(scenario.path, json=scenario.body(i))
+        latency = time.perf_counter() - started
+        if response.status_code != 200:
+            return latency, None, f"HTTP {response.status_code}"
+        return latency, None, None
+
+    first_event = None
+    error = None
+    async with client.stream("POST", scenario.path, json=scenario.body(i)) as response:
+        if response.status_code != 200:
+            return time.perf_counter() - started, None, f"HTTP {response.status_code}"
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            if '"error"' in line:
+                error = json.loads(line[6:]).get("error", "stream error")
+    return time.perf_counter() - started, first_event, error
+
+
+async def run_level(base_url: str, scenario: Scenario, concurrency: int, total: int,
+                    warmup: int, server_pid: int, offset: int) -> Result:
+    """Run one scenario at one concurrency level with a fixed number of workers"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        for i in range(warmup):
+            await one_request(client, scenario, offset - warmup + i)
+
+        latencies: List[float] = []
+        ttfts: List[float] = []
+        errors: List[str] = []
+        counter = iter(range(total))
+        rss_samples: List[float] = []
+
+        async def worker():
+            for n in counter:
+                try:
+                    latency, ttft, error = await one_request(client, scenario, offset + n)
+                except httpx.HTTPError as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    continue
+                if error:
+                    errors.append(error)
+                    continue
+                latencies.append(latency)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        async def sample_memory():
+            while True:
+                rss = read_rss_mb(server_pid)
+                if rss is not None:
+                    rss_samples.append(rss)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_memory())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+        sampler.cancel()
+
+    rss_end = read_rss_mb(server_pid)
+    return Result(
+        scenario=scenario.name,
+        concurrency=concurrency,
+        requests=total,
+        errors=len(errors),
+        duration=round(duration, 3),
+        throughput=round(len(latencies) / duration, 2) if duration > 0 else 0.0,
+        latency=percentiles(latencies),
+        ttft=percentiles(ttfts) if scenario.stream else None,
+        rss_peak_mb=max(rss_samples + ([rss_end] if rss_end else [])) if (rss_samples or rss_end) else None,
+        rss_end_mb=rss_end,
+        error_samples=sorted(set(errors))[:5]
+    )
+
+
+def app_environment(upstream_url: str, work_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    """Environment for the app under test: real code paths, fake upstreams, scratch data"""
+    env = dict(os.environ)
+    env.update({
+        "USE_MOCK_DATA": "False",
+        "LLM_API_BASE_URL": f"{upstream_url}/v1",
+        "LLM_API_KEY": "benchmark",
+        "NVIDIA_API_BASE_URL": f"{upstream_url}/v1",
+        "NVIDIA_API_KEY": "benchmark",
+        "GEMINI_API_BASE_URL": upstream_url,
+        "GEMINI_API_KEY": "benchmark",
+        "DATA_DIR": os.path.join(work_dir, "data"),
+        "STATIC_DIR": os.path.join(work_dir, "static"),
+        "LOG_LEVEL": "WARNING",
+        "PREFETCH_ENABLED": str(args.prefetch),
+    })
+    if args.replay:
+        # Serve LLM and Gemini calls from recorded traffic; benchmark prompts differ from the recorded ones
+        env.update({
+            "UPSTREAM_MODE": "replay",
+            "UPSTREAM_CASSETTE_DIR": os.path.abspath(args.replay),
+            "UPSTREAM_REPLAY_MATCH": "sequence",
+            "UPSTREAM_REPLAY_TIME_SCALE": str(args.replay_time_scale),
+        })
+    return env
+
+
+def parse_thresholds(values: List[str]) -> Dict[str, float]:
+    """Per-scenario tolerances from --threshold NAME=VALUE options"""
+    thresholds = {}
+    for value in values:
+        name, _, tolerance = value.partition("=")
+        if name not in SCENARIOS or not tolerance:
+            raise ValueError(f"Expected --threshold SCENARIO=TOLERANCE with one of {', '.join(SCENARIOS)}, got {value!r}")
+        thresholds[name] = float(tolerance)
+    return thresholds
+
+
+def compare(results: List[Result], baseline_path: str, tolerance: Optional[float] = None,
+            thresholds: Optional[Dict[str, float]] = None) -> List[str]:
+    """
+    Compare results with a saved baseline.
+
+    Each scenario is held to its own tolerance (Scenario.tolerance), unless
+    thresholds (by scenario name) or tolerance (for all scenarios) override it.
+
+    Returns:
+        Regressions found: p95 latency or time to first event above, or throughput below,
+        the baseline by more than the tolerance, or more errors
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result.scenario, result.concurrency))
+        if not base:
+            continue
+        scenario = SCENARIOS[result.scenario]
+        ttft_tolerance = scenario.ttft_tolerance
+        if (thresholds or {}).get(result.scenario) is not None:
+            tolerance_used = ttft_tolerance = thresholds[result.scenario]
+        elif tolerance is not None:
+            tolerance_used = ttft_tolerance = tolerance
+        else:
+            tolerance_used = scenario.tolerance
+        label = f"{result.scenario} @ {result.concurrency}"
+        if base["latency"]["p95"] and result.latency["p95"] > base["latency"]["p95"] * (1 + tolerance_used):
+            regressions.append(f"{label}: p95 {result.latency['p95']:.1f} ms vs baseline {base['latency']['p95']:.1f} ms")
+        if base["throughput"] and result.throughput < base["throughput"] * (1 - tolerance_used):
+            regressions.append(f"{label}: throughput {result.throughput:.2f}/s vs baseline {base['throughput']:.2f}/s")
+        if result.ttft and base.get("ttft") and base["ttft"]["p95"] and result.ttft["p95"] > base["ttft"]["p95"] * (1 + ttft_tolerance):
+            regressions.append(f"{label}: first event p95 {result.ttft['p95']:.1f} ms vs baseline {base['ttft']['p95']:.1f} ms")
+        if result.errors > base["errors"]:
+            regressions.append(f"{label}: {result.errors} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def print_table(results: List[Result]) -> None:
+    header = f"{'scenario':<15}{'conc':>5}{'ok':>6}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p50':>10}{'ttft p95':>10}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        ttft50 = f"{r.ttft['p50']:.1f}" if r.ttft else "-"
+        ttft95 = f"{r.ttft['p95']:.1f}" if r.ttft else "-"
+        rss = f"{r.rss_peak_mb:.1f}" if r.rss_peak_mb is not None else "-"
+        print(f"{r.scenario:<15}{r.concurrency:>5}{r.requests - r.errors:>6}{r.errors:>5}{r.throughput:>9.2f}"
+              f"{r.latency['p50']:>10.1f}{r.latency['p95']:>10.1f}{r.latency['p99']:>10.1f}{ttft50:>10}{ttft95:>10}{rss:>9}")
+        for sample in r.error_samples:
+            print(f"{'':<20}error: {sample}")
+
+
+async def run(args: argparse.Namespace) -> int:
+    scenarios = [SCENARIOS[name.strip()] for name in args.scenarios.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    work_dir = tempfile.mkdtemp(prefix="eduai-bench-")
+
+    upstream_port = free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    upstream_cmd = [
+        sys.executable, "-m", "benchmarks.fake_upstreams", "--port", str(upstream_port),
+        "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens), "--image-latency", str(args.image_latency),
+        "--error-rate", str(args.error_rate), "--disconnect-rate", str(args.disconnect_rate), "--seed", str(args.seed)
+    ]
+    app_port = free_port()
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+        "--log-level", "warning", "--no-access-log"
+    ]
+
+    upstream = subprocess.Popen(upstream_cmd, cwd=BACKEND_DIR)
+    app = subprocess.Popen(app_cmd, cwd=BACKEND_DIR, env=app_environment(upstream_url, work_dir, args))
+    try:
+        await wait_until_up(f"{upstream_url}/health")
+        await wait_until_up(f"http://127.0.0.1:{app_port}/")
+        print(f"App pid {app.pid} on port {app_port}, fake upstreams on port {upstream_port}, scratch data in {work_dir}")
+        print(f"Idle app RSS: {read_rss_mb(app.pid)} MB\n")
+
+        results = []
+        offset = 0
+        for scenario in scenarios:
+            for level in levels:
+                offset += args.requests + args.warmup
+                result = await run_level(
+                    f"http://127.0.0.1:{app_port}", scenario, level, args.requests, args.warmup, app.pid, offset
+                )
+                results.append(result)
+    finally:
+        for process in (app, upstream):
+            process.terminate()
+        for process in (app, upstream):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+                "results": [asdict(r) for r in results]
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the EduAI API against local fake upstreams")
+    parser.add_argument("--scenarios", default="content,content_stream,research,image,image_gemini",
+                        help=f"Comma-separated scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential warm-up requests before each level")
+    parser.add_argument("--prefetch", action="store_true", help="Keep related-topic prefetch enabled")
+    parser.add_argument("--replay", help="Replay LLM and Gemini traffic recorded with UPSTREAM_MODE=record from this directory")
+    parser.add_argument("--replay-time-scale", type=float, default=1.0, help="Multiplier on recorded timing when replaying")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results saved by --output and fail on regressions")
+    parser.add_argument("--tolerance", type=float,
+                        help="Allowed relative regression against the baseline for all scenarios (default: each scenario's own)")
+    parser.add_argument("--threshold", action="append", default=[], metavar="SCENARIO=TOLERANCE",
+                        help="Allowed relative regression for one scenario; may be repeated")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+    try:
+        args.threshold = parse_thresholds(args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
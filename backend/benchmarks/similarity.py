@@ -0,0 +1,60 @@
+"""
+Benchmark lookups in the near-duplicate topic index.
+
+Fills a SimilarityIndex with synthetic topics (one to five words drawn
+from a Zipf-distributed vocabulary, so common words have long posting
+lists, spread over audience scopes) and times lookups of fresh topics.
+Lookups are expected to stay well under a millisecond at 100k topics.
+
+Usage (from the backend directory):
+    python -m benchmarks.similarity
+    python -m benchmarks.similarity --entries 100000 --lookups 10000 --threshold 0.85
+"""
+from app.services.similarity_index import SimilarityIndex
+from itertools import accumulate
+from typing import List
+import argparse
+import random
+import statistics
+import time
+
+SCOPES = ("elementary", "middle-school", "high-school", "college", "graduate")
+
+
+def synthetic_topics(count: int, vocabulary: int, rng: random.Random) -> List[str]:
+    words = [f"term{i}" for i in range(vocabulary)]
+    cumulative = list(accumulate(1 / (rank + 1) for rank in range(vocabulary)))
+    return [" ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(1, 5))) for _ in range(count)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate topic lookups")
+    parser.add_argument("--entries", type=int, default=100_000, help="Topics in the index")
+    parser.add_argument("--lookups", type=int, default=10_000, help="Lookups to time")
+    parser.add_argument("--vocabulary", type=int, default=20_000, help="Distinct words")
+    parser.add_argument("--threshold", type=float, default=0.85, help="Similarity threshold")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = SimilarityIndex(max_entries=args.entries)
+    started = time.perf_counter()
+    for number, topic in enumerate(synthetic_topics(args.entries, args.vocabulary, rng)):
+        index.add(rng.choice(SCOPES), topic, f"key{number}")
+    print(f"Indexed {len(index)} topics in {time.perf_counter() - started:.1f}s")
+
+    latencies = []
+    matches = 0
+    for topic in synthetic_topics(args.lookups, args.vocabulary, rng):
+        started = time.perf_counter()
+        match = index.lookup(rng.choice(SCOPES), topic, args.threshold)
+        latencies.append((time.perf_counter() - started) * 1000)
+        matches += match is not None
+    latencies.sort()
+    print(f"{args.lookups} lookups, {matches} matches: "
+          f"mean {statistics.fmean(latencies):.3f}ms, p50 {latencies[len(latencies) // 2]:.3f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.3f}ms, max {latencies[-1]:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark cold-start time of the API.
+
+Measures two things, each over several fresh processes:
+
+- import time of ``main`` (``python -X importtime``), in total and per
+  top-level package, to catch heavy modules creeping back into the
+  start-up path;
+- time from launching uvicorn until the health check first answers 200.
+
+Results can be saved as JSON and compared against a saved baseline,
+exiting non-zero on a regression.
+
+Usage (from the backend directory):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --baseline startup.json --tolerance 0.25
+"""
+from benchmarks.run import free_port, read_rss_mb
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages the app must not import at start-up; they are loaded on first use or by the warm-up
+LAZY_PACKAGES = ("openai", "google.genai", "aiohttp", "PIL")
+
+
+def app_environment(work_dir: str) -> Dict[str, str]:
+    """Environment for the app under test: scratch data, no background warm-up skewing the numbers"""
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": os.path.join(work_dir, "data"),
+        "STATIC_DIR": os.path.join(work_dir, "static"),
+        "LOG_LEVEL": "WARNING",
+        "WARMUP_IMPORTS": "False",
+        "PYTHONWARNINGS": "ignore",
+    })
+    return env
+
+
+def profile_imports(env: Dict[str, str]) -> Dict[str, object]:
+    """
+    Import ``main`` in a fresh interpreter with -X importtime.
+
+    Returns:
+        Total seconds, seconds of self time per top-level package, and the lazy packages that were imported
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total = 0.0
+    packages: Dict[str, float] = {}
+    loaded = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (field.strip() for field in line[len("import time:"):].split("|"))
+        module = name.strip()
+        if module == "main":
+            total = int(cumulative_us) / 1e6
+        root = module.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + int(self_us) / 1e6
+        for lazy in LAZY_PACKAGES:
+            if module == lazy or module.startswith(lazy + "."):
+                loaded.add(lazy)
+    return {"total": total, "packages": packages, "eager_lazy_packages": sorted(loaded)}
+
+
+def time_to_healthy(env: Dict[str, str], timeout: float = 60.0) -> Dict[str, Optional[float]]:
+    """Launch uvicorn and time until GET / first answers 200"""
+    port = free_port()
+    started = time.perf_counter()
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        with httpx.Client() as client:
+            while True:
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if app.poll() is not None:
+                    raise RuntimeError(f"App exited with code {app.returncode} before becoming healthy")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"App did not become healthy within {timeout:.0f}s")
+                time.sleep(0.01)
+        return {"seconds": time.perf_counter() - started, "rss_mb": read_rss_mb(app.pid)}
+    finally:
+        app.terminate()
+        try:
+            app.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            app.kill()
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4)
+    }
+
+
+def compare(result: Dict[str, object], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Compare results with a saved baseline.
+
+    Returns:
+        Regressions found: median import time or time to healthy above the baseline by more than the tolerance,
+        or a lazily loaded package imported at start-up
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["result"]
+
+    regressions = []
+    for metric in ("import_seconds", "healthy_seconds"):
+        base = baseline[metric]["median"]
+        current = result[metric]["median"]
+        if base and current > base * (1 + tolerance):
+            regressions.append(f"{metric}: median {current:.3f}s vs baseline {base:.3f}s")
+    for package in result["eager_lazy_packages"]:
+        if package not in baseline.get("eager_lazy_packages", []):
+            regressions.append(f"{package} is imported at start-up again")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> int:
+    work_dir = tempfile.mkdtemp(prefix="eduai-startup-")
+    env = app_environment(work_dir)
+
+    # One untimed run of each, so bytecode compilation and the OS file cache do not count
+    profile_imports(env)
+    time_to_healthy(env)
+
+    imports, healthy, rss = [], [], []
+    packages: Dict[str, List[float]] = {}
+    eager = set()
+    for _ in range(args.runs):
+        profile = profile_imports(env)
+        imports.append(profile["total"])
+        eager.update(profile["eager_lazy_packages"])
+        for package, seconds in profile["packages"].items():
+            packages.setdefault(package, []).append(seconds)
+        started = time_to_healthy(env)
+        healthy.append(started["seconds"])
+        if started["rss_mb"] is not None:
+            rss.append(started["rss_mb"])
+
+    top_packages = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)[:args.top]
+    result = {
+        "runs": args.runs,
+        "import_seconds": summarize(imports),
+        "healthy_seconds": summarize(healthy),
+        "rss_mb": summarize(rss) if rss else None,
+        "top_packages": {name: round(seconds, 4) for seconds, name in top_packages},
+        "eager_lazy_packages": sorted(eager)
+    }
+
+    print(f"import main:        median {result['import_seconds']['median'] * 1000:8.1f} ms "
+          f"(min {result['import_seconds']['min'] * 1000:.1f}, max {result['import_seconds']['max'] * 1000:.1f})")
+    print(f"time to healthy:    median {result['healthy_seconds']['median'] * 1000:8.1f} ms "
+          f"(min {result['healthy_seconds']['min'] * 1000:.1f}, max {result['healthy_seconds']['max'] * 1000:.1f})")
+    if result["rss_mb"]:
+        print(f"RSS when healthy:   median {result['rss_mb']['median']:8.1f} MB")
+    print(f"\nSlowest packages to import (self time, median of {args.runs} runs):")
+    for name, seconds in result["top_packages"].items():
+        print(f"  {name:<28}{seconds * 1000:8.1f} ms")
+    if result["eager_lazy_packages"]:
+        print(f"\nImported at start-up although loaded lazily by the app: {', '.join(result['eager_lazy_packages'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "result": result
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(result, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cold-start time of the EduAI API")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to measure")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results saved by --output and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
 import os
+from pydantic import TypeAdapter, model_validator
 from pydantic_settings import BaseSettings
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, Iterator, Mapping
+from types import MappingProxyType
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import lru_cache
 
+# Settings that a single request may override (see settings_override)
+OVERRIDABLE_SETTINGS = frozenset({"USE_MOCK_DATA", "LLM_MODEL_ID", "LLM_TEMPERATURE", "LLM_MAX_TOKENS", "IMAGE_MODEL_ID"})
+
+# Overrides in effect for the current request (task), None when there are none
+_overrides: ContextVar[Optional[Mapping[str, Any]]] = ContextVar("settings_overrides", default=None)
+
 class Settings(BaseSettings):
     """Application settings"""
     
@@ -26,15 +36,24 @@ class Settings(BaseSettings):
     
     # Google Gemini API settings
     GEMINI_API_KEY: Optional[str] = None
+    GEMINI_API_BASE_URL: Optional[str] = None  # Override the Gemini endpoint, e.g. for a local fake in benchmarks
     
     # LLM model settings
     LLM_MODEL_ID: str = "nvidia/llama-3.3-nemotron-super-49b-v1"
     LLM_TEMPERATURE: float = 0.7  # Slightly increase for more creative output
     LLM_TOP_P: float = 0.9
-    LLM_MAX_TOKENS: int = 4096
+    LLM_MAX_TOKENS: int = 4096  # Upper bound; the prompt builder sizes each request below this
+    LLM_MIN_OUTPUT_TOKENS: int = 256
+    LLM_OUTPUT_BUDGET_SCALE: float = 1.0  # Multiplier applied to the per-request output budgets
+    LLM_OBSERVED_BUDGETS: bool = True  # Size output budgets from recent completion lengths once there are enough of them
+    LLM_BUDGET_MIN_SAMPLES: int = 20  # Completions of a kind needed before its budget is sized from them
+    LLM_BUDGET_HEADROOM: float = 1.25  # Multiplier on the 95th percentile completion length for an observed budget
+    LLM_RETRY_TRUNCATED: bool = True  # Retry a completion cut off at its budget once with double the budget
+    LLM_CONTEXT_WINDOW: int = 131072
     LLM_FREQUENCY_PENALTY: float = 0.1  # Add slight penalty to avoid repetitive text
     LLM_PRESENCE_PENALTY: float = 0.1  # Add slight penalty to encourage diverse topics
     LLM_STREAM: bool = False  # Set to True for streaming responses in async handlers
+    LLM_STREAM_SINGLE_FLIGHT: bool = True  # Identical concurrent streaming requests share one upstream stream
     
     # System message for the model
     LLM_SYSTEM_MESSAGE: str = """You are an expert educational AI assistant designed to create high-quality, 
@@ -48,29 +67,213 @@ class Settings(BaseSettings):
     
     # File paths
     STATIC_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+    DATA_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
     
     # Cache settings
-    CONTENT_CACHE_TTL: int = 3600  # Cache TTL in seconds (1 hour)
+    CONTENT_CACHE_TTL: int = 3600  # Seconds lessons and their outlines are cached (0 = no caching)
+    CACHEABLE_GET_MAX_AGE: int = 3600  # Seconds proxies and CDNs may serve GET /api/content/{key} (and research) without revalidating
+    
+    # Near-duplicate topics ("Photosynthesis process", "How does photosynthesis work?") reuse cached results
+    SIMILAR_TOPICS_ENABLED: bool = True
+    SIMILAR_TOPIC_THRESHOLDS: str = "content=0.85,audiences=0.85,research=0.9"  # Cosine similarity per endpoint (1 = same words only)
+    SIMILARITY_INDEX_SIZE: int = 100000  # Topics indexed per kind of cached result
+    
+    # Reference enrichment settings
+    REFERENCE_ENRICHMENT_ENABLED: bool = True
+    CITATION_INDEX_PATH: Optional[str] = None  # Defaults to DATA_DIR/citations.db
+    CITATION_SEED_FILE: Optional[str] = None  # JSON/JSONL seed, defaults to DATA_DIR/citations_seed.jsonl
+    REFERENCE_CACHE_SIZE: int = 2048  # Enriched references kept in memory, keyed by normalized title
+    REFERENCE_CACHE_TTL: int = 86400  # Seconds resolved references are kept in the shared store
+    REFERENCE_MISS_CACHE_TTL: int = 300  # Seconds unresolved references are remembered, and between checks of the seed file
+    
+    # Research persistence settings
+    RESEARCH_STORE_ENABLED: bool = True  # Reuse stored research and only generate sections for new subtopics
+    RESEARCH_STORE_PATH: Optional[str] = None  # Defaults to DATA_DIR/research.db
+    RESEARCH_STORE_TTL: int = 2592000  # Stored research is generated again after 30 days, and purged at startup (0 = kept forever)
+    OUTLINE_CACHE_TTL: int = 86400  # Cached research outlines are reused for a day
+    RESEARCH_OUTLINE_SEEDING: bool = True  # Generate research on a topic from its cached (e.g. prefetched) outline
+    
+    # Lesson library (GET /api/lessons/search): generated lessons and research, kept and full-text indexed
+    LESSON_LIBRARY_ENABLED: bool = True
+    LESSON_LIBRARY_PATH: Optional[str] = None  # Defaults to DATA_DIR/lessons.db
+    LESSON_LIBRARY_BATCH_SIZE: int = 50  # Lessons written per transaction
+    LESSON_LIBRARY_FLUSH_INTERVAL: float = 1.0  # Seconds a lesson may wait in memory for its batch to fill
+    LESSON_LIBRARY_QUEUE_SIZE: int = 1000  # Lessons waiting to be written; more are dropped
+    
+    # Speculative prefetch of related-topic outlines after a research response
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_TOP_N: int = 2  # Related topics to prefetch per research response
+    PREFETCH_INTRODUCTIONS: bool = False  # Also pre-generate introductions (more tokens)
+    PREFETCH_USER_BUDGET: int = 10  # Prefetches allowed per user per PREFETCH_BUDGET_WINDOW
+    PREFETCH_BUDGET_WINDOW: int = 3600  # Seconds
+    PREFETCH_MAX_CONCURRENCY: int = 1  # Prefetches running at once in this process
+    PREFETCH_IDLE_SECONDS: float = 2.0  # Foreground upstream calls must have been idle this long
+    PREFETCH_MAX_WAIT: float = 120.0  # Give up on a prefetch that finds no idle capacity within this time
+    
+    # Request deadlines: each request's upstream calls share one time budget
+    REQUEST_DEADLINE_DEFAULT: float = 120.0  # Seconds, for routes without their own budget (0 disables)
+    REQUEST_DEADLINES: str = "/api/content/generate=90,/api/content/generate/stream=180,/api/deep-research/research=150,/api/images=90"  # path-prefix=seconds
+    REQUEST_DEADLINE_MAX: float = 600.0  # Cap on budgets asked for with the X-Request-Deadline header
+    LLM_TIMEOUT: float = 120.0  # Cap on a single LLM call, within the request budget
+    LLM_STREAM_IDLE_TIMEOUT: float = 60.0  # Give up on a stream that sends nothing for this long
+    IMAGE_TIMEOUT: float = 60.0  # Cap on a single image generation call
+    
+    # Upstream scheduling: interactive requests ahead of background jobs and speculative prefetch (per worker process)
+    UPSTREAM_LLM_CONCURRENCY: int = 16  # LLM calls running at once (0 disables the limit and the scheduling)
+    UPSTREAM_IMAGE_CONCURRENCY: int = 8  # Calls running at once to each image API (0 disables the limit)
+    UPSTREAM_PRIORITY_WEIGHTS: str = "interactive=8,background=2,speculative=1"  # Share of contended slots per class
+    UPSTREAM_INTERACTIVE_RESERVE: int = 2  # Slots that only interactive calls may use
+    UPSTREAM_PREEMPT_DEPTH: int = 4  # Interactive calls waiting at which lower classes are deferred and speculative calls preempted
+    UPSTREAM_STARVATION_SECONDS: float = 30.0  # A call waiting this long is served next, whatever its class
+    UPSTREAM_LLM_RPM: float = 0  # LLM calls started per minute at most (0 = no rate limit)
+    UPSTREAM_IMAGE_RPM: float = 0  # Calls started per minute to each image API at most (0 = no rate limit)
+    
+    # Multi-worker deployment (gunicorn -c gunicorn.conf.py main:app)
+    WEB_CONCURRENCY: Optional[int] = None  # Worker processes, defaults to the number of CPU cores
+    SHUTDOWN_DRAIN_DELAY: float = 0.0  # Seconds a stopping worker keeps serving while its health check fails
+    SHUTDOWN_GRACE_PERIOD: float = 180.0  # Seconds in-flight requests (SSE streams) get to finish on shutdown
+    SHARED_STATE_BACKEND: str = "memory"  # "memory" (per process) or "sqlite" (shared by the workers of a host)
+    SHARED_STATE_PATH: Optional[str] = None  # Defaults to DATA_DIR/shared_state.db
+    
+    # Background jobs (POST /api/jobs): long-running work off the request path
+    JOBS_ENABLED: bool = True
+    JOB_STORE_PATH: Optional[str] = None  # Defaults to DATA_DIR/jobs.db; shared by the workers of a host
+    JOB_WORKERS: int = 2  # Jobs running at once per worker process
+    JOB_ITEM_CONCURRENCY: int = 2  # Items (images, curriculum topics) of one job generated at once
+    JOB_MAX_QUEUED: int = 100  # Queued jobs accepted before POST /api/jobs answers 429
+    JOB_TIMEOUT: float = 1800.0  # Time budget of one job's upstream calls (0 disables)
+    JOB_LEASE_SECONDS: float = 60.0  # A running job whose worker has not checked in for this long is run again
+    JOB_MAX_ATTEMPTS: int = 3  # Runs of a job (including after worker restarts) before it is failed
+    JOB_POLL_INTERVAL: float = 1.0  # Seconds between checks for queued jobs submitted to other workers
+    JOB_RETENTION: int = 604800  # Seconds finished jobs (and their idempotency keys) are kept
+    JOB_WEBHOOK_TIMEOUT: float = 10.0
+    JOB_WEBHOOK_RETRIES: int = 3
+    JOB_WEBHOOK_SECRET: Optional[str] = None  # Signs webhook bodies (X-EduAI-Signature: sha256=<HMAC>)
+    JOB_WEBHOOK_ALLOWED_HOSTS: str = ""  # Comma-separated webhook hosts ("*.example.com" for subdomains); empty allows any public host
+    
+    # Start-up warm-up, run in the background; /ready answers 503 until it is done
+    WARMUP_IMPORTS: bool = True  # Import the SDKs (openai, google.genai, aiohttp, Pillow) the clients load on first use
+    WARMUP_CONNECTIONS: bool = True  # Open pooled connections to the LLM and NVIDIA image endpoints
+    WARMUP_COMPLETION: bool = False  # Also send a one-token completion to the LLM
+    WARMUP_CACHES: bool = True  # Open the research store, citation index and shared store; run the parsers once
+    WARMUP_DELAY: float = 0.0  # Seconds to wait before the warm-up starts
+    WARMUP_TIMEOUT: float = 30.0  # Report ready after this long even if the warm-up has not finished
+    
+    # Metrics settings
+    METRICS_ENABLED: bool = True  # Expose Prometheus metrics at /metrics
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5  # Seconds between event-loop lag samples
+    METRICS_MULTIPROCESS_DIR: Optional[str] = None  # Directory where each worker writes its metrics for /metrics to merge; gunicorn.conf.py sets DATA_DIR/metrics with several workers
+    METRICS_FLUSH_INTERVAL: float = 5.0  # Seconds between writes of a worker's metrics to METRICS_MULTIPROCESS_DIR
+    
+    # Tracing settings
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "jsonl"  # "jsonl" (one span per line in TRACING_FILE) or "memory"
+    TRACING_FILE: Optional[str] = None  # Defaults to DATA_DIR/traces.jsonl
+    
+    # Logging settings
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""  # Per-module levels, e.g. "app.gemini_api=WARNING,app.services.content_service=DEBUG"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_SAMPLE_RATE: float = 0.05  # Fraction of high-volume events (per chunk, per response part) that are logged
+    
+    # Upstream record/replay, independent of the USE_MOCK_DATA fallbacks
+    UPSTREAM_MODE: str = "live"  # "live", "record" (call the APIs and save the traffic) or "replay" (serve saved traffic, no network)
+    UPSTREAM_CASSETTE_DIR: Optional[str] = None  # Defaults to DATA_DIR/cassettes
+    UPSTREAM_REPLAY_TIME_SCALE: float = 1.0  # Multiplier on recorded latencies and chunk timing; 0 replays instantly
+    UPSTREAM_REPLAY_MATCH: str = "exact"  # "exact" (same request only) or "sequence" (any recording of the same operation, in order)
     
     # Mock mode for development
     USE_MOCK_DATA: bool = False  # Set to False to use the real API instead of mock data
+    REQUEST_OVERRIDES_ENABLED: bool = False  # Accept X-EduAI-Mock/-Model/-Temperature/... headers overriding settings per request
     
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = True
+        # One Settings object is shared by all requests; per-request changes go through settings_override()
+        frozen = True
+        
+    @model_validator(mode="before")
+    @classmethod
+    def _default_llm_api_key(cls, values: Any) -> Any:
+        # Use NVIDIA_API_KEY if LLM_API_KEY is not provided
+        if isinstance(values, dict) and not values.get("LLM_API_KEY") and values.get("NVIDIA_API_KEY"):
+            values = {**values, "LLM_API_KEY": values["NVIDIA_API_KEY"]}
+        return values
         
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         
         # Ensure the static directory exists
         os.makedirs(self.STATIC_DIR, exist_ok=True)
+    
+    def current(self, name: str) -> Any:
+        """
+        Value of a setting for the current request.
         
-        # Use NVIDIA_API_KEY if LLM_API_KEY is not provided
-        if not self.LLM_API_KEY and self.NVIDIA_API_KEY:
-            self.LLM_API_KEY = self.NVIDIA_API_KEY
+        Returns the override set with settings_override() in this context,
+        or the configured value. Use it for the OVERRIDABLE_SETTINGS; other
+        settings can be read as plain attributes.
+        """
+        overrides = _overrides.get()
+        if overrides is not None and name in overrides:
+            return overrides[name]
+        return getattr(self, name)
 
 @lru_cache()
 def get_settings() -> Settings:
     """Get application settings, cached to avoid reloading from disk"""
     return Settings()
+
+
+@lru_cache()
+def _adapter(name: str) -> TypeAdapter:
+    return TypeAdapter(Settings.model_fields[name].annotation)
+
+
+def validate_override(name: str, value: Any) -> Any:
+    """
+    Check that a setting may be overridden per request and convert the value to its type.
+    
+    Raises:
+        ValueError: If the setting cannot be overridden or the value is invalid
+    """
+    if name not in OVERRIDABLE_SETTINGS:
+        raise ValueError(f"{name} cannot be overridden per request")
+    try:
+        return _adapter(name).validate_python(value, strict=False)
+    except Exception as e:
+        raise ValueError(f"Invalid value for {name}: {value!r}") from e
+
+
+def get_override(name: str, default: Any = None) -> Any:
+    """Override of a setting in the current context, or default if it is not overridden"""
+    overrides = _overrides.get()
+    if overrides is None:
+        return default
+    return overrides.get(name, default)
+
+
+@contextmanager
+def settings_override(**values: Any) -> Iterator[None]:
+    """
+    Override settings for the enclosed code and the tasks it starts.
+    
+    Overrides live in a context variable, so concurrent requests never see
+    each other's values, and the shared Settings object is never copied or
+    changed. Nested overrides add to (and take precedence over) outer ones.
+    
+    Example:
+        with settings_override(USE_MOCK_DATA=True, LLM_TEMPERATURE=0.2):
+            content = await service.generate_educational_content(topic, audience)
+    
+    Raises:
+        ValueError: If a setting cannot be overridden or a value is invalid
+    """
+    validated = {name: validate_override(name, value) for name, value in values.items()}
+    outer = _overrides.get()
+    token = _overrides.set(MappingProxyType({**(outer or {}), **validated}))
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
@@ -0,0 +1,60 @@
+# Production server configuration: gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+import os
+
+from app.core.metrics import clear_metrics_directory, mark_process_dead
+from config.settings import get_settings
+
+settings = get_settings()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# One worker per core by default; each worker runs its own event loop
+workers = settings.WEB_CONCURRENCY or multiprocessing.cpu_count()
+worker_class = "app.core.gunicorn_worker.DrainingUvicornWorker"
+
+if workers > 1:
+    # Several workers share state through a SQLite file and merge their metrics
+    # on /metrics, unless configured otherwise. Set in the environment before the
+    # app is preloaded, so the master and the workers it forks read the same settings.
+    if "SHARED_STATE_BACKEND" not in settings.model_fields_set:
+        os.environ["SHARED_STATE_BACKEND"] = "sqlite"
+    if settings.METRICS_ENABLED and not settings.METRICS_MULTIPROCESS_DIR:
+        os.environ["METRICS_MULTIPROCESS_DIR"] = os.path.join(settings.DATA_DIR, "metrics")
+    get_settings.cache_clear()
+    settings = get_settings()
+
+# Import the app once in the master and fork the workers from it: faster
+# start-up and copy-on-write sharing of the imported code. Connections
+# (SQLite, HTTP clients) are opened lazily, so none are shared across the fork.
+# A HUP reload keeps the preloaded code; deploy new code by restarting the master.
+preload_app = True
+
+# Seconds a worker may be silent before the master restarts it
+timeout = 60
+
+# Seconds SIGTERM'd workers get to finish in-flight requests (SSE streams run for minutes)
+graceful_timeout = settings.SHUTDOWN_DRAIN_DELAY + settings.SHUTDOWN_GRACE_PERIOD + 5
+
+keepalive = 5
+
+# Structured logs come from the app itself (see app.core.structured_logging)
+accesslog = None
+errorlog = "-"
+loglevel = settings.LOG_LEVEL.lower()
+
+
+def on_starting(server):
+    if workers > 1 and settings.SHARED_STATE_BACKEND == "memory":
+        server.log.warning(
+            "SHARED_STATE_BACKEND=memory with %d workers: prefetch budgets and shared caches hold per worker, "
+            "not per host; set SHARED_STATE_BACKEND=sqlite", workers
+        )
+    if settings.METRICS_MULTIPROCESS_DIR:
+        clear_metrics_directory(settings.METRICS_MULTIPROCESS_DIR)
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counters in /metrics, so they do not go down
+    if settings.METRICS_MULTIPROCESS_DIR:
+        mark_process_dead(settings.METRICS_MULTIPROCESS_DIR, worker.pid)
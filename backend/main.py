@@ -1,15 +1,66 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
 import os
-from app.routers import content, images, deep_research
+from app.routers import content, images, deep_research, jobs, lessons
+from app.core.metrics import CONTENT_TYPE, EventLoopLagMonitor, MetricsMiddleware, get_metrics_files, get_registry
+from app.core.tracing import TracingMiddleware, configure_tracing, get_tracer
+from app.core.structured_logging import RequestIdMiddleware, configure_logging
+from app.core.deadlines import DeadlineMiddleware, parse_route_budgets
+from app.core.request_overrides import SettingsOverrideMiddleware
+from app.core.lifecycle import get_drain_state, serve
+from app.core.upstream_clients import close_upstream_clients
+from app.core.warmup import get_readiness, start_warm_up
+from app.services.job_service import get_job_queue
+from app.services.lesson_library import get_lesson_library
+from config.settings import get_settings
+
+settings = get_settings()
+configure_logging(settings)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background monitors and exporters with the application"""
+    configure_tracing(settings)
+    # Warm up in the background; the port is bound without waiting, and /ready reports when it is done
+    warm_up = start_warm_up(settings)
+    lag_monitor = EventLoopLagMonitor(settings.METRICS_LOOP_LAG_INTERVAL)
+    # With several workers, each writes its metrics to a file that /metrics merges
+    metrics_files = get_metrics_files(settings) if settings.METRICS_ENABLED else None
+    if settings.METRICS_ENABLED:
+        lag_monitor.start()
+    if metrics_files is not None:
+        metrics_files.start()
+    # Background job workers; on shutdown their running jobs go back to the queue
+    job_queue = get_job_queue(settings)
+    if settings.JOBS_ENABLED:
+        job_queue.start()
+    # Writer of the lesson library; lessons still queued are written on shutdown
+    lesson_library = get_lesson_library(settings)
+    if settings.LESSON_LIBRARY_ENABLED:
+        lesson_library.start()
+    yield
+    warm_up.cancel()
+    await job_queue.stop()
+    await lesson_library.stop()
+    await close_upstream_clients()
+    await lag_monitor.stop()
+    if metrics_files is not None:
+        await metrics_files.stop()
+    get_tracer().configure(None)
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="EduAI API",
     description="Backend API for EduAI: AI-Powered Educational Content Generator",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -19,13 +70,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition", "Content-Type", "Content-Length"]
+    expose_headers=["Content-Disposition", "Content-Type", "Content-Length", "traceparent", "X-Request-ID"]
 )
 
+# Per-request overrides of mock mode, model and temperature (trusted clients only)
+if settings.REQUEST_OVERRIDES_ENABLED:
+    app.add_middleware(SettingsOverrideMiddleware)
+
+# Per-request time budget for upstream calls, and cancellation when the client disconnects
+app.add_middleware(
+    DeadlineMiddleware,
+    default_budget=settings.REQUEST_DEADLINE_DEFAULT,
+    route_budgets=parse_route_budgets(settings.REQUEST_DEADLINES),
+    max_budget=settings.REQUEST_DEADLINE_MAX
+)
+
+# Record per-route latency, including the time spent in CORS handling
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Root span of each request; services and API clients open child spans
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+# Request IDs for log records and the X-Request-ID response header
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(content.router, prefix="/api/content", tags=["content"])
 app.include_router(images.router, prefix="/api/images", tags=["images"])
 app.include_router(deep_research.router, prefix="/api/deep-research", tags=["deep-research"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(lessons.router, prefix="/api/lessons", tags=["lessons"])
 
 # Set up static files directory
 static_directory = Path(__file__).parent / "static"
@@ -37,9 +113,33 @@ os.makedirs(static_directory / "audio", exist_ok=True)
 
 @app.get("/")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint; 503 while the worker drains for shutdown"""
+    if get_drain_state().draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "service": "EduAI API"})
     return {"status": "healthy", "service": "EduAI API"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint; 503 until the start-up warm-up is done, and while draining"""
+    readiness = get_readiness()
+    if get_drain_state().draining:
+        status = "draining"
+    elif not readiness.ready:
+        status = "warming_up"
+    else:
+        return {"status": "ready", "warmup": readiness.steps, "warmup_seconds": readiness.seconds}
+    return JSONResponse(status_code=503, content={"status": status, "warmup": readiness.steps})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint; the metrics of all workers when they write them to METRICS_MULTIPROCESS_DIR"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    metrics_files = get_metrics_files(settings)
+    if metrics_files is not None:
+        return Response(content=await asyncio.to_thread(metrics_files.render), media_type=CONTENT_TYPE)
+    return Response(content=get_registry().render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # Single worker; see gunicorn.conf.py for multi-worker deployments
+    serve("main:app", settings, host="0.0.0.0", port=int(os.environ.get("PORT", "8000")), reload=settings.DEBUG)
@@ -16,8 +16,7 @@ async def test_llm_client():
     load_dotenv()
     
     # Create settings with USE_MOCK_DATA set to False to force API calls
-    settings = Settings()
-    settings.USE_MOCK_DATA = False
+    settings = Settings(USE_MOCK_DATA=False)
     
     # Print configuration
     print(f"Using API type: {settings.LLM_API_TYPE}")
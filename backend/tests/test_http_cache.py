@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from fastapi import Request
+
+from app.core.http_cache import cacheable_json_response, etag_matches, strong_etag
+
+
+def make_request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode("latin-1"))]
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+
+def test_strong_etag_depends_only_on_the_body():
+    etag = strong_etag(b'{"a":1}')
+    assert etag == strong_etag(b'{"a":1}')
+    assert etag != strong_etag(b'{"a":2}')
+    assert etag.startswith('"') and etag.endswith('"') and not etag.startswith("W/")
+
+
+@pytest.mark.parametrize("header", ['"abc"', 'W/"abc"', '"x", W/"abc"', ' "x" ,"abc" ', "*"])
+def test_matching_if_none_match_headers(header):
+    assert etag_matches(header, '"abc"')
+
+
+@pytest.mark.parametrize("header", [None, "", '"abcd"', 'W/"x", "y"', "abc"])
+def test_mismatching_if_none_match_headers(header):
+    assert not etag_matches(header, '"abc"')
+
+
+def test_response_without_if_none_match_has_a_body_and_etag():
+    response = cacheable_json_response(make_request(), {"topic": "Photosynthesis", "sections": [1, 2]}, 300)
+    assert response.status_code == 200
+    assert json.loads(response.body) == {"topic": "Photosynthesis", "sections": [1, 2]}
+    assert response.headers["etag"] == strong_etag(response.body)
+    assert response.headers["cache-control"] == "public, max-age=300"
+
+
+def test_matching_etag_is_answered_not_modified():
+    content = {"topic": "Photosynthesis"}
+    etag = cacheable_json_response(make_request(), content, 300).headers["etag"]
+    response = cacheable_json_response(make_request(f'W/{etag}'), content, 300)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+
+
+def test_changed_content_is_sent_again():
+    etag = cacheable_json_response(make_request(), {"topic": "Photosynthesis"}, 300).headers["etag"]
+    response = cacheable_json_response(make_request(etag), {"topic": "Respiration"}, 300)
+    assert response.status_code == 200
+    assert json.loads(response.body) == {"topic": "Respiration"}
+    assert response.headers["etag"] != etag
+
+
+def test_negative_max_age_is_clamped():
+    response = cacheable_json_response(make_request(), [], -5)
+    assert response.headers["cache-control"] == "public, max-age=0"
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.services.json_extractor import JSONExtractionError, StreamingJSONExtractor, extract_json, iter_json_items
+
+
+def feed_chunks(text, size):
+    extractor = StreamingJSONExtractor()
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(extractor.feed(text[i:i + size]))
+    return extractor, items
+
+
+async def _chunks(text, size):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def collect_items(text, size=3):
+    async def run():
+        return [item async for item in iter_json_items(_chunks(text, size))]
+    return asyncio.run(run())
+
+
+def test_preamble_fence_and_commentary_are_skipped():
+    reply = 'Here you go:\n```json\n{"sections": [{"title": "A"}]}\n```\nHope this helps!'
+    assert extract_json(reply) == {"sections": [{"title": "A"}]}
+
+
+def test_trailing_commas_are_tolerated():
+    assert extract_json('[1, 2, {"a": [3, 4,],},]') == [1, 2, {"a": [3, 4]}]
+
+
+def test_bracketed_prose_before_the_value_is_skipped():
+    assert extract_json('See [the list below] and {"k": 1}') == {"k": 1}
+
+
+def test_brackets_inside_strings_are_ignored():
+    assert extract_json('{"text": "a ] b } c [ \\" {"}') == {"text": 'a ] b } c [ " {'}
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_array_items_are_returned_as_they_close(size):
+    extractor, items = feed_chunks('[{"topic": "A"}, {"topic": "B"}, 3]', size)
+    assert items == [{"topic": "A"}, {"topic": "B"}, 3]
+    assert extractor.done
+    assert extractor.result() == items
+
+
+def test_truncated_value_is_cut_back_and_closed():
+    assert extract_json('{"sections": [{"title": "A"}, {"title": "B"}, {"tit') == {
+        "sections": [{"title": "A"}, {"title": "B"}]
+    }
+
+
+def test_truncated_array_keeps_its_complete_members():
+    assert extract_json('[{"topic": "A"}, {"topic": "B"}, {"topic": "C", "desc') == [
+        {"topic": "A"}, {"topic": "B"}, {"topic": "C"}
+    ]
+
+
+def test_missing_comma_returns_the_streamed_items():
+    extractor, items = feed_chunks('[{"topic": "A"} {"topic": "B"}]', 4)
+    assert items == [{"topic": "A"}, {"topic": "B"}]
+    assert extractor.done
+    assert extractor.result() == items
+
+
+def test_missing_comma_streams_without_an_error():
+    assert collect_items('[{"topic": "A"} {"topic": "B"}] trailing text') == [{"topic": "A"}, {"topic": "B"}]
+
+
+def test_mismatched_closing_bracket_abandons_the_value():
+    assert extract_json('oops [see below} then {"k": [1]}') == {"k": [1]}
+
+
+def test_mismatched_closing_bracket_keeps_streamed_items():
+    assert extract_json('[1, 2, {"a": 3]}, 4]') == [1, 2]
+
+
+def test_no_json_raises():
+    with pytest.raises(JSONExtractionError):
+        extract_json("No structured data here.")
+
+
+def test_iter_json_items_recovers_a_truncated_tail():
+    assert collect_items('[{"topic": "A"}, {"topic": "B"}') == [{"topic": "A"}, {"topic": "B"}]
@@ -0,0 +1,68 @@
+import json
+
+from app.core.metrics import MetricsFiles, MetricsRegistry, clear_metrics_directory, mark_process_dead
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests", ("route",))
+    registry.gauge("in_progress", "In progress")
+    registry.gauge("template_tokens", "Template tokens", ("template",), multiprocess_mode="max")
+    registry.histogram("duration_seconds", "Duration", buckets=(0.1, 1.0))
+    return registry
+
+
+def record(registry, requests, in_progress, duration):
+    metrics = registry._metrics
+    metrics["requests_total"].inc(requests, route="/a")
+    metrics["in_progress"].set(in_progress)
+    metrics["template_tokens"].set(120, template="lesson")
+    metrics["duration_seconds"].observe(duration)
+
+
+def write_worker_file(directory, pid, registry):
+    """Metrics file of another worker process"""
+    (directory / f"worker-{pid}-1.json").write_text(json.dumps(registry.snapshot()))
+
+
+def test_snapshots_of_workers_are_merged():
+    first, second = make_registry(), make_registry()
+    record(first, 3, 1, 0.05)
+    record(second, 4, 2, 0.5)
+    rendered = first.render_merged([first.snapshot(), second.snapshot()])
+    assert 'requests_total{route="/a"} 7' in rendered
+    assert "in_progress 3" in rendered
+    assert 'template_tokens{template="lesson"} 120' in rendered
+    assert 'duration_seconds_bucket{le="0.1"} 1' in rendered
+    assert 'duration_seconds_bucket{le="1"} 2' in rendered
+    assert "duration_seconds_count 2" in rendered
+
+
+def test_metrics_files_render_every_worker(tmp_path):
+    first, second = make_registry(), make_registry()
+    record(first, 3, 1, 0.05)
+    record(second, 4, 2, 0.5)
+    write_worker_file(tmp_path, 999999, second)
+    rendered = MetricsFiles(str(tmp_path), first).render()
+    assert 'requests_total{route="/a"} 7' in rendered
+    assert "in_progress 3" in rendered
+
+
+def test_exited_worker_keeps_its_counters_but_not_its_gauges(tmp_path):
+    first, second = make_registry(), make_registry()
+    record(first, 3, 1, 0.05)
+    record(second, 4, 2, 0.5)
+    write_worker_file(tmp_path, 999999, second)
+    mark_process_dead(str(tmp_path), 999999, second)
+    assert [path.name for path in tmp_path.iterdir()] == ["exited-999999-1.json"]
+    rendered = MetricsFiles(str(tmp_path), first).render()
+    assert 'requests_total{route="/a"} 7' in rendered
+    assert "in_progress 1" in rendered
+    assert "duration_seconds_count 2" in rendered
+
+
+def test_clearing_removes_files_of_an_earlier_run(tmp_path):
+    (tmp_path / "worker-1-1.json").write_text("{}")
+    (tmp_path / "exited-2-1.json").write_text("{}")
+    clear_metrics_directory(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.similarity_index import SimilarityIndex, normalize_tokens, parse_thresholds, similarity_threshold
+
+
+def make_settings(thresholds="content=0.85,research=0.9", enabled=True):
+    return SimpleNamespace(SIMILAR_TOPICS_ENABLED=enabled, SIMILAR_TOPIC_THRESHOLDS=thresholds)
+
+
+def make_index():
+    index = SimilarityIndex()
+    index.add("beginner", "Photosynthesis", "photosynthesis")
+    index.add("beginner", "History of Rome", "rome")
+    index.add("beginner", "Cell biology", "cells")
+    return index
+
+
+def test_thresholds_are_parsed_per_endpoint():
+    assert parse_thresholds(" content = 0.8 ,research=0.9") == {"content": 0.8, "research": 0.9}
+
+
+def test_malformed_threshold_items_are_skipped():
+    assert parse_thresholds("content=high,research,=0.5,audiences=0.7,") == {"": 0.5, "audiences": 0.7}
+    assert parse_thresholds("") == {}
+
+
+def test_threshold_is_looked_up_per_endpoint():
+    settings = make_settings()
+    assert similarity_threshold(settings, "content") == 0.85
+    assert similarity_threshold(settings, "research") == 0.9
+    assert similarity_threshold(settings, "audiences") is None
+
+
+def test_threshold_is_capped_at_one():
+    assert similarity_threshold(make_settings("content=1.5"), "content") == 1.0
+
+
+def test_disabled_similar_topics_have_no_threshold():
+    assert similarity_threshold(make_settings(enabled=False), "content") is None
+
+
+def test_rephrased_topic_has_the_same_content_words():
+    assert normalize_tokens("How does photosynthesis work?") == ["photosynthesis"]
+    assert normalize_tokens("Cells of plants") == ["cell", "plant"]
+
+
+def test_same_content_words_match_even_at_threshold_one():
+    assert make_index().lookup("beginner", "Introduction to photosynthesis", 1.0) == ("photosynthesis", 1.0)
+
+
+@pytest.mark.parametrize("threshold, expected", [(0.5, "cells"), (0.7, "cells"), (0.85, None), (1.0, None)])
+def test_similar_topic_matches_only_above_the_threshold(threshold, expected):
+    match = make_index().lookup("beginner", "Plant cell biology", threshold)
+    if expected is None:
+        assert match is None
+    else:
+        key, similarity = match
+        assert key == expected
+        assert threshold <= similarity < 1.0
+
+
+def test_other_scopes_are_not_matched():
+    assert make_index().lookup("expert", "Photosynthesis", 0.5) is None
+
+
+def test_removed_and_evicted_keys_are_not_matched():
+    index = make_index()
+    index.remove("photosynthesis")
+    assert index.lookup("beginner", "Photosynthesis", 0.5) is None
+
+    index = SimilarityIndex(max_entries=2)
+    index.add("beginner", "Photosynthesis", "photosynthesis")
+    index.add("beginner", "History of Rome", "rome")
+    index.add("beginner", "Cell biology", "cells")
+    assert len(index) == 2
+    assert index.lookup("beginner", "Photosynthesis", 0.5) is None
+    assert index.lookup("beginner", "Cell biology", 1.0) == ("cells", 1.0)
@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.deadlines import DeadlineExceeded, deadline_scope
+from app.core.upstream_scheduler import ResourceScheduler, UpstreamPreempted, parse_priority_weights
+
+
+def make_scheduler(capacity=1, weights="interactive=3,background=1,speculative=1", **kwargs):
+    return ResourceScheduler("test", capacity, parse_priority_weights(weights), **kwargs)
+
+
+async def grant_order(scheduler, priorities, hold=0.0):
+    """Queue calls of these classes behind a held slot, release it, and return the order the calls ran in"""
+    order = []
+    gate = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot("interactive"):
+            await gate.wait()
+
+    async def call(priority):
+        async with scheduler.slot(priority):
+            order.append(priority)
+            await asyncio.sleep(hold)
+
+    held = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    calls = [asyncio.create_task(call(priority)) for priority in priorities]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(held, *calls)
+    return order
+
+
+def test_waiting_classes_share_slots_by_weight():
+    scheduler = make_scheduler(preempt_depth=100)
+    order = asyncio.run(grant_order(scheduler, ["background"] * 8 + ["interactive"] * 8))
+    assert order[:8].count("interactive") == 6
+    assert order[:8].count("background") == 2
+    assert len(order) == 16
+
+
+def test_equal_weights_alternate():
+    scheduler = make_scheduler(weights="interactive=1,background=1", preempt_depth=100)
+    order = asyncio.run(grant_order(scheduler, ["background"] * 3 + ["interactive"] * 3))
+    assert order == ["interactive", "background"] * 3
+
+
+def test_background_waits_while_interactive_calls_queue_up():
+    scheduler = make_scheduler(starvation_seconds=1000, preempt_depth=4)
+    order = asyncio.run(grant_order(scheduler, ["background"] + ["interactive"] * 20, hold=0.005))
+    # Served only once fewer than preempt_depth interactive calls are left waiting
+    assert order.index("background") >= 16
+
+
+def test_starved_call_is_served_despite_a_queue_of_interactive_calls():
+    scheduler = make_scheduler(starvation_seconds=0.03, preempt_depth=4)
+    order = asyncio.run(grant_order(scheduler, ["background"] + ["interactive"] * 20, hold=0.005))
+    assert order.index("background") < 12
+
+
+def test_interactive_reserve_is_kept_from_background_calls():
+    async def run():
+        scheduler = make_scheduler(capacity=2, reserve=1)
+        async with scheduler.slot("background"):
+            waiting = asyncio.create_task(scheduler._acquire("background"))
+            await asyncio.sleep(0)
+            assert scheduler.waiting("background") == 1
+            async with scheduler.slot("interactive"):
+                assert scheduler.running("interactive") == 1
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+        assert scheduler.in_use == 0
+        assert scheduler.waiting("background") == 0
+
+    asyncio.run(run())
+
+
+def test_speculative_call_is_preempted_for_waiting_interactive_calls():
+    async def run():
+        scheduler = make_scheduler(preempt_depth=1)
+        started = asyncio.Event()
+
+        async def speculative():
+            async with scheduler.slot("speculative"):
+                started.set()
+                await asyncio.sleep(10)
+
+        prefetch = asyncio.create_task(speculative())
+        await started.wait()
+        async with scheduler.slot("interactive"):
+            assert scheduler.running("interactive") == 1
+        with pytest.raises(UpstreamPreempted):
+            await prefetch
+
+    asyncio.run(run())
+
+
+def test_waiting_past_the_request_deadline_raises():
+    async def run():
+        scheduler = make_scheduler()
+        async with scheduler.slot("interactive"):
+            with deadline_scope(0.02), pytest.raises(DeadlineExceeded):
+                async with scheduler.slot("interactive"):
+                    pass
+            assert scheduler.waiting("interactive") == 0
+
+    asyncio.run(run())
+
+
+def test_rate_limited_starts_are_spaced():
+    async def run():
+        scheduler = make_scheduler(capacity=0, per_minute=3000)
+        started = []
+
+        async def call():
+            async with scheduler.slot("interactive"):
+                started.append(time.monotonic())
+
+        await asyncio.gather(*(call() for _ in range(4)))
+        gaps = [later - earlier for earlier, later in zip(started, started[1:])]
+        assert min(gaps) >= 0.015
+
+    asyncio.run(run())
+
+
+def test_interactive_call_overtakes_a_rate_limited_background_backlog():
+    async def run():
+        scheduler = make_scheduler(capacity=4, weights="interactive=8,background=2,speculative=1", per_minute=3000)
+        order = []
+
+        async def call(priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+
+        backlog = [asyncio.create_task(call("background")) for _ in range(30)]
+        await asyncio.sleep(0.05)
+        # The backlog alone takes 0.6 s to start at 50 calls a second
+        with deadline_scope(0.2):
+            await call("interactive")
+        assert order.index("interactive") <= 4
+        assert scheduler.waiting("background") > 20
+        for task in backlog:
+            task.cancel()
+        await asyncio.gather(*backlog, return_exceptions=True)
+        assert scheduler.waiting("background") == 0
+
+    asyncio.run(run())
+
+
+def test_bad_weights_are_ignored():
+    weights = parse_priority_weights("interactive=8,background=-1,unknown=3,speculative=x")
+    assert weights == {"interactive": 8.0, "background": 1.0, "speculative": 1.0}
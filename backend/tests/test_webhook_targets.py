@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.core.webhook_targets import WebhookTargetRejected, check_webhook_url, host_allowed, is_public_address, parse_allowed_hosts
+
+
+def check(url, allowed=""):
+    asyncio.run(check_webhook_url(url, parse_allowed_hosts(allowed)))
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/hook",
+    "http://localhost:8000/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+])
+def test_internal_addresses_are_rejected(url):
+    with pytest.raises(WebhookTargetRejected):
+        check(url)
+
+
+@pytest.mark.parametrize("url", ["ftp://example.com/hook", "file:///etc/passwd", "http:///hook", "not a url"])
+def test_non_http_urls_are_rejected(url):
+    with pytest.raises(WebhookTargetRejected):
+        check(url)
+
+
+def test_public_address_is_accepted():
+    check("https://8.8.8.8/hook")
+
+
+def test_allow_list_admits_internal_hosts_and_rejects_others():
+    check("http://localhost:8000/hook", "localhost")
+    with pytest.raises(WebhookTargetRejected):
+        check("https://8.8.8.8/hook", "localhost")
+
+
+def test_wildcard_allows_subdomains_only():
+    allowed = parse_allowed_hosts(" Hooks.Example.com , *.example.org ")
+    assert host_allowed("hooks.example.com", allowed)
+    assert host_allowed("a.b.example.org", allowed)
+    assert not host_allowed("example.org", allowed)
+    assert not host_allowed("badexample.org", allowed)
+
+
+def test_multicast_and_shared_addresses_are_not_public():
+    assert not is_public_address("224.0.0.1")
+    assert not is_public_address("100.64.0.1")
+    assert is_public_address("2606:4700:4700::1111")
@@ -7,18 +7,35 @@ has been integrated into the backend at:
 - app/services/image_service.py (service layer)
 
 To use this in the backend, call ImageService.generate_gemini_image()
+
+Batch mode pre-renders a JSONL file of prompts (one JSON string, or an
+object with "prompt" and optionally "filename_prefix", per line) with a
+pool of parallel workers, retries and an optional rate limit. Rendered
+prompts are recorded in manifest.jsonl in the output directory (prompt
+hash -> file, bytes, latency) and skipped when the batch is run again.
+
+Usage:
+    python gemini_image_generator.py "A labelled diagram of the water cycle"
+    python gemini_image_generator.py --batch prompts.jsonl --output-dir generated_images --workers 8 --rpm 60
+    GEMINI_API_BASE_URL=http://127.0.0.1:8798 GEMINI_API_KEY=x python gemini_image_generator.py --batch prompts.jsonl
 """
 
+import argparse
 import base64
+import hashlib
 import os
+import random
+import sys
+import threading
+import time
 import uuid
 import logging
 import re
 import json
-from pathlib import Path
-from typing import Optional, Tuple
-import google.generativeai as genai
-from google.generativeai import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+from google import genai
+from google.genai import types
 from PIL import Image
 from io import BytesIO
 
@@ -27,6 +44,15 @@ from io import BytesIO
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+MODEL = "gemini-2.0-flash-exp-image-generation"
+
+_clients: Dict[Tuple[str, Optional[str]], genai.Client] = {}
+_clients_lock = threading.Lock()
+
+
+class ImageGenerationError(Exception):
+    """The Gemini API returned no usable image"""
+
 
 def save_binary_file(file_path: str, data: bytes) -> None:
     """Save binary data to a file.
@@ -136,7 +162,132 @@ def save_response_for_debugging(response, file_path: str) -> None:
         logger.error(f"Error saving debug info: {e}")
 
 
-def generate_image(prompt: str, output_dir: str = "generated_images", filename_prefix: str = None) -> Tuple[bool, str]:
+def get_client(api_key: str, base_url: Optional[str] = None) -> genai.Client:
+    """Shared Gemini client for a key (and base URL), so parallel requests reuse its connections."""
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            http_options = types.HttpOptions(base_url=base_url) if base_url else None
+            client = _clients[(api_key, base_url)] = genai.Client(api_key=api_key, http_options=http_options)
+        return client
+
+
+def _sanitize_prefix(prefix: Optional[str]) -> str:
+    return ''.join(c if c.isalnum() or c == '_' else '_' for c in (prefix or "image")[:10])
+
+
+def _inline_bytes(data) -> bytes:
+    """Inline image data as bytes; some SDK versions return it still base64 encoded."""
+    if isinstance(data, str):
+        data = data.encode("ascii")
+    try:
+        Image.open(BytesIO(data))
+        return data
+    except Exception:
+        try:
+            return base64.b64decode(data, validate=True)
+        except ValueError:
+            return data
+
+
+def request_image(prompt: str, debug_prefix: Optional[str] = None) -> bytes:
+    """Request one image from the Gemini API.
+    
+    Args:
+        prompt: The text prompt describing the image to generate
+        debug_prefix: Path prefix for debug dumps (response summary, text reply and
+            raw image data); None to write none
+        
+    Returns:
+        The image data as returned by the API
+        
+    Raises:
+        ImageGenerationError: If GEMINI_API_KEY is not set or the response holds no image
+    """
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise ImageGenerationError("GEMINI_API_KEY environment variable not set")
+    # GEMINI_API_BASE_URL points the script at another endpoint, e.g. a local fake server
+    client = get_client(api_key, os.environ.get("GEMINI_API_BASE_URL") or None)
+    
+    logger.info(f"Generating image with prompt: {prompt[:50]}...")
+    response = client.models.generate_content(
+        model=MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(response_modalities=['Text', 'Image'])
+    )
+    
+    if debug_prefix:
+        save_response_for_debugging(response, f"{debug_prefix}_debug.json")
+    
+    # Check for valid response
+    if not response.candidates or response.candidates[0].content is None:
+        raise ImageGenerationError("No candidates found in response")
+        
+    # Extract image data (from various possible response formats)
+    image_data = None
+    response_text = None
+    
+    # Process each part of the response
+    for part in response.candidates[0].content.parts or []:
+        # Check for text that might contain a base64 encoded image
+        if part.text is not None:
+            response_text = part.text
+            logger.info(f"Found text response of length {len(response_text)}")
+            
+            # Try to extract base64 image from text
+            extracted_image = extract_base64_image(response_text)
+            if extracted_image:
+                logger.info("Successfully extracted image from text")
+                image_data = extracted_image
+                break
+        
+        # Check for inline image data
+        if part.inline_data is not None and part.inline_data.data:
+            logger.info(f"Found inline data with mime type: {part.inline_data.mime_type}")
+            image_data = _inline_bytes(part.inline_data.data)
+            logger.info(f"Extracted binary data of length {len(image_data)}")
+            break
+                
+    # If no image data was found but we have text, save text for inspection
+    if image_data is None and response_text and debug_prefix:
+        text_path = f"{debug_prefix}_text.txt"
+        with open(text_path, "w") as f:
+            f.write(response_text)
+        logger.info(f"No image data found, saved text response to {text_path}")
+    
+    # If no image data found, return error
+    if image_data is None:
+        raise ImageGenerationError("No image data found in the response")
+        
+    if debug_prefix:
+        # The raw binary data, for inspection
+        save_binary_file(f"{debug_prefix}_raw.bin", image_data)
+    return image_data
+
+
+def save_png(image_data: bytes, file_path: str) -> None:
+    """Convert image data to PNG with PIL and save it.
+    
+    The file is written under a temporary name and renamed, so it is never
+    seen half-written.
+    
+    Raises:
+        Exception: If PIL cannot read the image data
+    """
+    img = Image.open(BytesIO(image_data))
+    logger.info(f"Successfully opened image: format={img.format}, size={img.size}, mode={img.mode}")
+    
+    # Convert to RGB or RGBA and save as PNG
+    img = img.convert("RGBA" if img.mode == "RGBA" else "RGB")
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.{uuid.uuid4().hex[:8]}.tmp"
+    img.save(tmp_path, "PNG")
+    os.replace(tmp_path, file_path)
+
+
+def generate_image(prompt: str, output_dir: str = "generated_images", filename_prefix: str = None,
+                   debug: bool = False) -> Tuple[bool, str]:
     """Generate an image using Google's Gemini API based on the provided prompt.
     
     This function is designed to be called multiple times in parallel from the frontend.
@@ -146,118 +297,28 @@ def generate_image(prompt: str, output_dir: str = "generated_images", filename_p
         prompt: The text prompt describing the image to generate
         output_dir: Directory where images will be saved
         filename_prefix: Optional prefix for the generated filename
+        debug: Also save the response summary and raw data next to the image
         
     Returns:
         Tuple containing (success_status, file_path_or_error_message)
     """
     try:
-        # Get API key from environment variables
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            error_msg = "GEMINI_API_KEY environment variable not set"
-            logger.error(error_msg)
-            return False, error_msg
-        
-        # Initialize Gemini API
-        logger.info("Initializing Gemini API...")
-        genai.configure(api_key=api_key)
-        
-        # Define the model to use
-        model = "gemini-2.0-flash-exp-image-generation"
-        model_client = genai.GenerativeModel(model_name=model)
-        
         # Generate a unique filename for output files
         unique_id = str(uuid.uuid4())[:8]
-        prefix = filename_prefix if filename_prefix else "image"
-        sanitized_prefix = ''.join(c if c.isalnum() or c == '_' else '_' for c in prefix[:10])
+        sanitized_prefix = _sanitize_prefix(filename_prefix)
         filename = f"{sanitized_prefix}_{unique_id}.png"
-        debug_filename = f"{sanitized_prefix}_{unique_id}_debug.json"
         
         # Create the output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         file_path = os.path.join(output_dir, filename)
-        debug_path = os.path.join(output_dir, debug_filename)
-        
-        # Generate the image
-        logger.info(f"Generating image with prompt: {prompt[:50]}...")
-        response = model_client.generate_content(
-            contents=prompt,
-            generation_config={
-                "response_mime_type": "image/png"
-            }
-        )
-        
-        # Save response for debugging
-        save_response_for_debugging(response, debug_path)
+        debug_prefix = os.path.join(output_dir, f"{sanitized_prefix}_{unique_id}") if debug else None
         
-        # Check for valid response
-        if not hasattr(response, 'candidates') or len(response.candidates) == 0:
-            error_msg = "No candidates found in response"
-            logger.error(error_msg)
-            return False, error_msg
-            
-        # Extract image data (from various possible response formats)
-        image_data = None
-        response_text = None
-        
-        # Process each part of the response
-        for part in response.candidates[0].content.parts:
-            # Check for text that might contain a base64 encoded image
-            if hasattr(part, 'text') and part.text is not None:
-                response_text = part.text
-                logger.info(f"Found text response of length {len(response_text)}")
-                
-                # Try to extract base64 image from text
-                extracted_image = extract_base64_image(response_text)
-                if extracted_image:
-                    logger.info("Successfully extracted image from text")
-                    image_data = extracted_image
-                    break
-            
-            # Check for inline image data
-            if hasattr(part, 'inline_data') and part.inline_data is not None:
-                mime_type = getattr(part.inline_data, 'mime_type', 'image/png')
-                logger.info(f"Found inline data with mime type: {mime_type}")
-                
-                if hasattr(part.inline_data, 'data'):
-                    image_data = part.inline_data.data
-                    logger.info(f"Extracted binary data of length {len(image_data)}")
-                    break
-                    
-        # If no image data was found but we have text, save text for inspection
-        if image_data is None and response_text:
-            text_path = os.path.join(output_dir, f"{sanitized_prefix}_{unique_id}_text.txt")
-            with open(text_path, "w") as f:
-                f.write(response_text)
-            logger.info(f"No image data found, saved text response to {text_path}")
-            
-            # As a last resort, try to extract base64 again with the entire text
-            extracted_image = extract_base64_image(response_text)
-            if extracted_image:
-                logger.info("Successfully extracted image from full text")
-                image_data = extracted_image
-        
-        # If no image data found, return error
-        if image_data is None:
-            error_msg = "No image data found in the response"
-            logger.error(error_msg)
-            return False, error_msg
-            
-        # Save the raw binary data first for inspection
-        raw_path = os.path.join(output_dir, f"{sanitized_prefix}_{unique_id}_raw.bin")
-        with open(raw_path, "wb") as f:
-            f.write(image_data)
-        logger.info(f"Saved raw binary data to {raw_path}")
+        image_data = request_image(prompt, debug_prefix)
         
         # Try to convert to a proper PNG image using PIL
         try:
             logger.info("Attempting to open image with PIL...")
-            img = Image.open(BytesIO(image_data))
-            logger.info(f"Successfully opened image: format={img.format}, size={img.size}, mode={img.mode}")
-            
-            # Convert to RGB or RGBA and save as PNG
-            img = img.convert("RGBA" if img.mode == "RGBA" else "RGB")
-            img.save(file_path, "PNG")
+            save_png(image_data, file_path)
             logger.info(f"Successfully saved processed image to {file_path}")
             return True, file_path
             
@@ -286,6 +347,9 @@ def generate_image(prompt: str, output_dir: str = "generated_images", filename_p
                 logger.error(f"Error creating fallback image: {fallback_error}")
                 return False, f"Failed to process image: {pil_error}"
             
+    except ImageGenerationError as e:
+        logger.error(str(e))
+        return False, str(e)
     except Exception as e:
         error_msg = f"Error generating image: {str(e)}"
         logger.error(error_msg)
@@ -325,14 +389,260 @@ def generate_image_for_backend(prompt: str, output_dir: str = "static/generated_
         }
 
 
-if __name__ == "__main__":
+class RateLimiter:
+    """Spaces calls evenly, at most per_minute a minute across all threads (0: no limit)."""
+    
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        
+    def wait(self) -> None:
+        """Block until the calling thread's turn"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            turn = max(now, self._next)
+            self._next = turn + self.interval
+        time.sleep(turn - now)
+
+
+def prompt_hash(prompt: str) -> str:
+    """Key of a prompt in the manifest; prompts differing only in whitespace share it."""
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{MODEL}\n{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def load_prompts(path: str) -> List[Dict[str, Any]]:
+    """Read a JSONL file of prompts.
+    
+    Args:
+        path: File with one JSON string, or object with "prompt" (and optionally
+            "filename_prefix"), per line
+            
+    Returns:
+        List of dictionaries with "prompt" and "filename_prefix"
+        
+    Raises:
+        ValueError: If a line is not valid JSON or has no prompt
+    """
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {e}") from e
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not isinstance(item, dict) or not str(item.get("prompt") or "").strip():
+                raise ValueError(f"{path}:{number}: no prompt")
+            prompts.append({"prompt": item["prompt"], "filename_prefix": item.get("filename_prefix")})
+    return prompts
+
+
+class Manifest:
+    """Append-only record of the rendered prompts of an output directory (manifest.jsonl).
+    
+    Each line maps a prompt hash to its file, size in bytes and generation
+    latency. Lines are flushed to disk as they are added, so a batch that is
+    interrupted resumes where it stopped.
+    """
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, "manifest.jsonl")
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                # Drop a last line cut short by a crash, so appending starts on a new line
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data):
+                    logger.warning(f"Dropping an incomplete last line from {self.path}")
+                    f.truncate(complete)
+            for line in data[:complete].splitlines():
+                entry = json.loads(line)
+                self.entries[entry["hash"]] = entry
+        self._file = open(self.path, "a", encoding="utf-8")
+        
+    def done(self, key: str) -> bool:
+        """Whether the prompt with this hash was rendered and its file is still there"""
+        entry = self.entries.get(key)
+        return entry is not None and os.path.exists(os.path.join(self.output_dir, entry["file"]))
+    
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[entry["hash"]] = entry
+            
+    def close(self) -> None:
+        self._file.close()
+
+
+def _render(key: str, item: Dict[str, Any], output_dir: str, limiter: RateLimiter, retries: int,
+            debug_sample_rate: float) -> Dict[str, Any]:
+    """Render one batch prompt, retrying failures with exponential backoff; returns its manifest entry"""
+    file_name = f"{_sanitize_prefix(item['filename_prefix'])}_{key[:16]}.png"
+    debug_prefix = None
+    if debug_sample_rate > 0 and random.random() < debug_sample_rate:
+        os.makedirs(os.path.join(output_dir, "debug"), exist_ok=True)
+        debug_prefix = os.path.join(output_dir, "debug", file_name[:-len(".png")])
+        
+    for attempt in range(1, retries + 2):
+        limiter.wait()
+        started = time.perf_counter()
+        try:
+            image_data = request_image(item["prompt"], debug_prefix)
+            latency = time.perf_counter() - started
+            save_png(image_data, os.path.join(output_dir, file_name))
+        except Exception as e:
+            if attempt > retries:
+                raise
+            delay = min(30.0, 2.0 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"Prompt {key[:16]} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            continue
+        return {
+            "hash": key,
+            "prompt": item["prompt"],
+            "file": file_name,
+            "bytes": os.path.getsize(os.path.join(output_dir, file_name)),
+            "latency": round(latency, 3),
+            "attempts": attempt
+        }
+
+
+def generate_batch(prompts_path: str, output_dir: str = "generated_images", workers: int = 4, rpm: float = 0,
+                   retries: int = 3, debug_sample_rate: float = 0.0) -> Dict[str, Any]:
+    """Pre-render a JSONL file of prompts with parallel workers.
+    
+    Prompts already in the output directory's manifest are skipped, so an
+    interrupted batch can simply be run again.
+    
+    Args:
+        prompts_path: JSONL file of prompts (see load_prompts)
+        output_dir: Directory for the images and manifest.jsonl
+        workers: Images generated at once
+        rpm: Requests per minute at most, including retries (0: no limit)
+        retries: Retries of a failed prompt
+        debug_sample_rate: Fraction of prompts whose responses are dumped to output_dir/debug
+        
+    Returns:
+        Summary with the numbers of prompts, skipped, generated and failed ones,
+        the elapsed seconds, images per minute, latency percentiles and bytes written
+        
+    Raises:
+        ImageGenerationError: If GEMINI_API_KEY is not set
+        ValueError: If the prompts file is invalid
+    """
+    if not os.environ.get("GEMINI_API_KEY"):
+        raise ImageGenerationError("GEMINI_API_KEY environment variable not set")
+    prompts = load_prompts(prompts_path)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(output_dir)
+    
+    pending: Dict[str, Dict[str, Any]] = {}
+    for item in prompts:
+        key = prompt_hash(item["prompt"])
+        if key not in pending and not manifest.done(key):
+            pending[key] = item
+    print(f"{len(prompts)} prompts: {len(prompts) - len(pending)} already rendered (or repeated), {len(pending)} to render")
+    
+    limiter = RateLimiter(rpm)
+    generated: List[Dict[str, Any]] = []
+    failed = 0
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = {
+            executor.submit(_render, key, item, output_dir, limiter, retries, debug_sample_rate): key
+            for key, item in pending.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED  {key[:16]}  {pending[key]['prompt'][:60]!r}: {e}")
+                continue
+            manifest.add(entry)
+            generated.append(entry)
+            print(f"[{len(generated) + failed}/{len(pending)}] {entry['file']}  {entry['bytes']} bytes  {entry['latency']:.2f}s")
+    finally:
+        # On Ctrl-C, drop the prompts not yet started; those in flight finish but are only recorded by the next run
+        executor.shutdown(wait=True, cancel_futures=True)
+        manifest.close()
+        
+    elapsed = time.perf_counter() - started
+    latencies = sorted(entry["latency"] for entry in generated)
+    
+    def percentile(p: float) -> Optional[float]:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+    
+    return {
+        "prompts": len(prompts),
+        "skipped": len(prompts) - len(pending),
+        "generated": len(generated),
+        "failed": failed,
+        "seconds": round(elapsed, 1),
+        "images_per_minute": round(len(generated) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "bytes": sum(entry["bytes"] for entry in generated)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate images with Google Gemini, one prompt or a batch")
+    parser.add_argument("prompt", nargs="?", help="Prompt of a single image (default: an example prompt)")
+    parser.add_argument("--batch", metavar="PROMPTS_JSONL", help="Pre-render the prompts of a JSONL file instead")
+    parser.add_argument("--output-dir", default="generated_images", help="Directory for the images")
+    parser.add_argument("--filename-prefix", help="Prefix of the image file name (single image)")
+    parser.add_argument("--debug", action="store_true", help="Save the response summary and raw data (single image)")
+    parser.add_argument("--workers", type=int, default=4, help="Images generated at once (batch)")
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute at most, 0 for no limit (batch)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed prompt (batch)")
+    parser.add_argument("--debug-sample-rate", type=float, default=0.0,
+                        help="Fraction of prompts whose responses are dumped to <output-dir>/debug (batch)")
+    parser.add_argument("--log-level", help="Log level (default: INFO, WARNING in batch mode)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level or ("WARNING" if args.batch else "INFO"))
+    
+    if args.batch:
+        try:
+            summary = generate_batch(args.batch, args.output_dir, args.workers, args.rpm, args.retries, args.debug_sample_rate)
+        except (OSError, ValueError, ImageGenerationError) as e:
+            print(f"Batch failed: {e}", file=sys.stderr)
+            sys.exit(2)
+        p50 = f"{summary['latency_p50']:.2f}s" if summary["latency_p50"] is not None else "-"
+        p95 = f"{summary['latency_p95']:.2f}s" if summary["latency_p95"] is not None else "-"
+        print(f"\nGenerated {summary['generated']}, failed {summary['failed']}, skipped {summary['skipped']} "
+              f"in {summary['seconds']}s ({summary['images_per_minute']} images/min, latency p50 {p50}, p95 {p95}, "
+              f"{summary['bytes']} bytes)")
+        sys.exit(1 if summary["failed"] else 0)
+        
     # Example usage when script is run directly (for testing only)
     example_prompt = """Generate an image of a futuristic, sustainable city on Mars, 
     incorporating elements of both Martian geography and eco-friendly architecture from Earth, 
     with a style reminiscent of Syd Mead's concept art."""
     
-    success, result = generate_image(example_prompt, filename_prefix="mars_city")
+    success, result = generate_image(args.prompt or example_prompt, args.output_dir,
+                                     filename_prefix=args.filename_prefix or (None if args.prompt else "mars_city"),
+                                     debug=args.debug)
     if success:
         print(f"Image generated successfully: {result}")
     else:
         print(f"Image generation failed: {result}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()